@@ -1,6 +1,18 @@
 from ._client import SpanClient, handles, register_mimetype
-from ._handle_responses import handle_response_aio, iter_paged_aio, StatusMismatchError
-from ._response_data import ResponseData
+from ._handle_responses import (
+    handle_response_aio,
+    handle_response_stream_aio,
+    iter_paged_aio,
+    StatusMismatchError,
+)
+from ._response_data import ResponseData, RawBody
+from ._cache import ResponseCache, CacheEntry
+from ._disk_cache import DiskCache, StoredResponse
+from ._codecs import DecodeStats
+from ._memo import EndpointMemo
+from ._compiled_schema import compile_schema
+from ._updaters import default_updater, update_collection
+from ._streaming import encode_stream
 from ._request_obj import ClientRequest, PagingReqClient
 from spantools import MimeType, MimeTypeTolerant, errors_api
 from .test_utils import ContentDecodeError, ContentEncodeError, ContentTypeUnknownError
@@ -8,6 +20,7 @@ from ._version import __version__
 
 (
     handle_response_aio,
+    handle_response_stream_aio,
     MimeType,
     MimeTypeTolerant,  # type: ignore
     ContentTypeUnknownError,
@@ -18,9 +31,20 @@ from ._version import __version__
     SpanClient,
     handles,
     ResponseData,
+    RawBody,
     ClientRequest,
     register_mimetype,
     errors_api,
     PagingReqClient,
+    encode_stream,
+    ResponseCache,
+    CacheEntry,
+    DiskCache,
+    StoredResponse,
+    DecodeStats,
+    EndpointMemo,
+    compile_schema,
+    default_updater,
+    update_collection,
     __version__,
 )
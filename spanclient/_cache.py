@@ -0,0 +1,230 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from aiohttp import ClientResponse
+from typing import Callable, Dict, Hashable, Optional
+
+from ._response_data import ResponseData
+
+
+def _cache_control(response: ClientResponse) -> Dict[str, Optional[str]]:
+    """Parses the ``'Cache-Control'`` header into a directive -> value mapping."""
+    directives: Dict[str, Optional[str]] = dict()
+
+    for directive in response.headers.get("Cache-Control", "").split(","):
+        name, _, value = directive.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"') or None
+
+    return directives
+
+
+def _max_age(directives: Dict[str, Optional[str]]) -> Optional[int]:
+    """Seconds a response may be used without revalidating it, if it says."""
+    try:
+        return int(directives.get("max-age") or "")
+    except ValueError:
+        return None
+
+
+def _expires(directives: Dict[str, Optional[str]], ttl: float = 0) -> Optional[float]:
+    """
+    Monotonic time until which a response may be used without revalidating it.
+    ``ttl`` is used for responses without a max-age, if set.
+    """
+    if "no-cache" in directives:
+        return None
+
+    max_age: Optional[float] = _max_age(directives)
+    if max_age is None and ttl:
+        max_age = ttl
+    if max_age is None:
+        return None
+
+    return time.monotonic() + max_age
+
+
+@dataclass
+class CacheEntry:
+    """Cached response body and the metadata needed to revalidate it."""
+
+    data: ResponseData
+    """Handled response the body was loaded from."""
+    size: int
+    """Size of the response body in bytes."""
+    etag: Optional[str]
+    """``'ETag'`` header of the response."""
+    last_modified: Optional[str]
+    """``'Last-Modified'`` header of the response."""
+    expires: Optional[float]
+    """Monotonic time until which the entry is fresh, if the response had a max-age."""
+
+    @classmethod
+    def from_response(
+        cls, response: ClientResponse, data: ResponseData, size: int, ttl: float = 0
+    ) -> Optional["CacheEntry"]:
+        """
+        Builds an entry for ``response``. Returns ``None`` if the response may not be
+        stored or could never be reused.
+
+        :param ttl: Seconds the response is fresh for if it does not set its own
+            max-age.
+        """
+        directives = _cache_control(response)
+        if "no-store" in directives:
+            return None
+
+        entry = cls(
+            data=data,
+            size=size,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+            expires=_expires(directives, ttl),
+        )
+
+        if entry.etag is None and entry.last_modified is None and entry.expires is None:
+            return None
+
+        return entry
+
+    def is_fresh(self) -> bool:
+        """Whether the entry can be used without asking the server."""
+        return self.expires is not None and time.monotonic() < self.expires
+
+    def refresh(self, response: ClientResponse, ttl: float = 0) -> None:
+        """
+        Updates the entry's freshness from a ``304 Not Modified`` response.
+
+        :param ttl: Seconds the response is fresh for if it does not set its own
+            max-age.
+        """
+        self.expires = _expires(_cache_control(response), ttl)
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """Headers that ask the server to only send the body if it has changed."""
+        headers = dict()
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """
+    In-memory cache of loaded GET response bodies for :class:`SpanClient`. Pass one to
+    the client with the ``cache`` parameter.
+
+    Responses with an ``'ETag'`` or ``'Last-Modified'`` header are revalidated with a
+    conditional request. If the server answers ``304 Not Modified``, the cached loaded
+    object is returned without reading or decoding a body. If it answers with an error,
+    the entry is removed. Responses with a ``'Cache-Control: max-age'`` are returned
+    without a request until they expire.
+
+    Every caller gets the same cached loaded object, not a copy, so treat it as
+    read-only.
+
+    The least recently used entries are evicted once either limit is passed.
+
+    Responses missing from memory are looked up in ``disk``, if given, and every
+    response cached in memory is also stored there.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int = 64 * 2 ** 20,
+        disk: "Optional[DiskCache]" = None,
+    ) -> None:
+        """
+        :param max_entries: Maximum number of responses to hold.
+        :param max_bytes: Maximum combined size of the cached response bodies.
+        :param disk: Persistent tier to fall back on. Not cleared or closed by this
+            cache.
+        """
+        self.max_entries: int = max_entries
+        self.max_bytes: int = max_bytes
+        self.disk: "Optional[DiskCache]" = disk
+        """Persistent tier, if any."""
+        self.nbytes: int = 0
+        """Combined size of the cached response bodies."""
+        self._entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._fetching: Dict[object, Hashable] = dict()
+        """Keys of the fetches whose responses may still be stored, by token."""
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[CacheEntry]:
+        """Returns the entry for ``key``, marking it as recently used."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def store(self, key: Hashable, entry: CacheEntry) -> None:
+        """Stores ``entry``, evicting the least recently used entries to make room."""
+        self.discard(key)
+        if entry.size > self.max_bytes:
+            return
+
+        self._entries[key] = entry
+        self.nbytes += entry.size
+
+        while len(self._entries) > self.max_entries or self.nbytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.nbytes -= evicted.size
+
+    def discard(self, key: Hashable) -> None:
+        """Removes the entry for ``key`` if there is one."""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry.size
+
+    def discard_matching(self, predicate: Callable[[Hashable], bool]) -> int:
+        """
+        Removes the entries whose key ``predicate`` returns ``True`` for. Fetches for
+        those keys that are in-flight are no longer current.
+
+        :return: Number of entries removed.
+        """
+        for token in [t for t, key in self._fetching.items() if predicate(key)]:
+            del self._fetching[token]
+
+        keys = [key for key in self._entries if predicate(key)]
+        for key in keys:
+            self.discard(key)
+        return len(keys)
+
+    def clear(self) -> None:
+        """Removes all entries held in memory. No fetch in-flight is current."""
+        self._fetching.clear()
+        self._entries.clear()
+        self.nbytes = 0
+
+    def track(self, key: Hashable) -> object:
+        """
+        Registers a fetch for ``key`` that is about to start, and returns its token.
+        The fetch may store its response while :func:`ResponseCache.current` is
+        ``True`` for the token: once its key has been discarded as stale, the response
+        may predate the change that made it so.
+
+        Pass the token to :func:`ResponseCache.untrack` once the fetch is done.
+        """
+        token = object()
+        self._fetching[token] = key
+        return token
+
+    def current(self, token: object) -> bool:
+        """Whether the fetch of ``token`` has not been discarded since it started."""
+        return token in self._fetching
+
+    def untrack(self, token: object) -> None:
+        """Forgets the fetch of ``token``."""
+        if token in self._fetching:
+            del self._fetching[token]
+
+
+typing_help = False
+if typing_help:
+    from ._disk_cache import DiskCache
@@ -1,36 +1,72 @@
+import asyncio
 import copy
-from typing import Optional, List, Dict, Type
+from collections import deque
+from concurrent.futures import Executor
+from typing import (
+    Optional,
+    List,
+    Dict,
+    Type,
+    Any,
+    AsyncGenerator,
+    AsyncIterable,
+    Awaitable,
+    Callable,
+    Deque,
+    Hashable,
+    Iterable,
+    Mapping,
+    Tuple,
+    Union,
+)
 from types import TracebackType
-from aiohttp import ClientSession
+from aiohttp import ClientSession, ClientError, TCPConnector
 
 from spantools import (
     EncoderType,
     DecoderType,
-    EncoderIndexType,
-    DecoderIndexType,
     DEFAULT_ENCODERS,
     DEFAULT_DECODERS,
     MimeTypeTolerant,
-    MimeType,
+    SpanError,
 )
 from spantools.errors_api import APIError, ERRORS_INDEXED
 
 from ._endpoint_wrapper import EndpointWrapper
 from ._request_obj import ClientRequest
+from ._handle_responses import DECODE_OFFLOAD_BYTES as _DECODE_OFFLOAD_BYTES
+from ._cache import ResponseCache
+from ._memo import EndpointMemo
+from ._codecs import CodecRegistry
+from ._templates import RequestTemplate
+from ._connectors import borrow_connector, return_connector
+from ._streaming import iter_items_aio
 
 handles = EndpointWrapper()
 
+_KwargsIterType = Union[Iterable[Mapping[str, Any]], AsyncIterable[Mapping[str, Any]]]
+
 
 def register_mimetype(
-    mimetype: MimeTypeTolerant, encoder: EncoderType, decoder: DecoderType
+    mimetype: MimeTypeTolerant,
+    encoder: EncoderType,
+    decoder: DecoderType,
+    client: Optional[Union[Type["SpanClient"], "SpanClient"]] = None,
 ) -> None:
-    try:
-        mimetype = MimeType.from_name(mimetype)
-    except ValueError:
-        pass
+    """
+    Registers an encoder and decoder for a mimetype.
 
-    SpanClient._ENCODERS[mimetype] = encoder
-    SpanClient._DECODERS[mimetype] = decoder
+    :param mimetype: Mimetype to register.
+    :param encoder: Encodes media into ``bytes``.
+    :param decoder: Decodes ``bytes`` content.
+    :param client: Client class or instance to register the codec for. Subclasses of a
+        client class share its codecs unless they register their own. Registered for
+        every client if not passed.
+    """
+    if client is None:
+        client = SpanClient
+
+    client.codecs.register(mimetype, encoder, decoder)
 
 
 class SpanClient:
@@ -50,8 +86,59 @@ class SpanClient:
     API_ERRORS_ADDITIONAL: Optional[List[Type[APIError]]] = None
     """List of additional :class:`errors_api.APIError` exceptions for error-catching."""
 
-    _ENCODERS: EncoderIndexType = copy.copy(DEFAULT_ENCODERS)
-    _DECODERS: DecoderIndexType = copy.copy(DEFAULT_DECODERS)
+    CONNECTION_LIMIT: int = 100
+    """Maximum number of simultaneous connections. ``0`` for no limit."""
+    CONNECTION_LIMIT_PER_HOST: int = 0
+    """Maximum number of simultaneous connections to one host. ``0`` for no limit."""
+    KEEPALIVE_TIMEOUT: float = 15
+    """Seconds to keep an idle connection open for reuse."""
+    DNS_CACHE_TTL: Optional[int] = 10
+    """
+    Seconds to cache DNS lookups for. ``None`` caches them forever, ``0`` disables the
+    cache.
+    """
+    CONNECTOR_KWARGS: Optional[Dict[str, Any]] = None
+    """
+    Additional keyword arguments for the ``aiohttp.TCPConnector`` of sessions created
+    by the client, like ``ssl``, ``local_addr`` or ``resolver``.
+    """
+    WARM_CONNECTIONS: int = 0
+    """Number of connections :func:`SpanClient.start` opens before the first request."""
+    WARM_PATH: str = "/"
+    """Path of the HEAD requests used to open warm connections."""
+    SHARE_CONNECTOR: bool = False
+    """
+    Whether the sessions of this client share their connection pool, DNS cache and TLS
+    contexts with other clients that have the same connector settings on the same event
+    loop. Each client still gets its own session.
+    """
+    DECODE_OFFLOAD_BYTES: int = _DECODE_OFFLOAD_BYTES
+    """
+    Response bodies of at least this many bytes are decoded and loaded in the client's
+    ``decode_executor``, if it has one.
+    """
+
+    codecs: CodecRegistry = CodecRegistry(
+        encoders=DEFAULT_ENCODERS, decoders=DEFAULT_DECODERS
+    )
+    """
+    Encoders and decoders of the client. Each client class and instance has its own
+    registry, which falls back on the registry of its class.
+    """
+
+    _memos: Tuple[EndpointMemo, ...] = ()
+    """Memoized results of the endpoints of the client class and its bases."""
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)  # type: ignore
+        cls.codecs = CodecRegistry(parent=cls.codecs)
+
+        memos = list(cls._memos)
+        for value in vars(cls).values():
+            memo = getattr(value, "memo", None)
+            if isinstance(memo, EndpointMemo) and memo not in memos:
+                memos.append(memo)
+        cls._memos = tuple(memos)
 
     def __init__(
         self,
@@ -59,12 +146,20 @@ class SpanClient:
         port: Optional[int] = None,
         protocol: Optional[str] = None,
         session: Optional[ClientSession] = None,
+        cache: Optional[ResponseCache] = None,
+        decode_executor: Optional[Executor] = None,
     ):
         """
         :param host_name: Hostname of API to use if not default.
         :param protocol: Protocol to use if not default.
         :param session: Existing aio_http session to us. New session created if none
             passed.
+        :param cache: Cache to store GET responses in and revalidate them from. No
+            responses are cached if none passed.
+        :param decode_executor: Thread or process pool to decode and load response
+            bodies of at least ``DECODE_OFFLOAD_BYTES`` in, instead of blocking the
+            event loop. Not shut down by the client. For a process pool, response
+            schemas and registered decoders must be picklable.
         """
         if host_name is None:
             if self.DEFAULT_HOST_NAME is None:
@@ -96,6 +191,22 @@ class SpanClient:
         self.host_name: str = host_name
         self._session: Optional[ClientSession] = session
         self.api_error_index: Dict[int, Type[APIError]] = api_error_index
+        self._inflight: Dict[Hashable, asyncio.Future] = dict()
+        """Coalesced requests that are in-flight, by request key."""
+        self.cache: Optional[ResponseCache] = cache
+        """Response cache, if any."""
+        self.decode_executor: Optional[Executor] = decode_executor
+        """Executor to decode large response bodies in, if any."""
+        self.codecs = CodecRegistry(parent=type(self).codecs)
+        self._connector_key: Optional[Hashable] = None
+        """Registry key of the shared connector this client is borrowing, if any."""
+        self._templates: Dict[Hashable, RequestTemplate] = dict()
+        """Compiled request templates, by endpoint template key."""
+        self._memo_scope: object = object()
+        """
+        Ends the memo keys of this client's requests. Memoized results were fetched
+        with this client's session, and its credentials, so no other client gets them.
+        """
 
     async def __aenter__(self) -> "SpanClient":
         await self.start()
@@ -116,16 +227,158 @@ class SpanClient:
         """
         _ = self.session
 
+        if self.WARM_CONNECTIONS > 0:
+            await self.warm_connections(self.WARM_CONNECTIONS)
+
+    async def warm_connections(self, count: int) -> None:
+        """
+        Opens ``count`` connections to the API host and leaves them in the session's
+        pool, so that the first requests do not each pay for TCP / TLS setup.
+
+        A ``HEAD`` request is sent to :attr:`SpanClient.WARM_PATH` on each connection.
+        Failed requests are ignored: warming up is best-effort.
+        """
+        url = f"{self.protocol}://{self.host_name}{self.WARM_PATH}"
+
+        async def warm() -> None:
+            try:
+                response = await self.session.head(url, params={}, headers={})
+            except (ClientError, OSError, asyncio.TimeoutError):
+                return
+            response.release()
+
+        # The requests must be in-flight together to each get their own connection.
+        await asyncio.gather(*(warm() for _ in range(count)))
+
     async def close(self) -> None:
         """
         Closes the session. Invoked by async with on context close. Broken out to be
         overridable.
         """
-        await self.session.close()
+        session = self.session
+        connector = session.connector
+        await session.close()
+
+        # Memoized results of a closed client are never used again.
+        def owned(key: Hashable) -> bool:
+            return key[-1] is self._memo_scope  # type: ignore
+
+        for memo in self._memos:
+            memo.discard_matching(owned)
+
+        # Shared connectors are only closed once every client has returned them.
+        if self._connector_key is not None and connector is not None:
+            await return_connector(self._connector_key, connector)
+            self._connector_key = None
 
     @property
     def session(self) -> ClientSession:
         """Session object."""
         if self._session is None:
-            self._session = ClientSession()
+            if self.SHARE_CONNECTOR:
+                self._connector_key, connector = borrow_connector(
+                    self.create_connector, self.connector_options()
+                )
+                self._session = ClientSession(
+                    connector=connector, connector_owner=False
+                )
+            else:
+                self._session = ClientSession(connector=self.create_connector())
         return self._session
+
+    def connector_options(self) -> Dict[str, Any]:
+        """Keyword arguments for the connector, from the connection class attributes."""
+        options: Dict[str, Any] = dict(
+            limit=self.CONNECTION_LIMIT,
+            limit_per_host=self.CONNECTION_LIMIT_PER_HOST,
+            keepalive_timeout=self.KEEPALIVE_TIMEOUT,
+            use_dns_cache=self.DNS_CACHE_TTL != 0,
+            ttl_dns_cache=self.DNS_CACHE_TTL,
+        )
+        if self.CONNECTOR_KWARGS is not None:
+            options.update(self.CONNECTOR_KWARGS)
+
+        return options
+
+    def create_connector(self) -> TCPConnector:
+        """
+        Creates the connector for a new session from :func:`connector_options`. Broken
+        out to be overridable.
+        """
+        return TCPConnector(**self.connector_options())
+
+    async def map(
+        self,
+        method: Callable[..., Awaitable[Any]],
+        kwargs_iter: _KwargsIterType,
+        concurrency: int = 10,
+        ordered: bool = False,
+    ) -> AsyncGenerator[Any, None]:
+        """
+        Calls an endpoint method once for each set of keyword arguments, with up to
+        ``concurrency`` calls in-flight at once.
+
+        :param method: Endpoint method of this client, like ``client.get_wizard``.
+        :param kwargs_iter: Iterable or async iterable of keyword arguments to call
+            ``method`` with. The next arguments are only pulled once a call finishes
+            and frees up a slot.
+        :param concurrency: Maximum number of calls in-flight at once.
+        :param ordered: Whether to yield results in the order of ``kwargs_iter``. If
+            ``False``, results are yielded as soon as their call finishes.
+        :return: Async generator of call results. If a call raises an exception, the
+            exception is yielded in place of its result.
+
+        Calls still in-flight when the generator is closed are cancelled.
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+
+        # Spawn the session up front so that the first calls do not race to do it.
+        _ = self.session
+
+        kwargs_aiter = iter_items_aio(kwargs_iter)
+        pending: Deque[asyncio.Future] = deque()
+
+        try:
+            while await _map_fill(method, kwargs_aiter, pending, concurrency):
+                if not ordered:
+                    await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    # Rotate the first finished call to the front.
+                    while not pending[0].done():
+                        pending.rotate(-1)
+
+                yield await _map_result(pending.popleft())
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            await kwargs_aiter.aclose()
+
+
+async def _map_fill(
+    method: Callable[..., Awaitable[Any]],
+    kwargs_aiter: AsyncGenerator[Mapping[str, Any], None],
+    pending: Deque[asyncio.Future],
+    concurrency: int,
+) -> bool:
+    """
+    Starts calls from ``kwargs_aiter`` until ``concurrency`` are pending. Returns
+    whether any calls are pending.
+    """
+    while len(pending) < concurrency:
+        try:
+            kwargs = await kwargs_aiter.__anext__()
+        except StopAsyncIteration:
+            break
+        pending.append(asyncio.ensure_future(method(**kwargs)))
+
+    return bool(pending)
+
+
+async def _map_result(task: asyncio.Future) -> Any:
+    try:
+        return await task
+    except asyncio.CancelledError:
+        raise
+    except (Exception, SpanError) as error:
+        return error
@@ -0,0 +1,195 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from spantools import (
+    ContentDecodeError,
+    MimeType,
+    MimeTypeTolerant,
+    EncoderType,
+    DecoderType,
+    EncoderIndexType,
+    DecoderIndexType,
+)
+
+
+_CONTENT_TYPE_CACHE_SIZE: int = 256
+"""Most ``'Content-Type'`` values a :class:`DecoderIndex` remembers."""
+
+_UNSNIFFABLE = frozenset(
+    mimetype
+    for mimetype in (MimeType.TEXT, getattr(MimeType, "PROTO", None))
+    if mimetype is not None
+)
+"""
+Mimetypes spantools skips when sniffing, since their decoders accept any body.
+``MimeType.PROTO`` only exists in newer versions of spantools.
+"""
+
+_registry_version: int = 0
+"""Bumped on every registration, so flattened registries know to rebuild."""
+
+
+def _normalize_mimetype(mimetype: MimeTypeTolerant) -> MimeTypeTolerant:
+    try:
+        return MimeType.from_name(mimetype)
+    except ValueError:
+        return mimetype
+
+
+class DecoderIndex(Dict[MimeTypeTolerant, DecoderType]):
+    """
+    Decoders by mimetype, like ``spantools.DEFAULT_DECODERS``, that remembers which
+    decoder each ``'Content-Type'`` header value resolves to. Parsing the header is
+    costly next to a dict lookup, and a client sees few distinct values.
+    """
+
+    def __init__(self, decoders: DecoderIndexType) -> None:
+        super().__init__(decoders)
+        self._by_content_type: Dict[
+            Optional[str], Tuple[MimeTypeTolerant, Optional[DecoderType]]
+        ] = dict()
+
+    def for_content_type(
+        self, content_type: Optional[str]
+    ) -> Tuple[MimeTypeTolerant, Optional[DecoderType]]:
+        """
+        :return: ``(mimetype, decoder)`` for a ``'Content-Type'`` header value.
+            ``decoder`` is ``None`` if no decoder is registered for the mimetype.
+        """
+        try:
+            return self._by_content_type[content_type]
+        except KeyError:
+            pass
+
+        mimetype = _normalize_mimetype(content_type)
+        resolved = mimetype, self.get(mimetype)
+
+        if len(self._by_content_type) < _CONTENT_TYPE_CACHE_SIZE:
+            self._by_content_type[content_type] = resolved
+        return resolved
+
+
+class CodecRegistry:
+    """
+    Encoders and decoders by mimetype for a client class or instance. Mimetypes that are
+    not registered on a registry are taken from its parent, so codecs registered for a
+    client do not affect its base classes or any other client.
+    """
+
+    def __init__(
+        self,
+        parent: Optional["CodecRegistry"] = None,
+        encoders: Optional[EncoderIndexType] = None,
+        decoders: Optional[DecoderIndexType] = None,
+    ) -> None:
+        """
+        :param parent: Registry to fall back on.
+        :param encoders: Encoders registered on this registry.
+        :param decoders: Decoders registered on this registry.
+        """
+        self.parent: Optional[CodecRegistry] = parent
+        self._encoders_own: EncoderIndexType = dict(encoders or dict())
+        self._decoders_own: DecoderIndexType = dict(decoders or dict())
+
+        self._version: int = -1
+        self._encoders: EncoderIndexType = dict()
+        self._decoders: DecoderIndex = DecoderIndex(dict())
+
+    def register(
+        self, mimetype: MimeTypeTolerant, encoder: EncoderType, decoder: DecoderType
+    ) -> None:
+        """Registers an encoder and decoder for ``mimetype`` on this registry."""
+        global _registry_version
+
+        mimetype = _normalize_mimetype(mimetype)
+        self._encoders_own[mimetype] = encoder
+        self._decoders_own[mimetype] = decoder
+
+        _registry_version += 1
+
+    def _flatten(self) -> None:
+        if self._version == _registry_version:
+            return
+
+        encoders: EncoderIndexType = dict()
+        decoders: DecoderIndexType = dict()
+        if self.parent is not None:
+            encoders.update(self.parent.encoders)
+            decoders.update(self.parent.decoders)
+
+        encoders.update(self._encoders_own)
+        decoders.update(self._decoders_own)
+
+        self._encoders = encoders
+        self._decoders = DecoderIndex(decoders)
+        self._version = _registry_version
+
+    @property
+    def encoders(self) -> EncoderIndexType:
+        """All encoders of this registry and its parents. Do not modify."""
+        self._flatten()
+        return self._encoders
+
+    @property
+    def decoders(self) -> DecoderIndex:
+        """All decoders of this registry and its parents. Do not modify."""
+        self._flatten()
+        return self._decoders
+
+
+@dataclass
+class DecodeStats:
+    """
+    How the bodies of an endpoint's responses without a ``'Content-Type'`` header were
+    decoded. The mimetype that decoded the last sniffed body is tried first on the next
+    one, so sniffing only happens again when the body stops matching it.
+
+    Available on decorated methods as ``decode_stats``, ie:
+    ``APIClient.name_fetch.decode_stats``.
+    """
+
+    mimetype: MimeTypeTolerant = None
+    """Mimetype learned from the last sniffed body."""
+    learned: int = 0
+    """Number of bodies decoded with the learned mimetype."""
+    sniffed: int = 0
+    """Number of bodies that had to be sniffed."""
+
+    def decode(self, content: bytes, decoders: DecoderIndexType) -> Any:
+        """
+        Decodes ``content`` with the learned mimetype, or by trying every decoder.
+
+        :raises ContentDecodeError: If no decoder can decode the content.
+        """
+        decoder = decoders.get(self.mimetype)
+        if decoder is not None:
+            try:
+                decoded = decoder(content)
+            except BaseException:
+                pass
+            else:
+                self.learned += 1
+                return decoded
+
+        self.sniffed += 1
+        self.mimetype, decoded = _sniff(content, decoders)
+        return decoded
+
+
+def _sniff(content: bytes, decoders: DecoderIndexType) -> Tuple[MimeTypeTolerant, Any]:
+    # Same order and rules as spantools' sniffing, but the mimetype that worked is
+    # returned too.
+    for mimetype, decoder in decoders.items():
+        if mimetype in _UNSNIFFABLE:
+            continue
+
+        try:
+            decoded = decoder(content)
+        except BaseException:
+            continue
+
+        if decoded is not None:
+            return mimetype, decoded
+        break
+
+    raise ContentDecodeError("Could not deserialize content")
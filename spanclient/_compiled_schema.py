@@ -0,0 +1,536 @@
+import copy
+import math
+import uuid
+from collections.abc import Mapping
+from marshmallow import (
+    Schema,
+    ValidationError,
+    fields,
+    missing,
+    EXCLUDE,
+    INCLUDE,
+    RAISE,
+)
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Type
+
+
+_Lines = List[str]
+
+_LOAD_DEFAULT: str = (
+    "load_default" if hasattr(fields.Raw(), "load_default") else "missing"
+)
+"""
+Field attribute holding the value loaded for a missing key. Marshmallow 3.13 renamed
+``missing`` to ``load_default`` and deprecated the old name.
+"""
+
+
+class _Fallback(Exception):
+    """Raised by generated code on data it does not handle like marshmallow would."""
+
+
+def _float_from_int(value: int) -> float:
+    try:
+        return float(value)
+    except OverflowError:
+        raise _Fallback
+
+
+def _uuid_from_str(value: str) -> uuid.UUID:
+    try:
+        return uuid.UUID(value)
+    except ValueError:
+        raise _Fallback
+
+
+def _base_class(schema: Schema) -> Type[Schema]:
+    return getattr(type(schema), "_compiled_from", type(schema))
+
+
+def _uncompiled(schema_class: Type[Schema], state: Dict[str, Any]) -> Schema:
+    schema = schema_class.__new__(schema_class)
+    schema.__dict__.update(state)
+    return schema
+
+
+class _Codegen:
+    """Source and namespace of the functions generated for one schema."""
+
+    def __init__(self, compiling: FrozenSet[type]) -> None:
+        self.compiling: FrozenSet[type] = compiling
+        """Schema classes being compiled, to stop at self-referencing schemas."""
+        self.nested: Dict[int, Optional[Schema]] = dict()
+        """Compiled schemas of ``Nested`` fields, shared by the load and dump code."""
+        self.functions: List[_Lines] = list()
+        self.namespace: Dict[str, Any] = {
+            "missing": missing,
+            "EXCLUDE": EXCLUDE,
+            "Mapping": Mapping,
+            "UUID": uuid.UUID,
+            "isfinite": math.isfinite,
+            "_Fallback": _Fallback,
+            "_float_from_int": _float_from_int,
+            "_uuid_from_str": _uuid_from_str,
+        }
+
+    def bind(self, value: Any, prefix: str) -> str:
+        """Adds ``value`` to the namespace and returns the name it is bound to."""
+        name = f"{prefix}{len(self.namespace)}"
+        self.namespace[name] = value
+        return name
+
+    def add_function(self, signature: str, body: _Lines) -> None:
+        self.functions.append([f"def {signature}:"] + _indent(body))
+
+    def build(self) -> Dict[str, Any]:
+        source = "\n\n".join("\n".join(lines) for lines in self.functions)
+        exec(compile(source, "<spanclient compiled schema>", "exec"), self.namespace)
+        return self.namespace
+
+
+def _indent(lines: _Lines) -> _Lines:
+    return ["    " + line for line in lines]
+
+
+def _nested_schema(field: fields.Nested, gen: _Codegen) -> Optional[Schema]:
+    try:
+        return gen.nested[id(field)]
+    except KeyError:
+        pass
+
+    compiled = None
+    try:
+        schema = field.schema
+    except BaseException:
+        # Schemas referenced by name may not be registered yet.
+        schema = None
+
+    if schema is not None and _base_class(schema) not in gen.compiling:
+        compiled = _compile(schema, gen.compiling)
+
+    gen.nested[id(field)] = compiled
+    return compiled
+
+
+# Converters write the loaded / dumped form of ``src`` to ``dst``, which are python
+# expressions. ``src`` is never ``None`` or missing. They return ``None`` when ``field``
+# is not supported, in which case the field's own methods are called.
+
+_Converter = Callable[[Any, str, str, _Codegen], Optional[_Lines]]
+
+
+def _load_type(type_name: str) -> _Converter:
+    def converter(field: Any, src: str, dst: str, gen: _Codegen) -> _Lines:
+        return [
+            f"if type({src}) is not {type_name}:",
+            "    raise _Fallback",
+            f"{dst} = {src}",
+        ]
+
+    return converter
+
+
+def _load_float(field: fields.Float, src: str, dst: str, gen: _Codegen) -> _Lines:
+    lines = [
+        f"if type({src}) is int:",
+        f"    {src} = _float_from_int({src})",
+        f"elif type({src}) is not float:",
+        "    raise _Fallback",
+    ]
+    if not field.allow_nan:
+        lines += [f"elif not isfinite({src}):", "    raise _Fallback"]
+    return lines + [f"{dst} = {src}"]
+
+
+def _load_boolean(
+    field: fields.Boolean, src: str, dst: str, gen: _Codegen
+) -> Optional[_Lines]:
+    if field.truthy != fields.Boolean.truthy or field.falsy != fields.Boolean.falsy:
+        return None
+    return [
+        f"if {src} is not True and {src} is not False:",
+        "    raise _Fallback",
+        f"{dst} = {src}",
+    ]
+
+
+def _load_uuid(field: fields.UUID, src: str, dst: str, gen: _Codegen) -> _Lines:
+    return [
+        f"if type({src}) is not str:",
+        "    raise _Fallback",
+        f"{dst} = _uuid_from_str({src})",
+    ]
+
+
+def _load_nested(
+    field: fields.Nested, src: str, dst: str, gen: _Codegen
+) -> Optional[_Lines]:
+    schema = _nested_schema(field, gen)
+    if schema is None:
+        return None
+
+    lines: _Lines = list()
+    if schema.many or field.many:
+        lines += [f"if type({src}) is not list:", "    raise _Fallback"]
+
+    load = gen.bind(schema.load, "load_")
+    return lines + [f"{dst} = {load}({src}, unknown={field.unknown!r}, partial=False)"]
+
+
+def _load_list(field: fields.List, src: str, dst: str, gen: _Codegen) -> _Lines:
+    inner = field.inner
+    name = gen.bind(inner, "field_")
+    body = ["return " + f"{name}.deserialize(value, partial=False)"]
+
+    converted = _field_converter(_LOAD_CONVERTERS, inner, "value", "value", gen)
+    if converted is not None:
+        null = ["return None"] if inner.allow_none else ["raise _Fallback"]
+        body = ["if value is None:"] + _indent(null) + converted + ["return value"]
+
+    item_load = name + "_load"
+    gen.add_function(f"{item_load}(value)", body)
+    return [
+        f"if type({src}) is not list:",
+        "    raise _Fallback",
+        f"{dst} = [{item_load}(item) for item in {src}]",
+    ]
+
+
+_LOAD_CONVERTERS: Dict[type, _Converter] = {
+    fields.String: _load_type("str"),
+    fields.Integer: _load_type("int"),
+    fields.Float: _load_float,
+    fields.Boolean: _load_boolean,
+    fields.UUID: _load_uuid,
+    fields.Nested: _load_nested,
+    fields.List: _load_list,
+}
+
+
+def _dump_type(type_name: str) -> _Converter:
+    def converter(field: Any, src: str, dst: str, gen: _Codegen) -> _Lines:
+        name = gen.bind(field, "field_")
+        return [
+            f"if type({src}) is {type_name}:",
+            f"    {dst} = {src}",
+            "else:",
+            f"    {dst} = {name}._serialize({src}, attr, obj)",
+        ]
+
+    return converter
+
+
+def _dump_number(type_name: str) -> _Converter:
+    def converter(
+        field: fields.Number, src: str, dst: str, gen: _Codegen
+    ) -> Optional[_Lines]:
+        if field.as_string:
+            return None
+        return _dump_type(type_name)(field, src, dst, gen)
+
+    return converter
+
+
+def _dump_boolean(
+    field: fields.Boolean, src: str, dst: str, gen: _Codegen
+) -> Optional[_Lines]:
+    if field.truthy != fields.Boolean.truthy or field.falsy != fields.Boolean.falsy:
+        return None
+
+    name = gen.bind(field, "field_")
+    return [
+        f"if {src} is True or {src} is False:",
+        f"    {dst} = {src}",
+        "else:",
+        f"    {dst} = {name}._serialize({src}, attr, obj)",
+    ]
+
+
+def _dump_uuid(field: fields.UUID, src: str, dst: str, gen: _Codegen) -> _Lines:
+    name = gen.bind(field, "field_")
+    return [
+        f"if type({src}) is UUID:",
+        f"    {dst} = str({src})",
+        "else:",
+        f"    {dst} = {name}._serialize({src}, attr, obj)",
+    ]
+
+
+def _dump_nested(
+    field: fields.Nested, src: str, dst: str, gen: _Codegen
+) -> Optional[_Lines]:
+    schema = _nested_schema(field, gen)
+    if schema is None:
+        return None
+
+    dump = gen.bind(schema.dump, "dump_")
+    return [f"{dst} = {dump}({src}, many={bool(schema.many or field.many)})"]
+
+
+def _dump_list(field: fields.List, src: str, dst: str, gen: _Codegen) -> _Lines:
+    inner = field.inner
+    name = gen.bind(inner, "field_")
+    body = [f"return {name}._serialize(value, attr, obj)"]
+
+    converted = _field_converter(_DUMP_CONVERTERS, inner, "value", "value", gen)
+    if converted is not None:
+        body = ["if value is None:", "    return None"] + converted + ["return value"]
+
+    item_dump = name + "_dump"
+    gen.add_function(f"{item_dump}(value, attr, obj)", body)
+    return [f"{dst} = [{item_dump}(item, attr, obj) for item in {src}]"]
+
+
+_DUMP_CONVERTERS: Dict[type, _Converter] = {
+    fields.String: _dump_type("str"),
+    fields.Integer: _dump_number("int"),
+    fields.Float: _dump_number("float"),
+    fields.Boolean: _dump_boolean,
+    fields.UUID: _dump_uuid,
+    fields.Nested: _dump_nested,
+    fields.List: _dump_list,
+}
+
+
+def _field_converter(
+    converters: Dict[type, _Converter], field: Any, src: str, dst: str, gen: _Codegen
+) -> Optional[_Lines]:
+    # Only exact classes: subclasses may change how values are handled.
+    try:
+        converter = converters[type(field)]
+    except KeyError:
+        return None
+
+    if field.validators:
+        return None
+    return converter(field, src, dst, gen)
+
+
+def _load_field(attr_name: str, field: Any, gen: _Codegen) -> _Lines:
+    """Lines of ``load_one`` that load one field, as ``Schema._deserialize`` does."""
+    key = repr(field.data_key if field.data_key is not None else attr_name)
+    dst = f"ret[{(field.attribute or attr_name)!r}]"
+    name = gen.bind(field, "field_")
+
+    converted = _field_converter(_LOAD_CONVERTERS, field, "value", dst, gen)
+    if converted is None:
+        return [
+            f"value = {name}.deserialize(data.get({key}, missing), {key}, data, "
+            "partial=False)",
+            "if value is not missing:",
+            f"    {dst} = value",
+        ]
+
+    if field.required:
+        if_missing = ["raise _Fallback"]
+    elif getattr(field, _LOAD_DEFAULT) is missing:
+        if_missing = ["pass"]
+    else:
+        call = "()" if callable(getattr(field, _LOAD_DEFAULT)) else ""
+        if_missing = [f"{dst} = {name}.{_LOAD_DEFAULT}{call}"]
+
+    if_none = [f"{dst} = None"] if field.allow_none else ["raise _Fallback"]
+
+    return (
+        [f"value = data.get({key}, missing)", "if value is missing:"]
+        + _indent(if_missing)
+        + ["elif value is None:"]
+        + _indent(if_none)
+        + ["else:"]
+        + _indent(converted)
+    )
+
+
+def _dump_field(attr_name: str, field: Any, getter: str, gen: _Codegen) -> _Lines:
+    """Lines of ``dump_one`` that dump one field, as ``Schema._serialize`` does."""
+    key = repr(field.data_key if field.data_key is not None else attr_name)
+    dst = f"ret[{key}]"
+    name = gen.bind(field, "field_")
+    serialize = [
+        f"value = {name}.serialize({attr_name!r}, obj, accessor=get_attribute)",
+        "if value is not missing:",
+        f"    {dst} = value",
+    ]
+
+    attribute = field.attribute or attr_name
+    converted = None
+    if "." not in attribute:
+        converted = _field_converter(_DUMP_CONVERTERS, field, "value", dst, gen)
+    if converted is None:
+        return serialize
+
+    return (
+        [
+            f"attr = {attr_name!r}",
+            f"value = {getter.format(repr(attribute))}",
+            "if value is missing:",
+        ]
+        + _indent(serialize)
+        + ["elif value is None:", f"    {dst} = None", "else:"]
+        + _indent(converted)
+    )
+
+
+def _new_dict(schema: Schema, gen: _Codegen) -> str:
+    if schema.dict_class is dict:
+        return "ret = {}"
+    return f"ret = {gen.bind(schema.dict_class, 'dict_class_')}()"
+
+
+def _generate_load(schema: Schema, gen: _Codegen) -> bool:
+    """
+    Generates ``load_one(data, unknown)``, which loads one record of ``data`` like
+    ``Schema._deserialize`` without ``partial``, or raises ``_Fallback``.
+    """
+    load_fields = schema.load_fields
+    if any("." in (field.attribute or name) for name, field in load_fields.items()):
+        return False
+
+    known = frozenset(
+        field.data_key if field.data_key is not None else name
+        for name, field in load_fields.items()
+    )
+    body = [
+        "if type(data) is not dict and not isinstance(data, Mapping):",
+        "    raise _Fallback",
+        f"if unknown != EXCLUDE and not {gen.bind(known, 'known_')}.issuperset(data):",
+        "    raise _Fallback",
+        _new_dict(schema, gen),
+    ]
+    for attr_name, field in load_fields.items():
+        body += _load_field(attr_name, field, gen)
+
+    gen.add_function("load_one(data, unknown)", body + ["return ret"])
+    return True
+
+
+def _generate_dump(schema: Schema, gen: _Codegen) -> bool:
+    """
+    Generates ``dump_dict(obj)`` and ``dump_attrs(obj)``, which dump one dict, or one
+    object without ``__getitem__``, like ``Schema._serialize``.
+    """
+    if type(schema).get_attribute is not Schema.get_attribute:
+        return False
+
+    gen.namespace["get_attribute"] = schema.get_attribute
+    for name, getter in (
+        ("dump_dict", "obj.get({}, missing)"),
+        ("dump_attrs", "getattr(obj, {}, missing)"),
+    ):
+        body = [_new_dict(schema, gen)]
+        for attr_name, field in schema.dump_fields.items():
+            body += _dump_field(attr_name, field, getter, gen)
+        gen.add_function(f"{name}(obj)", body + ["return ret"])
+
+    return True
+
+
+def _compiled_deserialize(base: Callable, load_one: Callable) -> Callable:
+    def _deserialize(
+        self: Schema,
+        data: Any,
+        *,
+        error_store: Any,
+        many: bool = False,
+        partial: Any = False,
+        unknown: str = RAISE,
+        index: Optional[int] = None,
+    ) -> Any:
+        # Newer marshmallow versions pass ``None`` when the schema is not partial.
+        if not partial and unknown != INCLUDE:
+            try:
+                if not many:
+                    return load_one(data, unknown)
+                if type(data) is list:
+                    return [load_one(item, unknown) for item in data]
+            except (_Fallback, ValidationError):
+                pass
+
+        # Marshmallow records the errors, or handles what the generated code does not.
+        return base(
+            self,
+            data,
+            error_store=error_store,
+            many=many,
+            partial=partial,
+            unknown=unknown,
+            index=index,
+        )
+
+    return _deserialize
+
+
+def _compiled_serialize(
+    base: Callable, dump_dict: Callable, dump_attrs: Callable
+) -> Callable:
+    def _serialize(self: Schema, obj: Any, *, many: bool = False) -> Any:
+        if many:
+            if type(obj) is list:
+                return [self._serialize(item) for item in obj]
+            return base(self, obj, many=many)
+
+        if type(obj) is dict:
+            return dump_dict(obj)
+        elif hasattr(obj, "__getitem__"):
+            return base(self, obj)
+        return dump_attrs(obj)
+
+    return _serialize
+
+
+def _compile(schema: Schema, compiling: FrozenSet[type]) -> Schema:
+    schema_class = _base_class(schema)
+    # A plain copy, even if ``schema`` was compiled before.
+    compiled = copy.copy(schema)
+
+    namespace: Dict[str, Any] = {
+        "__module__": schema_class.__module__,
+        "__qualname__": schema_class.__qualname__,
+        "_compiled_from": schema_class,
+        "Meta": type("GeneratedMeta", (schema_class.Meta,), {"register": False}),
+        # Copies and unpickled compiled schemas are plain schemas, since fields may
+        # be changed on a copy, and generated code cannot be pickled.
+        "__reduce__": lambda self: (_uncompiled, (schema_class, self.__dict__)),
+    }
+
+    gen = _Codegen(compiling | {schema_class})
+    load = schema_class._deserialize is Schema._deserialize and _generate_load(
+        compiled, gen
+    )
+    dump = schema_class._serialize is Schema._serialize and _generate_dump(
+        compiled, gen
+    )
+    generated = gen.build()
+
+    if load:
+        namespace["_deserialize"] = _compiled_deserialize(
+            schema_class._deserialize, generated["load_one"]
+        )
+    if dump:
+        namespace["_serialize"] = _compiled_serialize(
+            schema_class._serialize, generated["dump_dict"], generated["dump_attrs"]
+        )
+
+    compiled.__class__ = type(schema_class.__name__, (schema_class,), namespace)
+    return compiled
+
+
+def compile_schema(schema: Schema) -> Schema:
+    """
+    Returns a copy of ``schema`` that loads and dumps records with functions generated
+    for its field tree, instead of marshmallow's generic field-by-field loop.
+
+    The copy is a subclass of the schema's class, so hooks and overridden methods run as
+    before, and its results and errors are the same as the original's. Records the
+    generated code does not handle the way marshmallow would -- a value of an unexpected
+    type, a missing required field, an unknown field -- are handed to marshmallow.
+    Fields of other types than ``String``, ``Integer``, ``Float``, ``Boolean``,
+    ``UUID``, ``Nested`` and ``List``, fields of subclasses of these types, and fields
+    with validators are handled by the field itself.
+
+    Copying or unpickling the returned schema gives a plain, uncompiled schema.
+
+    :param schema: Schema to compile. It is not changed.
+    :return: Compiled copy of ``schema``.
+    """
+    return _compile(schema, frozenset())
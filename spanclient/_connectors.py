@@ -0,0 +1,94 @@
+import asyncio
+import weakref
+from asyncio import AbstractEventLoop
+from dataclasses import dataclass
+from aiohttp import BaseConnector
+from typing import Any, Callable, Dict, Hashable, Mapping, Tuple
+
+
+@dataclass
+class _SharedConnector:
+    connector: BaseConnector
+    refs: int = 0
+    """Number of clients currently borrowing the connector."""
+
+
+_LoopConnectors = Dict[Hashable, _SharedConnector]
+
+_SHARED_CONNECTORS: "weakref.WeakKeyDictionary[AbstractEventLoop, _LoopConnectors]" = (
+    weakref.WeakKeyDictionary()
+)
+"""
+Connectors shared between clients, by event loop and then by connector options. Loops
+are weakly referenced, so the registry does not keep them alive once they are done.
+"""
+
+
+def _hashable(value: Any) -> Hashable:
+    try:
+        hash(value)
+    except TypeError:
+        return id(value)
+    return value
+
+
+def _registry_key(factory: Callable, options: Mapping[str, Any]) -> Hashable:
+    options_key = tuple(sorted((name, _hashable(v)) for name, v in options.items()))
+    # Bound methods of different clients are keyed by their shared function, so that
+    # clients only share when they build their connectors the same way.
+    factory = getattr(factory, "__func__", factory)
+    return factory, options_key
+
+
+def borrow_connector(
+    factory: Callable[[], BaseConnector], options: Mapping[str, Any]
+) -> Tuple[Hashable, BaseConnector]:
+    """
+    Borrows the connector shared by clients with the same ``options`` on the current
+    event loop, creating it with ``factory`` if there is none.
+
+    :return: ``(key, connector)``. ``key`` must be passed to :func:`return_connector`
+        once the connector is no longer needed.
+    """
+    # Connectors reference their loop, so those of closed loops that were never
+    # returned would keep them alive.
+    for closed in [loop for loop in _SHARED_CONNECTORS if loop.is_closed()]:
+        del _SHARED_CONNECTORS[closed]
+
+    loop = asyncio.get_event_loop()
+    key = _registry_key(factory, options)
+
+    connectors = _SHARED_CONNECTORS.setdefault(loop, dict())
+    shared = connectors.get(key)
+    if shared is None or shared.connector.closed:
+        shared = _SharedConnector(factory())
+        connectors[key] = shared
+
+    shared.refs += 1
+    # The client holds on to the key, so it only references the loop weakly.
+    return (weakref.ref(loop), key), shared.connector
+
+
+async def return_connector(key: Hashable, connector: BaseConnector) -> None:
+    """
+    Returns a connector borrowed with :func:`borrow_connector`. The connector is closed
+    once it has been returned by every client that borrowed it.
+    """
+    loop_ref, connector_key = key  # type: ignore
+    loop = loop_ref()
+    connectors = None if loop is None else _SHARED_CONNECTORS.get(loop)
+    if connectors is None:
+        # The loop is gone, and its connectors with it.
+        return
+
+    shared = connectors.get(connector_key)
+    if shared is None or shared.connector is not connector:
+        # The connector was closed and replaced while this client was using it.
+        return
+
+    shared.refs -= 1
+    if shared.refs <= 0:
+        del connectors[connector_key]
+        if not connectors:
+            del _SHARED_CONNECTORS[loop]
+        await connector.close()
@@ -0,0 +1,395 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import ClientResponse
+from multidict import CIMultiDict, CIMultiDictProxy
+from typing import Any, Callable, Iterable, List, Mapping, Optional, Tuple, TypeVar
+
+from ._cache import CacheEntry, _cache_control, _max_age
+from ._response_data import ResponseData
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    content BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    expires REAL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_used ON responses (used);
+CREATE INDEX IF NOT EXISTS responses_url ON responses (url);
+
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    count INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO totals
+    SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM responses;
+
+CREATE TRIGGER IF NOT EXISTS responses_added AFTER INSERT ON responses BEGIN
+    UPDATE totals SET count = count + 1, size = size + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS responses_removed AFTER DELETE ON responses BEGIN
+    UPDATE totals SET count = count - 1, size = size - OLD.size;
+END;
+
+PRAGMA user_version = 1;
+"""
+"""
+``totals`` keeps the number and combined size of the stored responses up to date for
+every process sharing the database, so they are known without scanning ``responses``.
+"""
+
+_SCHEMA_VERSION = 1
+"""
+Databases with an older ``user_version`` are emptied when opened. Version 0 stored
+request headers, credentials included, as-is in its keys.
+"""
+
+_DROP_OLD = """
+DROP TABLE IF EXISTS responses;
+DROP TABLE IF EXISTS totals;
+"""
+
+_PRIVATE_HEADERS = frozenset(("set-cookie", "set-cookie2"))
+"""Response headers that are never written to disk."""
+
+
+_T = TypeVar("_T")
+
+
+def _without_query(url: Any) -> str:
+    return str(url).split("?", 1)[0]
+
+
+def _is_fresh(expires: Optional[float]) -> bool:
+    return expires is not None and time.time() < expires
+
+
+class StoredResponse:
+    """
+    Response read back from a :class:`DiskCache`. Stands in for the aiohttp response
+    when the body is decoded and loaded, and as ``ResponseData.resp``.
+    """
+
+    def __init__(
+        self,
+        status: int,
+        headers: CIMultiDictProxy,
+        content: bytes,
+        expires: Optional[float],
+    ) -> None:
+        """
+        :param status: Status code of the stored response.
+        :param headers: Headers of the stored response.
+        :param content: Body of the stored response.
+        :param expires: Wall clock time until which the response is fresh.
+        """
+        self.status: int = status
+        self.headers: CIMultiDictProxy = headers
+        self.content: bytes = content
+        self.expires: Optional[float] = expires
+
+    async def read(self) -> bytes:
+        return self.content
+
+    def release(self) -> None:
+        pass
+
+    def entry(self, data: ResponseData) -> CacheEntry:
+        """In-memory cache entry for the response, once handled as ``data``."""
+        expires = self.expires
+        if expires is not None:
+            expires = time.monotonic() + expires - time.time()
+
+        return CacheEntry(
+            data=data,
+            size=len(self.content),
+            etag=self.headers.get("ETag"),
+            last_modified=self.headers.get("Last-Modified"),
+            expires=expires,
+        )
+
+
+class DiskCache:
+    """
+    Persistent tier of a :class:`ResponseCache`, holding GET response bodies as received
+    in an SQLite database so they survive restarts. Pass one to the memory cache with
+    the ``disk`` parameter.
+
+    When a request misses the memory cache, its stored response is decoded and loaded
+    as if it had just been received. A fresh response is used without a request. A stale
+    one with an ``'ETag'`` or ``'Last-Modified'`` header is revalidated with a
+    conditional request, and a ``304 Not Modified`` refreshes it on disk.
+
+    The least recently used responses are evicted once their bodies add up to more than
+    ``max_bytes``. Several processes can share one database file.
+
+    The database is only used from a worker thread of the cache, so waiting on another
+    process that is writing to it never blocks the event loop.
+
+    Requests are stored under a hash of their method, url and headers, so credentials
+    sent in headers are never written to disk. Neither are ``'Set-Cookie'`` headers of
+    responses.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float = 0,
+        max_bytes: int = 256 * 2 ** 20,
+        timeout: float = 30,
+    ) -> None:
+        """
+        :param path: Database file, created if it does not exist.
+        :param ttl: Seconds a response is fresh for if it does not set its own
+            ``'Cache-Control: max-age'``. Responses marked ``no-cache`` are always
+            revalidated.
+        :param max_bytes: Maximum combined size of the stored response bodies.
+        :param timeout: Seconds to wait on another process that is writing to the
+            database, before the operation fails with ``sqlite3.OperationalError``.
+        """
+        self.path: str = path
+        self.ttl: float = ttl
+        self.max_bytes: int = max_bytes
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="spanclient-disk-cache"
+        )
+        self._db = sqlite3.connect(
+            path, timeout=timeout, isolation_level=None, check_same_thread=False
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        if self._db.execute("PRAGMA user_version").fetchone()[0] < _SCHEMA_VERSION:
+            self._db.executescript(_DROP_OLD)
+        self._db.executescript(_SCHEMA)
+
+        self._totals: Tuple[int, int] = self._read_totals()
+        """``(count, size)`` of the stored responses, as of the last operation."""
+
+    def __len__(self) -> int:
+        """
+        Number of stored responses as of the last operation of this cache, which
+        includes the changes of other processes up to then.
+        """
+        return self._totals[0]
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Combined size of the stored response bodies, as of the last operation of this
+        cache.
+        """
+        return self._totals[1]
+
+    def _read_totals(self) -> Tuple[int, int]:
+        return self._db.execute("SELECT count, size FROM totals").fetchone()
+
+    def _size(self) -> int:
+        return self._db.execute("SELECT size FROM totals").fetchone()[0]
+
+    async def _run(self, func: Callable[..., _T], *args: Any) -> _T:
+        """
+        Runs ``func`` on the cache's worker thread, and reads the totals after it, so
+        they can be returned without waiting on the database.
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, self._call, func, args)
+
+    def _call(self, func: Callable[..., _T], args: Tuple[Any, ...]) -> _T:
+        result = func(*args)
+        self._totals = self._read_totals()
+        return result
+
+    @staticmethod
+    def _key(method: str, url: Any, headers: Mapping[str, str]) -> str:
+        # Hashed, since the request headers may hold credentials.
+        request = repr((method, str(url), sorted(headers.items())))
+        return hashlib.sha256(request.encode()).hexdigest()
+
+    def _expires(self, response: ClientResponse) -> Optional[float]:
+        """Wall clock time until which ``response`` is fresh."""
+        directives = _cache_control(response)
+        if "no-cache" in directives:
+            return None
+
+        max_age = _max_age(directives)
+        return time.time() + (self.ttl if max_age is None else max_age)
+
+    async def get(
+        self, method: str, url: Any, headers: Mapping[str, str]
+    ) -> Optional[StoredResponse]:
+        """
+        Returns the stored response to a request, marking it as recently used. A stale
+        response that cannot be revalidated is removed instead.
+        """
+        return await self._run(self._get, self._key(method, url, headers))
+
+    def _get(self, key: str) -> Optional[StoredResponse]:
+        row = self._db.execute(
+            "SELECT status, headers, content, etag, last_modified, expires"
+            " FROM responses WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+
+        status, headers_json, content, etag, last_modified, expires = row
+        if etag is None and last_modified is None and not _is_fresh(expires):
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+
+        self._db.execute(
+            "UPDATE responses SET used = ? WHERE key = ?", (time.time(), key)
+        )
+        headers_stored = CIMultiDictProxy(CIMultiDict(json.loads(headers_json)))
+        return StoredResponse(status, headers_stored, content, expires)
+
+    async def store(
+        self,
+        method: str,
+        url: Any,
+        headers: Mapping[str, str],
+        response: ClientResponse,
+        content: bytes,
+    ) -> None:
+        """
+        Stores the response to a request, evicting the least recently used responses to
+        make room. Responses that may not be stored, or could never be reused, replace
+        the stored response with nothing.
+        """
+        key = self._key(method, url, headers)
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        expires = self._expires(response)
+
+        if (
+            "no-store" in _cache_control(response)
+            or len(content) > self.max_bytes
+            or (etag is None and last_modified is None and not _is_fresh(expires))
+        ):
+            await self._run(self._discard, key)
+            return
+
+        row = (
+            key,
+            _without_query(url),
+            response.status,
+            json.dumps(
+                [
+                    (name, value)
+                    for name, value in response.headers.items()
+                    if name.lower() not in _PRIVATE_HEADERS
+                ]
+            ),
+            content,
+            len(content),
+            etag,
+            last_modified,
+            expires,
+            time.time(),
+        )
+        await self._run(self._store, row)
+
+    def _store(self, row: Tuple[Any, ...]) -> None:
+        # A replaced row is deleted first rather than with INSERT OR REPLACE, which does
+        # not fire the delete trigger that keeps ``totals`` right.
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+            self._db.execute(
+                "INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row
+            )
+            self._evict()
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def _evict(self) -> None:
+        """
+        Deletes the least recently used responses until the stored bodies fit in
+        ``max_bytes``. Only the responses deleted are read.
+        """
+        excess = self._size() - self.max_bytes
+        if excess <= 0:
+            return
+
+        evicted = list()
+        cursor = self._db.execute("SELECT key, size FROM responses ORDER BY used")
+        for key, size in cursor:
+            evicted.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        cursor.close()
+
+        self._db.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    async def refresh(
+        self,
+        method: str,
+        url: Any,
+        headers: Mapping[str, str],
+        response: ClientResponse,
+    ) -> None:
+        """
+        Updates the freshness of a stored response from a ``304 Not Modified``
+        response.
+        """
+        key = self._key(method, url, headers)
+        await self._run(self._refresh, key, self._expires(response))
+
+    def _refresh(self, key: str, expires: Optional[float]) -> None:
+        self._db.execute(
+            "UPDATE responses SET expires = ?, used = ? WHERE key = ?",
+            (expires, time.time(), key),
+        )
+
+    async def discard(self, method: str, url: Any, headers: Mapping[str, str]) -> None:
+        """Removes the stored response to a request if there is one."""
+        await self._run(self._discard, self._key(method, url, headers))
+
+    def _discard(self, key: str) -> None:
+        self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    async def discard_urls(self, urls: Iterable[str]) -> int:
+        """
+        Removes the stored responses to requests for any of ``urls``, whatever their
+        query string, and with or without a trailing slash.
+
+        :return: Number of responses removed.
+        """
+        return await self._run(self._discard_urls, list(urls))
+
+    def _discard_urls(self, urls: List[str]) -> int:
+        removed = 0
+        for url in urls:
+            url = url.rstrip("/")
+            cursor = self._db.execute(
+                "DELETE FROM responses WHERE url IN (?, ?)", (url, url + "/")
+            )
+            removed += cursor.rowcount
+        return removed
+
+    async def clear(self) -> None:
+        """Removes all stored responses."""
+        await self._run(self._db.execute, "DELETE FROM responses")
+
+    def close(self) -> None:
+        """
+        Closes the database once pending operations are done. The cache cannot be used
+        afterwards.
+        """
+        self._executor.submit(self._db.close).result()
+        self._executor.shutdown()
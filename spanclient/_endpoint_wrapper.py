@@ -1,6 +1,8 @@
+import asyncio
 import functools
-import copy
-from dataclasses import dataclass
+from collections import deque
+from dataclasses import dataclass, field
+from aiohttp import ClientTimeout
 from marshmallow import Schema
 from typing import (
     Optional,
@@ -11,8 +13,11 @@ from typing import (
     Tuple,
     Dict,
     AsyncGenerator,
-    Generator,
     Sequence,
+    Deque,
+    List,
+    Hashable,
+    Iterator,
 )
 
 from spantools import MimeType, convert_params_headers, MimeTypeTolerant
@@ -21,10 +26,17 @@ from spantools.errors_api import NothingToReturnError
 from ._typing import ModelType
 from ._request_obj import ClientRequest, PagingReqClient
 from ._response_data import ResponseData
+from ._streaming import STREAM_FRAMES, STREAM_READ_TIMEOUT
+from ._codecs import DecodeStats
+from ._compiled_schema import compile_schema
+from ._memo import EndpointMemo
 
 
-class _PagedHalt(BaseException):
-    """Raised to halt further paging."""
+_STREAM_ACCEPT: Dict[str, str] = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+"""Accept header sent by :func:`EndpointWrapper.stream` for each frame format."""
 
 
 @dataclass
@@ -48,6 +60,48 @@ class _EndpointSettings:
     Custom updater for mapping new data to existing data object. Takes arguments
     ``(current_object, new_object)`` amd returns ``None``
     """
+    update_key: Optional[str] = None
+    """
+    Field that identifies the records of a response page, when ``update_obj`` is a
+    collection of objects to update.
+    """
+    stream_items: bool = False
+    """
+    Whether to decode the items of a JSON array response incrementally instead of
+    reading the whole body first.
+    """
+    stream_media: bool = False
+    """Whether to encode and send list request media incrementally."""
+    coalesce: bool = False
+    """
+    Whether identical GET / HEAD requests that are in-flight at the same time share one
+    network call.
+    """
+    raw_body: bool = False
+    """Whether to return the undecoded body instead of loading it."""
+    decode_stats: DecodeStats = field(default_factory=DecodeStats)
+    """
+    Mimetype learned from responses without a ``'Content-Type'`` header. Shared by the
+    per-request copies of the settings.
+    """
+    invalidates: Tuple[str, ...] = ()
+    """Endpoint patterns whose cached results a successful request makes stale."""
+    memo: Optional[EndpointMemo] = None
+    """Memoized results, if set up with :func:`EndpointWrapper.cached`."""
+    template_key: Hashable = field(default_factory=object)
+    """
+    Identifies the endpoint in each client's cache of compiled request templates. Shared
+    by the per-request copies of the settings.
+    """
+
+    def copy(self) -> "_EndpointSettings":
+        """
+        Shallow copy for a single request. Cheaper than ``copy.copy``, which goes
+        through the pickle protocol.
+        """
+        settings = object.__new__(_EndpointSettings)
+        settings.__dict__.update(self.__dict__)
+        return settings
 
 
 class EndpointWrapper:
@@ -60,9 +114,20 @@ class EndpointWrapper:
     ``spanclient.handles``.
     """
 
+    def __init__(self) -> None:
+        self._method_partials: Dict[str, Callable] = dict()
+
     def __getattribute__(self, item: str) -> Any:
-        if not item.startswith("_") and item != "paged":
-            return functools.partial(super().__getattribute__("generic"), item)
+        if not item.startswith("_") and item not in ("paged", "stream", "cached"):
+            partials = super().__getattribute__("_method_partials")
+            try:
+                return partials[item]
+            except KeyError:
+                method_partial = functools.partial(
+                    super().__getattribute__("generic"), item
+                )
+                partials[item] = method_partial
+                return method_partial
         else:
             return super().__getattribute__(item)
 
@@ -77,8 +142,6 @@ class EndpointWrapper:
         args: Sequence[Any],
         kwargs: MutableMapping[str, Any],
     ) -> Any:
-        endpoint_settings = copy.copy(endpoint_settings)
-
         try:
             req: ClientRequest = kwargs["req"]
         except KeyError:
@@ -117,7 +180,14 @@ class EndpointWrapper:
         resp_codes: Union[int, Tuple[int, ...]] = 200,
         resp_schema: Optional[Schema] = None,
         data_updater: Optional[Callable[[ModelType, Any], None]] = None,
+        update_key: Optional[str] = None,
         return_info: bool = False,
+        stream_items: bool = False,
+        stream_media: bool = False,
+        coalesce: bool = False,
+        raw_body: bool = False,
+        compile_schemas: bool = False,
+        invalidates: Optional[Sequence[str]] = None,
     ) -> Callable:
         """
         Decorator that is ACTUALLY called decorating an endpoint method.
@@ -136,8 +206,36 @@ class EndpointWrapper:
         :param resp_codes: Valid response codes.
         :param resp_schema: Schema for loading response body content.
         :param data_updater: To use when updating existing data objects in-place.
+        :param update_key: Refresh a collection of existing objects from a list
+            response: ``ClientRequest.update_obj`` is a mapping of key value to object,
+            or a list of objects that is indexed once by this field. Each record updates
+            the object with the same key in place, and the endpoint returns the page
+            with matched records replaced by the updated objects. Unmatched records are
+            returned as new objects.
         :param return_info: Whether to return a :class:`ReturnData` instance in place of
             the decoded / loaded response body.
+        :param stream_items: Return an async iterator over the items of a JSON array
+            response, decoding and loading them one at a time as the body comes in.
+            Memory use stays flat regardless of the response size. Iterate to the end
+            or ``aclose()`` the iterator to hand the connection back right away.
+        :param stream_media: Encode list request media one record at a time and send it
+            with chunked transfer encoding, instead of encoding it into one blob first.
+            Async iterable media is always sent this way.
+        :param coalesce: Let concurrent, identical GET and HEAD requests without media
+            share one network call and one decode. Requests are identical if their
+            method, url, params and headers match. Callers without an ``update_obj``
+            all receive the same loaded object.
+        :param raw_body: Return a :class:`RawBody` with the body as received and its
+            mimetype instead of decoding and loading it, for endpoints that relay
+            responses. Errors and the status code are still checked.
+        :param compile_schemas: Load and dump with copies of ``req_schema`` and
+            ``resp_schema`` compiled by :func:`compile_schema`. The output is the same,
+            at a fraction of the cost for large bodies and list pages.
+        :param invalidates: Endpoint patterns, like ``"/houses/{house_id}/wizards"``,
+            whose cached responses and memoized results are evicted after each
+            successful request. Patterns are filled in with the request's path params.
+            PUT, PATCH and DELETE endpoints also evict their own path and its parent,
+            ie: ``/wizards/{wizard_id}`` and ``/wizards``.
         :return: Method decorator.
 
         :raises StatusMismatchError: When response status does not match ``resp_codes``.
@@ -158,6 +256,12 @@ class EndpointWrapper:
         if isinstance(resp_codes, int):
             resp_codes = (resp_codes,)
 
+        if compile_schemas:
+            if req_schema is not None:
+                req_schema = compile_schema(req_schema)
+            if resp_schema is not None:
+                resp_schema = compile_schema(resp_schema)
+
         endpoint_settings = _EndpointSettings(
             method=method,
             endpoint=endpoint,
@@ -167,6 +271,12 @@ class EndpointWrapper:
             resp_codes=resp_codes,
             resp_schema=resp_schema,
             data_updater=data_updater,
+            update_key=update_key,
+            stream_items=stream_items,
+            stream_media=stream_media,
+            coalesce=coalesce,
+            raw_body=raw_body,
+            invalidates=tuple(invalidates or ()),
         )
 
         def decorator(handler: Callable) -> Callable:
@@ -185,6 +295,8 @@ class EndpointWrapper:
 
                 return result
 
+            wrapper.decode_stats = endpoint_settings.decode_stats  # type: ignore
+            wrapper._endpoint_settings = endpoint_settings  # type: ignore
             return wrapper
 
         return decorator
@@ -200,7 +312,14 @@ class EndpointWrapper:
         resp_codes: Union[int, Tuple[int, ...]] = 200,
         resp_schema: Optional[Schema] = None,
         data_updater: Optional[Callable[[Any, Any], None]] = None,
+        update_key: Optional[str] = None,
         return_info: bool = False,
+        stream_items: bool = False,
+        stream_media: bool = False,
+        coalesce: bool = False,
+        raw_body: bool = False,
+        compile_schemas: bool = False,
+        invalidates: Optional[Sequence[str]] = None,
     ) -> Callable:
         """For IDE code-completion. Alias of :func:`EndpointWrapper.generic`"""
 
@@ -215,7 +334,14 @@ class EndpointWrapper:
         resp_codes: Union[int, Tuple[int, ...]] = 200,
         resp_schema: Optional[Schema] = None,
         data_updater: Optional[Callable[[Any, Any], None]] = None,
+        update_key: Optional[str] = None,
         return_info: bool = False,
+        stream_items: bool = False,
+        stream_media: bool = False,
+        coalesce: bool = False,
+        raw_body: bool = False,
+        compile_schemas: bool = False,
+        invalidates: Optional[Sequence[str]] = None,
     ) -> Callable:
         """For IDE code-completion. Alias of :func:`EndpointWrapper.generic`"""
 
@@ -230,7 +356,14 @@ class EndpointWrapper:
         resp_codes: Union[int, Tuple[int, ...]] = 200,
         resp_schema: Optional[Schema] = None,
         data_updater: Optional[Callable[[Any, Any], None]] = None,
+        update_key: Optional[str] = None,
         return_info: bool = False,
+        stream_items: bool = False,
+        stream_media: bool = False,
+        coalesce: bool = False,
+        raw_body: bool = False,
+        compile_schemas: bool = False,
+        invalidates: Optional[Sequence[str]] = None,
     ) -> Callable:
         """For IDE code-completion. Alias of :func:`EndpointWrapper.generic`"""
 
@@ -245,7 +378,14 @@ class EndpointWrapper:
         resp_codes: Union[int, Tuple[int, ...]] = 200,
         resp_schema: Optional[Schema] = None,
         data_updater: Optional[Callable[[Any, Any], None]] = None,
+        update_key: Optional[str] = None,
         return_info: bool = False,
+        stream_items: bool = False,
+        stream_media: bool = False,
+        coalesce: bool = False,
+        raw_body: bool = False,
+        compile_schemas: bool = False,
+        invalidates: Optional[Sequence[str]] = None,
     ) -> Callable:
         """For IDE code-completion. Alias of :func:`EndpointWrapper.generic`"""
 
@@ -260,7 +400,14 @@ class EndpointWrapper:
         resp_codes: Union[int, Tuple[int, ...]] = 200,
         resp_schema: Optional[Schema] = None,
         data_updater: Optional[Callable[[Any, Any], None]] = None,
+        update_key: Optional[str] = None,
         return_info: bool = False,
+        stream_items: bool = False,
+        stream_media: bool = False,
+        coalesce: bool = False,
+        raw_body: bool = False,
+        compile_schemas: bool = False,
+        invalidates: Optional[Sequence[str]] = None,
     ) -> Callable:
         pass
 
@@ -275,7 +422,14 @@ class EndpointWrapper:
         resp_codes: Union[int, Tuple[int, ...]] = 200,
         resp_schema: Optional[Schema] = None,
         data_updater: Optional[Callable[[Any, Any], None]] = None,
+        update_key: Optional[str] = None,
         return_info: bool = False,
+        stream_items: bool = False,
+        stream_media: bool = False,
+        coalesce: bool = False,
+        raw_body: bool = False,
+        compile_schemas: bool = False,
+        invalidates: Optional[Sequence[str]] = None,
     ) -> Callable:
         """For IDE code-completion. Alias of :func:`EndpointWrapper.generic`"""
 
@@ -300,9 +454,10 @@ class EndpointWrapper:
         return req
 
     @staticmethod
-    def _paged_yield_result_items(result: Any) -> Generator[Any, None, None]:
+    def _paged_result_items(result: Any) -> Tuple[Sequence[Any], bool]:
+        """Returns ``(items, has_next_page)`` for the result of a paged handler."""
         if isinstance(result, ResponseData):
-            page_next: Union[str, bool] = result.resp.headers.get("paging-next", False)
+            page_next = result.resp.headers.get("paging-next", False) is not False
             if result.loaded is not None:
                 items = result.loaded
             else:
@@ -311,66 +466,379 @@ class EndpointWrapper:
             page_next = True
             items = result
 
-        for item in items:
-            yield item
+        return items, page_next
+
+    @staticmethod
+    def _paged_remaining_pages(req: ClientRequest, result: Any) -> Optional[int]:
+        """
+        Returns the number of pages left after the one ``result`` came from, if the
+        response reports the total number of items.
+        """
+        if not isinstance(result, ResponseData):
+            return None
+
+        total_items = result.resp.headers.get("paging-total-items")
+        if total_items is None:
+            return None
+
+        # req.paging.offset includes offset_start once the request is executed.
+        items_left = int(total_items) - req.paging.offset - req.paging.limit
+        pages = max(-(-items_left // req.paging.limit), 0)
+
+        if req.paging.max_pages > 0:
+            pages = min(pages, req.paging.max_pages - 1)
 
-        if page_next is False:
-            raise _PagedHalt("Stop")
+        return pages
 
     @staticmethod
-    def paged(offset: int = 0, limit: int = 50, max_pages: int = -1) -> Callable:
+    def paged(
+        offset: int = 0,
+        limit: int = 50,
+        max_pages: int = -1,
+        prefetch: int = 0,
+        fan_out: int = 0,
+        ordered: bool = True,
+    ) -> Callable:
         """
         Turns method into an async generator to seamlessly handle paged responses.
 
         :param offset: Beginning offset to use.
         :param limit: Default limit to use.
         :param max_pages: Maximum number of pages to return when called.
+        :param prefetch: Number of upcoming pages to keep in-flight while the current
+            page is being consumed. ``0`` fetches each page only once the previous one
+            has been fully consumed.
+        :param fan_out: If the first response reports a ``'paging-total-items'``
+            header, fetch every remaining page up front, with up to ``fan_out`` requests
+            in-flight at once. ``0`` disables fan-out.
+        :param ordered: Whether fanned-out pages are yielded in offset order. If
+            ``False``, items are yielded page-by-page in the order pages arrive.
         :return: Wrapped function.
 
         THIS METHOD MUST BE USED ON TOP OF A GENERIC ``handles`` decorator.
+
+        Prefetched pages are requested at offsets computed from the limit used by the
+        first page, so the handler should use the same ``req.paging.limit`` for every
+        page of a call. Prefetched pages past the point where paging halts are
+        cancelled or discarded.
+
+        When fanning out, the number of pages comes from the reported total (capped by
+        ``max_pages``), so ``'paging-next'`` is not checked after the first page. A
+        fanned-out page that reports :class:`errors_api.NothingToReturnError` is treated
+        as empty, since the collection may have shrunk while paging.
         """
 
         def decorator(handler: Callable) -> Callable:
             @functools.wraps(handler)
-            async def wrapper(
+            def wrapper(
                 client: "SpanClient", *args: Any, **kwargs: Any
             ) -> AsyncGenerator:
+                fetcher = _PagedFetcher(
+                    client=client,
+                    handler=handler,
+                    args=args,
+                    kwargs=kwargs,
+                    limit=limit,
+                    max_pages=max_pages,
+                    ordered=ordered,
+                )
+                return fetcher.iter_items(
+                    offset=offset, prefetch=prefetch, fan_out=fan_out
+                )
 
-                offset_param = offset
-                pages_fetched = 0
+            return wrapper
 
-                while True:
-                    req = EndpointWrapper._paged_init_req(
-                        client,
-                        offset_param,
-                        limit,
-                        max_pages,
-                        page_to_fetch=pages_fetched + 1,
-                    )
-                    kwargs["req"] = req
+        return decorator
 
-                    try:
-                        result = await handler(client, *args, **kwargs)
-                    except NothingToReturnError:
-                        break
+    @staticmethod
+    def cached(
+        ttl: float,
+        maxsize: int = 1024,
+        negative_ttl: float = 0,
+        stale_while_revalidate: float = 0,
+    ) -> Callable:
+        """
+        Memoizes the results of a GET endpoint, by client instance, request url and
+        headers, which include the path params, query params and projection. Results
+        are shared by every caller of a client, so treat them as read-only, or set
+        ``req.update_obj`` to have a copy written into your own object. They are
+        dropped when the client is closed.
+
+        :param ttl: Seconds a result is returned for without a request.
+        :param maxsize: Maximum number of results to hold. The least recently used are
+            evicted first.
+        :param negative_ttl: Seconds to keep raising a
+            :class:`errors_api.NothingToReturnError` or ``404``
+            :class:`StatusMismatchError` for without a request. ``0`` disables negative
+            caching.
+        :param stale_while_revalidate: Seconds past expiry a result is still returned
+            for, while a background request refreshes it.
+        :return: Method decorator.
 
-                    try:
-                        for item in EndpointWrapper._paged_yield_result_items(result):
-                            yield item
-                    except _PagedHalt:
-                        break
+        THIS METHOD MUST BE USED ON TOP OF A ``handles.get`` decorator.
 
-                    pages_fetched += 1
-                    if pages_fetched == req.paging.max_pages:
-                        break
+        The results are available on the decorated method as an :class:`EndpointMemo`,
+        ie: ``APIClient.name_fetch.memo``.
+        """
+
+        def decorator(endpoint: Callable) -> Callable:
+            settings: Optional[_EndpointSettings]
+            settings = getattr(endpoint, "_endpoint_settings", None)
+            if settings is None or settings.method.lower() != "get":
+                raise TypeError("handles.cached must be used on top of handles.get")
+
+            settings.memo = EndpointMemo(
+                ttl=ttl,
+                maxsize=maxsize,
+                negative_ttl=negative_ttl,
+                stale_while_revalidate=stale_while_revalidate,
+            )
+            endpoint.memo = settings.memo  # type: ignore
+            return endpoint
+
+        return decorator
 
-                    offset_param += req.paging.limit
+    @staticmethod
+    def stream(
+        frames: str = "ndjson", read_timeout: Optional[float] = STREAM_READ_TIMEOUT
+    ) -> Callable:
+        """
+        Turns method into an async generator that yields the records of a long-lived
+        streaming response as they arrive.
+
+        :param frames: How records are framed in the response body. ``'ndjson'`` for
+            newline-delimited JSON, ``'sse'`` for server-sent events with JSON
+            ``data:`` payloads, ``'raw'`` for the undecoded body in chunks of up to
+            ``STREAM_CHUNK_SIZE`` bytes, to relay it to another writer.
+        :param read_timeout: Seconds the response may go without receiving data.
+            ``None`` to wait forever. The stream itself has no time limit, unlike
+            other requests of the session.
+        :return: Wrapped function.
+
+        THIS METHOD MUST BE USED ON TOP OF A GENERIC ``handles`` decorator.
+
+        Each record is decoded and loaded through the endpoint's ``resp_schema``, so
+        only one record is held in memory at a time. Raw chunks are yielded as-is. The
+        response is released once the stream ends or the generator is closed.
+        """
+        if frames not in STREAM_FRAMES:
+            raise ValueError(
+                f"unknown stream frames '{frames}', expected one of: "
+                f"{', '.join(STREAM_FRAMES)}"
+            )
+
+        timeout = ClientTimeout(total=None, sock_read=read_timeout)
+
+        def decorator(handler: Callable) -> Callable:
+            @functools.wraps(handler)
+            async def wrapper(
+                client: "SpanClient", *args: Any, **kwargs: Any
+            ) -> AsyncGenerator:
+                req = ClientRequest(client, None)  # type: ignore
+                req._stream_frames = frames
+                req._stream_timeout = timeout
+                if frames in _STREAM_ACCEPT:
+                    req.headers["Accept"] = _STREAM_ACCEPT[frames]
+                req.return_info = True
+                kwargs["req"] = req
+
+                result = await handler(client, *args, **kwargs)
+                if isinstance(result, ResponseData):
+                    result = result.loaded
+
+                try:
+                    async for record in result:
+                        yield record
+                finally:
+                    aclose = getattr(result, "aclose", None)
+                    if aclose is not None:
+                        await aclose()
 
             return wrapper
 
         return decorator
 
 
+class _PagedFetcher:
+    """
+    Schedules page requests for a single call of a :func:`EndpointWrapper.paged`
+    method. Each page runs in its own task so that several can be in-flight at once.
+    """
+
+    def __init__(
+        self,
+        client: "SpanClient",
+        handler: Callable,
+        args: Sequence[Any],
+        kwargs: MutableMapping[str, Any],
+        limit: int,
+        max_pages: int,
+        ordered: bool,
+    ) -> None:
+        self.client: "SpanClient" = client
+        self.handler: Callable = handler
+        self.args: Sequence[Any] = args
+        self.kwargs: MutableMapping[str, Any] = kwargs
+        self.limit: int = limit
+        self.max_pages: int = max_pages
+        self.ordered: bool = ordered
+        """Whether fanned-out pages are yielded in offset order."""
+
+        self.scheduled: int = 0
+        """Number of pages scheduled so far."""
+        self.pending: Deque[Tuple[ClientRequest, int, asyncio.Future]] = deque()
+        """Scheduled pages in offset order: ``(req, offset, task)``."""
+
+    async def _fetch(self, req: ClientRequest) -> Any:
+        # Each page gets its own kwargs so concurrent pages do not share a request.
+        kwargs = dict(self.kwargs)
+        kwargs["req"] = req
+        return await self.handler(self.client, *self.args, **kwargs)
+
+    def schedule(self, offset: int) -> None:
+        """Start fetching the page at ``offset``."""
+        self.scheduled += 1
+        req = EndpointWrapper._paged_init_req(
+            self.client,
+            offset,
+            self.limit,
+            self.max_pages,
+            page_to_fetch=self.scheduled,
+        )
+        task = asyncio.ensure_future(self._fetch(req))
+        self.pending.append((req, offset, task))
+
+    async def next_page(self, ordered: bool = True) -> Tuple[ClientRequest, int, Any]:
+        """
+        Wait for the earliest scheduled page, or for whichever page finishes first if
+        not ``ordered``, and return ``(req, offset, result)``.
+        """
+        if not ordered:
+            await asyncio.wait(
+                [task for _, _, task in self.pending],
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            # Rotate the first finished page to the front.
+            while not self.pending[0][2].done():
+                self.pending.rotate(-1)
+
+        req, offset, task = self.pending.popleft()
+        return req, offset, await task
+
+    async def iter_items(
+        self, offset: int, prefetch: int, fan_out: int
+    ) -> AsyncGenerator:
+        """Yield the items of every page, keeping ``prefetch`` pages in-flight."""
+        self.schedule(offset)
+        pages_fetched = 0
+
+        try:
+            while self.pending:
+                try:
+                    req, page_offset, result = await self.next_page()
+                except NothingToReturnError:
+                    break
+
+                pages_fetched += 1
+                items, page_next = EndpointWrapper._paged_result_items(result)
+                last_page = not page_next or pages_fetched == req.paging.max_pages
+
+                # Schedule upcoming pages, fanned-out ones included, BEFORE handing
+                # items to the consumer so the requests run while they are processed.
+                fanned = None
+                if not last_page:
+                    fanned = self._schedule_ahead(
+                        req, page_offset, result, pages_fetched == 1, prefetch, fan_out
+                    )
+
+                for item in items:
+                    yield item
+
+                if fanned is not None:
+                    async for item in fanned:
+                        yield item
+                    break
+
+                if last_page:
+                    break
+
+                # Without prefetching, the next page is only requested now.
+                self._top_up(req, page_offset, 1)
+        finally:
+            await self.cancel()
+
+    def _top_up(self, req: ClientRequest, page_offset: int, depth: int) -> None:
+        """
+        Schedule pages after the latest scheduled one until ``depth`` pages are
+        in-flight. Offsets advance by the limit ``req`` was fetched with.
+        """
+        while len(self.pending) < depth and self.scheduled != req.paging.max_pages:
+            last_offset = self.pending[-1][1] if self.pending else page_offset
+            self.schedule(last_offset + req.paging.limit)
+
+    def _schedule_ahead(
+        self,
+        req: ClientRequest,
+        page_offset: int,
+        result: Any,
+        first_page: bool,
+        prefetch: int,
+        fan_out: int,
+    ) -> Optional[AsyncGenerator]:
+        """
+        Schedules the pages to fetch while ``result`` is consumed. If fan-out is enabled
+        and the first page reports the total number of items, returns an iterator over
+        the items of all remaining pages instead.
+        """
+        if first_page and fan_out:
+            remaining = EndpointWrapper._paged_remaining_pages(req, result)
+            if remaining is not None:
+                limit = req.paging.limit
+                start = page_offset + limit
+                offsets = iter(range(start, start + limit * remaining, limit))
+
+                for next_offset in offsets:
+                    self.schedule(next_offset)
+                    if len(self.pending) == fan_out:
+                        break
+                return self._iter_fan_out(offsets)
+
+        self._top_up(req, page_offset, prefetch)
+        return None
+
+    async def _iter_fan_out(self, offsets: Iterator[int]) -> AsyncGenerator:
+        """
+        Yield the items of the pages already scheduled, then of the pages at
+        ``offsets``, keeping as many in-flight as were scheduled.
+        """
+        while self.pending:
+            try:
+                _, _, result = await self.next_page(ordered=self.ordered)
+            except NothingToReturnError:
+                result = []
+
+            # Refill the slot this page freed before handing over its items.
+            for page_offset in offsets:
+                self.schedule(page_offset)
+                break
+
+            items, _ = EndpointWrapper._paged_result_items(result)
+            for item in items:
+                yield item
+
+    async def cancel(self) -> None:
+        """Cancel all in-flight pages and wait for them to wind down."""
+        tasks: List[asyncio.Future] = [task for _, _, task in self.pending]
+        self.pending.clear()
+
+        for task in tasks:
+            task.cancel()
+
+        # Gathering retrieves exceptions of pages that already finished so they are not
+        # reported as never retrieved.
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
 typing_help = False
 if typing_help:
     from ._client import SpanClient
@@ -1,29 +1,50 @@
-import gemma
+import asyncio
+import functools
+import weakref
+from concurrent.futures import Executor
+from contextlib import contextmanager
 from marshmallow import Schema
 from aiohttp import ClientResponse
-from typing import Union, Tuple, Optional, Dict, Callable, Any, AsyncGenerator, Type
+from typing import (
+    Union,
+    Tuple,
+    Optional,
+    Dict,
+    Callable,
+    Any,
+    AsyncGenerator,
+    Iterator,
+    Type,
+)
 
 from spantools import (
     MimeType,
     decode_content,
     NoErrorReturnedError,
+    InvalidAPIErrorCodeError,
     Error,
+    SpanError,
     ContentDecodeError as ContentDecodeBase,
     ContentTypeUnknownError as ContentTypeUnknownBase,
     DecoderIndexType,
     DEFAULT_DECODERS,
 )
-from spantools.errors_api import APIError, NothingToReturnError
+from spantools.errors_api import APIError, NothingToReturnError, ERRORS_INDEXED
 
 from ._typing import ModelType
-from ._response_data import ResponseData
+from ._response_data import ResponseData, RawBody
+from ._codecs import DecoderIndex, DecodeStats
+from ._updaters import default_updater, update_collection
+from ._streaming import iter_json_array, STREAM_CHUNK_SIZE, STREAM_FRAMES
 from ._client import ClientSession
 from .test_utils import StatusMismatchError, ContentDecodeError, ContentTypeUnknownError
 
 
-# GEMMA CACHED OBJECTS
-DEFAULT_SURVEYOR = gemma.Surveyor()
-DEFAULT_CARTOGRAPHER = gemma.Cartographer()
+DECODE_OFFLOAD_BYTES: int = 2 ** 20
+"""Default size from which response bodies are decoded in an executor, if given."""
+
+_ERROR_CODE_HEADER = "error-code"
+"""Header every error reported by a spanreed service has."""
 
 
 def _check_status_code(
@@ -42,21 +63,200 @@ def _check_status_code(
         )
 
 
-def _default_updater(current: Any, new: Any) -> None:
-    DEFAULT_CARTOGRAPHER.map(new, current, surveyor=DEFAULT_SURVEYOR)
+def _api_error(
+    error: Error, api_errors_additional: Optional[Dict[int, Type[APIError]]]
+) -> APIError:
+    """
+    Like ``Error.to_exception``, but without merging every known error class into
+    ``api_errors_additional`` for each error. Built-in error classes take precedence.
+
+    :raises InvalidAPIErrorCodeError: If no error class has the error's code.
+    """
+    error_class = ERRORS_INDEXED.get(error.code)
+    if error_class is None and api_errors_additional is not None:
+        error_class = api_errors_additional.get(error.code)
+    if error_class is None:
+        raise InvalidAPIErrorCodeError(
+            f"Error class with code {error.code} not supplied."
+        )
+
+    return error_class(error.message, error_data=error.data, error_id=error.id)
+
+
+def _check_response(
+    response: ClientResponse,
+    valid_status_codes: Union[int, Tuple[int, ...]],
+    api_errors_additional: Optional[Dict[int, Type[APIError]]],
+) -> None:
+    """Raises errors reported in the response headers, then checks the status."""
+    # Error headers are only parsed when there are some, so successful responses skip
+    # building and catching a NoErrorReturnedError.
+    if _ERROR_CODE_HEADER in response.headers:
+        try:
+            error = Error.from_headers(response.headers)
+        except NoErrorReturnedError:
+            pass
+        else:
+            raise _api_error(error, api_errors_additional)
+
+    _check_status_code(
+        received_code=response.status,
+        valid_status_codes=valid_status_codes,
+        response=response,
+    )
+
+
+def _decode_content(
+    content: bytes,
+    mimetype: Optional[MimeType],
+    data_schema: Optional[Union[Schema, MimeType]],
+    decoders: DecoderIndexType,
+) -> Tuple[Any, Any]:
+    # Module-level so it can be sent to a process pool.
+    return decode_content(
+        content=content,
+        mimetype=mimetype,
+        data_schema=data_schema,
+        allow_sniff=True,
+        decoders=decoders,
+    )
+
+
+@contextmanager
+def _decode_errors(response: ClientResponse) -> Iterator[None]:
+    """Re-raises content errors as their client versions, with the response."""
+    try:
+        yield
+    except ContentDecodeBase as error:
+        raise ContentDecodeError(str(error), response=response)
+    except ContentTypeUnknownBase as error:
+        raise ContentTypeUnknownError(str(error), response=response)
+
+
+def _decode_body(
+    response: ClientResponse,
+    content: bytes,
+    decoders: DecoderIndexType,
+    decode_stats: Optional[DecodeStats] = None,
+) -> Any:
+    """
+    Decodes ``content`` without loading it. ``decode_stats`` decodes bodies without a
+    ``'Content-Type'`` header, if passed.
+    """
+    content_type = response.headers.get("Content-Type")
+    if content and content_type is None and decode_stats is not None:
+        with _decode_errors(response):
+            return decode_stats.decode(content, decoders)
+
+    if content and isinstance(decoders, DecoderIndex):
+        mimetype, decoder = decoders.for_content_type(content_type)
+        if decoder is not None:
+            try:
+                return decoder(content)
+            except BaseException:
+                raise ContentDecodeError(
+                    f"Error occurred while decoding content as {mimetype}",
+                    response=response,
+                )
+
+    # No known mimetype: let spantools sniff the content or report the error.
+    with _decode_errors(response):
+        _, decoded = _decode_content(
+            content, MimeType.from_headers(response.headers), None, decoders
+        )
+    return decoded
+
+
+def _decode_response(
+    response: ClientResponse,
+    content: bytes,
+    data_schema: Optional[Union[Schema, MimeType]],
+    decoders: DecoderIndexType,
+    decode_stats: Optional[DecodeStats],
+) -> ResponseData:
+    """Decodes ``content``, leaving the ``data_schema`` load until it is needed."""
+    decoded = _decode_body(response, content, decoders, decode_stats)
+    if data_schema is None:
+        return ResponseData(resp=response, loaded=decoded, decoded=decoded)
+
+    load = functools.partial(data_schema.load, decoded)
+    return ResponseData.deferred(resp=response, decoded=decoded, load=load)
+
+
+async def _decode_response_aio(
+    response: ClientResponse,
+    content: bytes,
+    data_schema: Optional[Union[Schema, MimeType]],
+    decoders: DecoderIndexType,
+    executor: Optional[Executor],
+    offload_bytes: int,
+    decode_stats: Optional[DecodeStats],
+) -> ResponseData:
+    """
+    Decodes ``content``, leaving the ``data_schema`` load until ``ResponseData.loaded``
+    is first read.
+
+    Content of at least ``offload_bytes`` is instead decoded and loaded right away in
+    ``executor``, if passed, so neither blocks the event loop. Without a
+    ``'Content-Type'`` header, this needs a mimetype learned by ``decode_stats``:
+    sniffing tries every decoder, so it is never offloaded.
+    """
+    if executor is None or len(content) < offload_bytes:
+        return _decode_response(response, content, data_schema, decoders, decode_stats)
+
+    mimetype = MimeType.from_headers(response.headers)
+    learned_by = None
+    if mimetype is None and decode_stats is not None:
+        mimetype, learned_by = decode_stats.mimetype, decode_stats
+
+    if mimetype is None or mimetype not in decoders:
+        return _decode_response(response, content, data_schema, decoders, decode_stats)
+
+    # Only the decoder that is needed is sent, so process pools do not have to pickle
+    # the others.
+    offloaded = {mimetype: decoders[mimetype]}
+
+    loop = asyncio.get_event_loop()
+    try:
+        with _decode_errors(response):
+            loaded, decoded = await loop.run_in_executor(
+                executor, _decode_content, content, mimetype, data_schema, offloaded
+            )
+    except ContentDecodeError:
+        if learned_by is None:
+            raise
+        # The body no longer matches the learned mimetype, so it is sniffed again.
+        return _decode_response(response, content, data_schema, decoders, decode_stats)
+
+    if learned_by is not None:
+        learned_by.learned += 1
+    return ResponseData(resp=response, loaded=loaded, decoded=decoded)
 
 
 def _update_data(
     current_data_object: ModelType,
     new_data_object: Any,
     object_updater: Optional[Callable[[ModelType, Any], None]] = None,
-) -> None:
-    """Updates current object in place with data from new object."""
+    current_data_key: Optional[str] = None,
+) -> Any:
+    """
+    Updates current object in place with data from new object, or each of a collection
+    of current objects with the matching record of a new page if ``current_data_key``
+    is given.
+
+    :return: The loaded data to hand back: ``current_data_object``, or the list from
+        :func:`update_collection`.
+    """
+    if current_data_key is not None:
+        return update_collection(
+            current_data_object, new_data_object, current_data_key, object_updater
+        )
 
     if object_updater is None:
-        object_updater = _default_updater
+        object_updater = default_updater
 
     object_updater(current_data_object, new_data_object)
+    return current_data_object
 
 
 async def handle_response_aio(
@@ -67,6 +267,11 @@ async def handle_response_aio(
     current_data_object: Optional[ModelType] = None,
     data_object_updater: Optional[Callable[[ModelType, Any], None]] = None,
     decoders: DecoderIndexType = DEFAULT_DECODERS,
+    decode_executor: Optional[Executor] = None,
+    decode_offload_bytes: int = DECODE_OFFLOAD_BYTES,
+    raw_body: bool = False,
+    decode_stats: Optional[DecodeStats] = None,
+    current_data_key: Optional[str] = None,
 ) -> ResponseData:
     """
     Examines response from SpanReed service and raises reported errors.
@@ -81,53 +286,237 @@ async def handle_response_aio(
     :param data_object_updater: Callable which takes args:
         (current_data_object, new_data_object). Used to update current_data_object
         in place of the default updater.
-
-    :return: Loaded data, raw data mapping (dict or bson record).
+    :param decoders: Decoders to use, by mimetype.
+    :param decode_executor: Thread or process pool to decode and load large bodies in.
+        For a process pool, ``data_schema`` and ``decoders`` must be picklable.
+    :param decode_offload_bytes: Bodies of at least this many bytes are decoded in
+        ``decode_executor``. Smaller bodies are decoded inline, as handing them off
+        costs more than it saves.
+    :param raw_body: Skip decoding. ``ResponseData.loaded`` is a :class:`RawBody` with
+        the body as received and its mimetype, and ``current_data_object`` is not
+        updated.
+    :param decode_stats: Learns the mimetype of bodies without a ``'Content-Type'``
+        header, so they are not sniffed every time.
+    :param current_data_key: Treat ``current_data_object`` as a collection of objects,
+        a mapping of key value to object or a list, and the response as a page of
+        records. Each record updates the object whose field of this name matches. See
+        :func:`update_collection`.
+
+    :return: Loaded data, raw data mapping (dict or bson record). The body is loaded
+        with ``data_schema`` when ``ResponseData.loaded`` is first read, unless it was
+        loaded in ``decode_executor`` or ``current_data_object`` was updated.
 
     :raises ResponseStatusError: If status code does match.
     :raises ContentTypeUnknownError: If content-type is not a type that is known.
-    :raises marshmallow.ValidationError: If data not consistent with schema.
+    :raises marshmallow.ValidationError: If data not consistent with schema. Raised
+        when ``ResponseData.loaded`` is first read if the load was deferred.
     """
 
-    # Try to raise error, catch if it does not exist.
-    try:
-        raise Error.from_headers(response.headers).to_exception(api_errors_additional)
-    except NoErrorReturnedError:
-        pass
-
-    _check_status_code(
-        received_code=response.status,
-        valid_status_codes=valid_status_codes,
-        response=response,
-    )
+    _check_response(response, valid_status_codes, api_errors_additional)
 
     content = await response.read()
 
+    if raw_body:
+        body = RawBody(
+            content=content, mimetype=MimeType.from_headers(response.headers)
+        )
+        return ResponseData(resp=response, loaded=body, decoded=None)
+
     if content or data_schema is not None:
-        try:
-            loaded_data, decoded_data = decode_content(
-                content=content,
-                mimetype=MimeType.from_headers(response.headers),
-                data_schema=data_schema,
-                allow_sniff=True,
-                decoders=decoders,
-            )
-        except ContentDecodeBase as error:
-            raise ContentDecodeError(str(error), response=response)
-        except ContentTypeUnknownBase as error:
-            raise ContentTypeUnknownError(str(error), response=response)
+        result = await _decode_response_aio(
+            response,
+            content,
+            data_schema=data_schema,
+            decoders=decoders,
+            executor=decode_executor,
+            offload_bytes=decode_offload_bytes,
+            decode_stats=decode_stats,
+        )
     else:
-        loaded_data, decoded_data = None, None
+        result = ResponseData(resp=response, loaded=None, decoded=None)
 
     if current_data_object is not None:
-        _update_data(
+        result.loaded = _update_data(
             current_data_object=current_data_object,
-            new_data_object=loaded_data,
+            new_data_object=result.loaded,
             object_updater=data_object_updater,
+            current_data_key=current_data_key,
         )
-        loaded_data = current_data_object
 
-    return ResponseData(resp=response, loaded=loaded_data, decoded=decoded_data)
+    return result
+
+
+async def _iter_decoded_items(
+    response: ClientResponse, data_schema: Optional[Schema], decoders: DecoderIndexType,
+) -> AsyncGenerator[Any, None]:
+    # Mimetypes other than JSON cannot be split up incrementally, so we fall back to
+    # decoding the full body.
+    content = await response.read()
+    if not content:
+        return
+
+    decoded = _decode_body(response, content, decoders=decoders)
+    if not isinstance(decoded, list):
+        decoded = [decoded]
+
+    for item in decoded:
+        if data_schema is not None:
+            item = data_schema.load(item, many=False)
+        yield item
+
+
+async def _iter_stream_items(
+    response: ClientResponse,
+    data_schema: Optional[Schema],
+    decoders: DecoderIndexType,
+    frames: str,
+) -> AsyncGenerator[Any, None]:
+    """Yields the loaded items of a response body, releasing it when done."""
+    if frames in STREAM_FRAMES:
+        chunks = response.content.iter_chunked(STREAM_CHUNK_SIZE)
+        items = STREAM_FRAMES[frames](chunks, data_schema, decoders)
+    elif MimeType.from_headers(response.headers) is MimeType.JSON:
+        chunks = response.content.iter_chunked(STREAM_CHUNK_SIZE)
+        items = iter_json_array(chunks, data_schema, decoders)
+    else:
+        items = _iter_decoded_items(response, data_schema, decoders)
+
+    try:
+        async for item in items:
+            yield item
+    except ValueError as error:
+        raise ContentDecodeError(str(error), response=response)
+    finally:
+        await items.aclose()
+        response.release()
+
+
+async def handle_response_stream_aio(
+    response: ClientResponse,
+    valid_status_codes: Union[int, Tuple[int, ...]] = 200,
+    data_schema: Optional[Schema] = None,
+    api_errors_additional: Optional[Dict[int, Type[APIError]]] = None,
+    decoders: DecoderIndexType = DEFAULT_DECODERS,
+    frames: str = "array",
+) -> ResponseData:
+    """
+    Like :func:`handle_response_aio`, but for responses with a JSON array body that
+    should not be read into memory all at once.
+
+    Errors and the status code are checked right away. The body is then decoded
+    incrementally by iterating over ``ResponseData.loaded``, an async iterator that
+    loads each element with ``data_schema`` (one element at a time, even if the schema
+    is declared with ``many=True``). ``ResponseData.decoded`` is ``None``.
+
+    Bodies of other mimetypes are read and decoded in full before being iterated over.
+
+    Pass ``frames="ndjson"`` for a body of newline-delimited JSON records, or
+    ``frames="sse"`` for server-sent events with JSON ``data:`` payloads. Records are
+    then yielded as their lines come in, regardless of the mimetype.
+
+    The response is released once the iterator is exhausted or closed, so callers must
+    iterate to the end or call its ``aclose()``. An iterator that is dropped early
+    only releases the response when it is garbage collected.
+
+    :raises ResponseStatusError: If status code does match.
+    :raises ContentDecodeError: While iterating, if the body is not a JSON array or a
+        record is not valid JSON.
+    :raises marshmallow.ValidationError: While iterating, if an item is not consistent
+        with the schema.
+    """
+    _check_response(response, valid_status_codes, api_errors_additional)
+
+    items = _iter_stream_items(
+        response, data_schema=data_schema, decoders=decoders, frames=frames
+    )
+    # The generator's own cleanup only runs if it was started, so a dropped iterator
+    # releases the response when it is collected instead.
+    weakref.finalize(items, response.release)
+    return ResponseData(resp=response, loaded=items, decoded=None)
+
+
+async def _iter_pages_aio(
+    session: ClientSession,
+    method: str,
+    url_base: str,
+    params: Dict[str, str],
+    headers: Dict[str, str],
+    json: Optional[dict],
+    data: Optional[Union[str, bytes]],
+    valid_status_codes: Union[int, Tuple[int, ...]],
+    data_schema: Optional[Union[Schema, MimeType]],
+) -> AsyncGenerator[ResponseData, None]:
+    """
+    Fetches pages one after the other, following ``'paging-next'``. Each response is
+    fully read and handed back to the connection pool before its page is yielded.
+    """
+    url: Optional[str] = url_base
+    url_params: Optional[Dict[str, str]] = params
+
+    while url is not None:
+        method_func = getattr(session, method)
+        request = method_func(
+            url, params=url_params, headers=headers, data=data, json=json
+        )
+
+        response: ClientResponse
+        async with request as response:
+            try:
+                page = await handle_response_aio(
+                    response,
+                    valid_status_codes=valid_status_codes,
+                    data_schema=data_schema,
+                )
+            except NothingToReturnError:
+                # It may be the case that resources were deleted or the total number
+                # / next page was not reported correctly. We break if a NothingToReturn
+                # error is sent back.
+                break
+
+        # The next page url already carries the paging params.
+        url = response.headers.get("paging-next")
+        url_params = None
+
+        yield page
+
+
+async def _read_ahead_pages(
+    pages: AsyncGenerator[ResponseData, None], queue: "asyncio.Queue[Any]"
+) -> None:
+    """Pumps ``pages`` into ``queue``. Ends with ``None`` or the error raised."""
+    try:
+        async for page in pages:
+            await queue.put(page)
+    except asyncio.CancelledError:
+        raise
+    except (Exception, SpanError) as error:
+        await queue.put(error)
+    else:
+        await queue.put(None)
+
+
+async def _iter_pages_read_ahead(
+    pages: AsyncGenerator[ResponseData, None], depth: int
+) -> AsyncGenerator[ResponseData, None]:
+    """
+    Yields from ``pages`` while a background task keeps fetching up to ``depth`` pages
+    ahead of the consumer.
+    """
+    queue: "asyncio.Queue[Any]" = asyncio.Queue(maxsize=depth)
+    producer = asyncio.ensure_future(_read_ahead_pages(pages, queue))
+
+    try:
+        while True:
+            page = await queue.get()
+            if page is None:
+                break
+            elif isinstance(page, BaseException):
+                raise page
+
+            yield page
+    finally:
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
 
 
 async def iter_paged_aio(
@@ -142,7 +531,9 @@ async def iter_paged_aio(
     data: Optional[Union[str, bytes]] = None,
     valid_status_codes: Union[int, Tuple[int, ...]] = 200,
     data_schema: Optional[Union[Schema, MimeType]] = None,
-) -> AsyncGenerator[ResponseData, None]:
+    prefetch: int = 1,
+    return_info: bool = True,
+) -> AsyncGenerator[Any, None]:
     """
     Handle paged responses. Automatically fetches paged until no more items returned.
 
@@ -157,6 +548,11 @@ async def iter_paged_aio(
     :param data: text or binary data to send with each request.
     :param valid_status_codes: Valid status codes for checking response.
     :param data_schema: Schema for loading returned data.
+    :param prefetch: Number of pages to fetch ahead of the one being consumed. ``0``
+        only requests the next page once the current one has been consumed.
+    :param return_info: Whether to yield a :class:`ResponseData` for every item. If
+        ``False``, only the loaded items are yielded, and nothing holds on to a page's
+        response once its items have been consumed.
 
     :return: loaded_obj, raw data mapping (dict or bson record).
     """
@@ -170,43 +566,31 @@ async def iter_paged_aio(
     params_start = {"paging-offset": str(offset_start), "paging-limit": str(limit)}
     params_start.update(params)
 
-    method_func = getattr(session, method)
-    response_future = method_func(
-        url_base, params=params_start, headers=headers, data=data, json=json
+    pages = _iter_pages_aio(
+        session,
+        method=method,
+        url_base=url_base,
+        params=params_start,
+        headers=headers,
+        json=json,
+        data=data,
+        valid_status_codes=valid_status_codes,
+        data_schema=data_schema,
     )
+    if prefetch > 0:
+        pages = _iter_pages_read_ahead(pages, depth=prefetch)
 
-    next_future = response_future
-
-    # next_future will be the request for the next page so long as a next page url is
-    # supplied in the response headers.
-    while next_future is not None:
-
-        response: ClientResponse
-        async with next_future as response:
-
-            next_page_url = response.headers.get("paging-next")
-            if next_page_url is not None:
-                method_func = getattr(session, method)
-                next_future = method_func(
-                    next_page_url, headers=headers, data=data, json=json
-                )
-            else:
-                next_future = None
-
-            try:
-                this_page = await handle_response_aio(
-                    response,
-                    valid_status_codes=valid_status_codes,
-                    data_schema=data_schema,
-                )
-            except NothingToReturnError:
-                # It may be the case that resources were deleted or the total number
-                # / next page was not reported correctly. We break if a NothingToReturn
-                # error is sent back.
-                break
-
-            for loaded_obj, decoded_obj in zip(this_page.loaded, this_page.decoded):
-                response_info = ResponseData(
-                    resp=response, loaded=loaded_obj, decoded=decoded_obj
+    try:
+        async for page in pages:
+            if not return_info:
+                for loaded_obj in page.loaded:
+                    yield loaded_obj
+                continue
+
+            for loaded_obj, decoded_obj in zip(page.loaded, page.decoded):
+                yield ResponseData(
+                    resp=page.resp, loaded=loaded_obj, decoded=decoded_obj
                 )
-                yield response_info
+    finally:
+        # Stops read-ahead right away if the consumer bails early.
+        await pages.aclose()
@@ -0,0 +1,194 @@
+import asyncio
+import functools
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Hashable, Union
+
+from spantools.errors_api import NothingToReturnError
+
+from ._response_data import ResponseData
+from .test_utils import StatusMismatchError
+
+
+FetchType = Callable[[], Awaitable[ResponseData]]
+
+
+def _is_negative(error: BaseException) -> bool:
+    """Whether ``error`` reports that there is nothing at the requested url."""
+    if isinstance(error, NothingToReturnError):
+        return True
+    return (
+        isinstance(error, StatusMismatchError)
+        and error.response is not None
+        and error.response.status == 404
+    )
+
+
+@dataclass
+class MemoEntry:
+    """Memoized result of an endpoint call."""
+
+    result: Union[ResponseData, BaseException]
+    """Handled response, or the error a negative result was reported with."""
+    expires: float
+    """Monotonic time until which the result is fresh."""
+    stale_until: float
+    """Monotonic time until which the result may be served while it is refreshed."""
+
+    def unwrap(self) -> ResponseData:
+        """Returns the result, or raises it if it is negative."""
+        if isinstance(self.result, BaseException):
+            raise self.result.with_traceback(None)
+        return self.result
+
+
+class EndpointMemo:
+    """
+    Results of an endpoint's GET requests, by request, set up with
+    :func:`EndpointWrapper.cached`. Available on decorated methods as ``memo``, ie:
+    ``APIClient.name_fetch.memo``.
+
+    Requests through the same client instance for the same url, with the same headers,
+    share a result. Identical requests that miss at the same time share one fetch. The
+    least recently used results are evicted once there are ``maxsize`` of them.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        maxsize: int = 1024,
+        negative_ttl: float = 0,
+        stale_while_revalidate: float = 0,
+    ) -> None:
+        """
+        :param ttl: Seconds a result is served for without a request.
+        :param maxsize: Maximum number of results to hold.
+        :param negative_ttl: Seconds a :class:`errors_api.NothingToReturnError` or a
+            ``404`` :class:`StatusMismatchError` is raised again for without a request.
+            ``0`` does not remember them.
+        :param stale_while_revalidate: Seconds past ``ttl`` (or ``negative_ttl``) a
+            result is still served for, while it is refreshed in the background.
+        """
+        self.ttl: float = ttl
+        self.maxsize: int = maxsize
+        self.negative_ttl: float = negative_ttl
+        self.stale_while_revalidate: float = stale_while_revalidate
+
+        self.hits: int = 0
+        """Number of calls served from a fresh result."""
+        self.stale_hits: int = 0
+        """Number of calls served from a stale result while it was refreshed."""
+        self.misses: int = 0
+        """Number of calls that had to wait on a request."""
+
+        self._entries: "OrderedDict[Hashable, MemoEntry]" = OrderedDict()
+        self._refreshing: Dict[Hashable, asyncio.Future] = dict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: Hashable, fetch: FetchType) -> ResponseData:
+        """
+        Returns the result for ``key``, calling ``fetch`` if there is no fresh one.
+
+        :raises errors_api.NothingToReturnError: If the result is negative.
+        :raises StatusMismatchError: If the result is negative.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            now = time.monotonic()
+            if now < entry.expires:
+                self.hits += 1
+                return entry.unwrap()
+            if now < entry.stale_until:
+                self.stale_hits += 1
+                self._refresh(key, fetch)
+                return entry.unwrap()
+
+        self.misses += 1
+        # Shielded so that a caller being cancelled does not cancel the fetch for the
+        # other callers.
+        return await asyncio.shield(self._refresh(key, fetch))
+
+    def _refresh(self, key: Hashable, fetch: FetchType) -> asyncio.Future:
+        """Fetches the result for ``key``, unless it is already being fetched."""
+        refreshing = self._refreshing.get(key)
+        if refreshing is None:
+            refreshing = asyncio.ensure_future(self._fetch(key, fetch))
+            self._refreshing[key] = refreshing
+            refreshing.add_done_callback(functools.partial(self._refreshed, key))
+        return refreshing
+
+    def _refreshed(self, key: Hashable, future: asyncio.Future) -> None:
+        if self._refreshing.get(key) is future:
+            del self._refreshing[key]
+
+        # Mark the error as retrieved, in case nobody waited on a background refresh.
+        if not future.cancelled():
+            future.exception()
+
+    async def _fetch(self, key: Hashable, fetch: FetchType) -> ResponseData:
+        try:
+            result = await fetch()
+        except BaseException as error:
+            if self.negative_ttl and _is_negative(error) and self._current(key):
+                self._store(key, error, self.negative_ttl)
+            raise
+
+        if self._current(key):
+            self._store(key, result, self.ttl)
+        return result
+
+    def _current(self, key: Hashable) -> bool:
+        """
+        Whether the running fetch for ``key`` has not been discarded since it started,
+        so its result may be stored.
+        """
+        return self._refreshing.get(key) is asyncio.current_task()
+
+    def _store(
+        self, key: Hashable, result: Union[ResponseData, BaseException], ttl: float
+    ) -> None:
+        expires = time.monotonic() + ttl
+        self._entries[key] = MemoEntry(
+            result=result,
+            expires=expires,
+            stale_until=expires + self.stale_while_revalidate,
+        )
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def discard(self, key: Hashable) -> None:
+        """
+        Removes the result for ``key`` if there is one. A fetch for ``key`` that is
+        in-flight still returns its result to its callers, but does not store it.
+        """
+        self._refreshing.pop(key, None)
+        self._entries.pop(key, None)
+
+    def discard_matching(self, predicate: Callable[[Hashable], bool]) -> int:
+        """
+        Removes the results whose key ``predicate`` returns ``True`` for, like
+        :func:`EndpointMemo.discard`.
+
+        :return: Number of results removed.
+        """
+        for key in [key for key in self._refreshing if predicate(key)]:
+            del self._refreshing[key]
+
+        keys = [key for key in self._entries if predicate(key)]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+    def clear(self) -> None:
+        """
+        Removes all results. Fetches that are in-flight still return their results to
+        their callers, but do not store them.
+        """
+        self._refreshing.clear()
+        self._entries.clear()
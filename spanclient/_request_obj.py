@@ -1,17 +1,30 @@
+import asyncio
 import copy
-from dataclasses import dataclass, field
-from typing import Dict, Optional, Any, Union
+import functools
+from aiohttp import ClientResponse, ClientTimeout
+from yarl import URL
+from dataclasses import dataclass
+from typing import Dict, Optional, Any, Union, Hashable, MutableMapping, Set
 
 from spantools import (
     encode_content,
     MimeType,
     convert_params_headers,
     PagingReq,
+    SpanError,
     ContentTypeUnknownError as ContentTypeUnknownBase,
 )
 
-from ._handle_responses import handle_response_aio
+from ._handle_responses import (
+    handle_response_aio,
+    handle_response_stream_aio,
+    _update_data,
+)
 from ._response_data import ResponseData
+from ._cache import CacheEntry, ResponseCache
+from ._disk_cache import DiskCache
+from ._templates import RequestTemplate
+from ._streaming import encode_stream, is_stream_media
 from .test_utils import ContentTypeUnknownError
 
 
@@ -30,41 +43,122 @@ class PagingReqClient(PagingReq):
     """Where to start the offset from if not defined in the decorator."""
 
 
-@dataclass
+@dataclass(init=False)
 class ClientRequest:
+    __slots__ = (
+        "client",
+        "_settings",
+        "path_params",
+        "query_params",
+        "projection",
+        "headers",
+        "media",
+        "mimetype_send",
+        "mimetype_accept",
+        "update_obj",
+        "executed",
+        "return_info",
+        "_paging",
+        "_stream_frames",
+        "_stream_timeout",
+        "_settings_copied",
+    )
+
     client: "SpanClient"
     """The aiohttp.ClientSession to execute the request with"""
-    endpoint_settings: "_EndpointSettings"
-    """Endpoint params for the endpoint of the request."""
-    path_params: Dict[str, Any] = field(default_factory=dict)
+    _settings: "_EndpointSettings"
+    """
+    Endpoint params for the endpoint of the request. Shared with the endpoint until
+    accessed through ``endpoint_settings``.
+    """
+    path_params: Dict[str, Any]
     """Keyword values for endpoint pattern."""
-    query_params: Dict[str, Any] = field(default_factory=dict)
+    query_params: Dict[str, Any]
     """Additional params to add to this request url."""
-    projection: Dict[str, int] = field(default_factory=dict)
+    projection: Dict[str, int]
     """
     Projection settings for response body trimming. Added to query params with
     ``'project.{value}'`` prefix.
     """
-    headers: Dict[str, Any] = field(default_factory=dict)
+    headers: Dict[str, Any]
     """Additional HTTP headers to send with this request."""
-    media: Optional[Dict[str, Any]] = None
-    """Media data to be serialized for send."""
-    mimetype_send: Optional[Union[MimeType, str]] = None
+    media: Any
+    """
+    Media data to be serialized for send. An async iterable of records is encoded and
+    sent incrementally, as is a list if the endpoint sets ``stream_media``.
+    """
+    mimetype_send: Optional[Union[MimeType, str]]
     """Mimetype value to use on request."""
-    mimetype_accept: Optional[Union[MimeType, str]] = None
+    mimetype_accept: Optional[Union[MimeType, str]]
     """Mimetype value to use on request."""
-    update_obj: Optional[Any] = None
+    update_obj: Optional[Any]
     """
     Current object which represents response payload. Will be updated in-place with
-    response data.
+    response data. If the endpoint sets ``update_key``, a mapping of key value to object
+    or a list of the objects a response page may update.
     """
-    executed: bool = False
+    executed: bool
     """Whether this request has been executed."""
-    return_info: Optional[bool] = None
+    return_info: Optional[bool]
     """
     Whether to return full info instead of loaded / decoded body.
     """
-    _paging: Optional[PagingReqClient] = None
+    _paging: Optional[PagingReqClient]
+    _stream_frames: Optional[str]
+    _stream_timeout: Optional[ClientTimeout]
+    """Timeout to send the request with instead of the session's."""
+    _settings_copied: bool
+
+    def __init__(
+        self,
+        client: "SpanClient",
+        endpoint_settings: "_EndpointSettings",
+        path_params: Optional[Dict[str, Any]] = None,
+        query_params: Optional[Dict[str, Any]] = None,
+        projection: Optional[Dict[str, int]] = None,
+        headers: Optional[Dict[str, Any]] = None,
+        media: Any = None,
+        mimetype_send: Optional[Union[MimeType, str]] = None,
+        mimetype_accept: Optional[Union[MimeType, str]] = None,
+        update_obj: Optional[Any] = None,
+        executed: bool = False,
+        return_info: Optional[bool] = None,
+        _paging: Optional[PagingReqClient] = None,
+        _stream_frames: Optional[str] = None,
+        _stream_timeout: Optional[ClientTimeout] = None,
+    ) -> None:
+        self.client = client
+        self._settings = endpoint_settings
+        self._settings_copied = False
+        self.path_params = dict() if path_params is None else path_params
+        self.query_params = dict() if query_params is None else query_params
+        self.projection = dict() if projection is None else projection
+        self.headers = dict() if headers is None else headers
+        self.media = media
+        self.mimetype_send = mimetype_send
+        self.mimetype_accept = mimetype_accept
+        self.update_obj = update_obj
+        self.executed = executed
+        self.return_info = return_info
+        self._paging = _paging
+        self._stream_frames = _stream_frames
+        self._stream_timeout = _stream_timeout
+
+    @property
+    def endpoint_settings(self) -> "_EndpointSettings":
+        """
+        Endpoint params for the endpoint of the request. Copied from the endpoint on
+        first access, so that a handler changing them only changes this request.
+        """
+        if not self._settings_copied:
+            self._settings = self._settings.copy()
+            self._settings_copied = True
+        return self._settings
+
+    @endpoint_settings.setter
+    def endpoint_settings(self, value: "_EndpointSettings") -> None:
+        self._settings = value
+        self._settings_copied = False
 
     @property
     def paging(self) -> PagingReqClient:
@@ -76,61 +170,427 @@ class ClientRequest:
     async def execute(self) -> ResponseData:
         """
         Executes request and handles response from spanreed endpoint.
+
+        If the endpoint streams its items, ``ResponseData.loaded`` is an async iterator
+        over them. See :func:`handle_response_stream_aio`.
         """
-        params = copy.copy(self.endpoint_settings.query_params)
-        params.update(self.query_params)
+        template = self._template()
+
+        params = dict(self.query_params)
         for key, value in self.projection.items():
             params["project." + key] = str(value)
-        convert_params_headers(params)
+        if params:
+            convert_params_headers(params)
 
         if self._paging is not None:
             self._paging.offset += self._paging.offset_start
             params["paging-offset"] = str(self._paging.offset)
             params["paging-limit"] = str(self._paging.limit)
 
-        headers = copy.copy(self.endpoint_settings.headers)
-        headers.update(self.headers)
-        convert_params_headers(self.headers)
+        url = template.url(self.path_params, params)
+        headers = template.request_headers(self.headers)
 
-        if self.mimetype_accept is not None:
-            headers["Accept"] = MimeType.to_string(self.mimetype_accept)
+        data = self._encode_media(headers)
 
-        base_url = (
-            f"{self.client.protocol}://{self.client.host_name}"
-            f"{self.endpoint_settings.endpoint}"
-        )
-        url = base_url.format(**self.path_params)
+        # allow for method to be passed in caps.
+        method = self._settings.method.lower()
 
-        req_schema = self.endpoint_settings.req_schema
+        if self._coalesces(method) or self._caches(method) or self._memoizes(method):
+            result = await self._execute_shared(method, url, headers)
+        else:
+            method_func = getattr(self.client.session, method)
+            if self._stream_timeout is None:
+                response = await method_func(url=url, headers=headers, data=data)
+            else:
+                response = await method_func(
+                    url=url, headers=headers, data=data, timeout=self._stream_timeout
+                )
+            self.executed = True
+            result = await self._handle_response(response, self.update_obj)
 
-        try:
-            data = encode_content(
-                content=self.media,
-                mimetype=self.mimetype_send,
-                headers=headers,
-                data_schema=req_schema,
-                encoders=self.client._ENCODERS,
+        await self._invalidate(method, template)
+        return result
+
+    def _template(self) -> RequestTemplate:
+        """
+        Returns the client's compiled template for this request's endpoint, compiling
+        it if needed.
+        """
+        settings = self._settings
+        templates = self.client._templates
+
+        template = templates.get(settings.template_key)
+        if template is None or not template.matches(
+            self.client, settings, self.mimetype_accept
+        ):
+            template = RequestTemplate.compile(
+                self.client, settings, self.mimetype_accept
             )
+            templates[settings.template_key] = template
+
+        return template
+
+    def _encode_media(self, headers: MutableMapping[str, str]) -> Any:
+        if self.media is None:
+            return b""
+
+        req_schema = self._settings.req_schema
+
+        stream_media = is_stream_media(self.media) or (
+            self._settings.stream_media and isinstance(self.media, list)
+        )
+
+        try:
+            if stream_media:
+                return encode_stream(
+                    self.media,
+                    mimetype=self.mimetype_send,
+                    headers=headers,
+                    data_schema=req_schema,
+                    encoders=self.client.codecs.encoders,
+                )
+            else:
+                return encode_content(
+                    content=self.media,
+                    mimetype=self.mimetype_send,
+                    headers=headers,
+                    data_schema=req_schema,
+                    encoders=self.client.codecs.encoders,
+                )
         except ContentTypeUnknownBase as error:
             raise ContentTypeUnknownError(str(error), response=None)
 
-        # allow for method to be passed in caps.
-        method = self.endpoint_settings.method.lower()
-        method_func = getattr(self.client.session, method)
+    def _stream_frames_used(self) -> Optional[str]:
+        frames = self._stream_frames
+        if frames is None and self._settings.stream_items:
+            frames = "array"
+        return frames
 
-        response = await method_func(url=url, params=params, headers=headers, data=data)
+    async def _handle_response(
+        self, response: ClientResponse, update_obj: Optional[Any]
+    ) -> ResponseData:
+        frames = self._stream_frames_used()
 
-        self.executed = True
+        if frames is not None:
+            return await handle_response_stream_aio(
+                response=response,
+                valid_status_codes=self._settings.resp_codes,
+                data_schema=self._settings.resp_schema,
+                api_errors_additional=self.client.api_error_index,
+                decoders=self.client.codecs.decoders,
+                frames=frames,
+            )
 
         return await handle_response_aio(
             response=response,
-            valid_status_codes=self.endpoint_settings.resp_codes,
-            data_schema=self.endpoint_settings.resp_schema,
+            valid_status_codes=self._settings.resp_codes,
+            data_schema=self._settings.resp_schema,
             api_errors_additional=self.client.api_error_index,
+            current_data_object=update_obj,
+            data_object_updater=self._settings.data_updater,
+            current_data_key=self._settings.update_key,
+            decoders=self.client.codecs.decoders,
+            decode_executor=self.client.decode_executor,
+            decode_offload_bytes=self.client.DECODE_OFFLOAD_BYTES,
+            raw_body=self._settings.raw_body,
+            decode_stats=self._settings.decode_stats,
+        )
+
+    async def _invalidate(self, method: str, template: RequestTemplate) -> None:
+        """
+        Evicts the cached responses and memoized results this request has made stale.
+        """
+        urls = self._invalidated_urls(method, template)
+        if not urls:
+            return
+
+        def stale(key: Hashable) -> bool:
+            # Shared keys start with the method and the request url.
+            return key[1].partition("?")[0].rstrip("/") in urls  # type: ignore
+
+        for memo in self.client._memos:
+            memo.discard_matching(stale)
+
+        cache = self.client.cache
+        if cache is not None:
+            cache.discard_matching(stale)
+            if cache.disk is not None:
+                await cache.disk.discard_urls(urls)
+
+    def _invalidated_urls(self, method: str, template: RequestTemplate) -> Set[str]:
+        """
+        URLs, without a query string or trailing slash, of the endpoint's
+        ``invalidates`` patterns and, for mutating methods, of the request's path and
+        its parent.
+        """
+        settings = self._settings
+        endpoints = list(settings.invalidates)
+        if method in _INVALIDATING_METHODS:
+            endpoint = settings.endpoint.rstrip("/")
+            endpoints.append(endpoint)
+            parent = endpoint.rpartition("/")[0]
+            if parent:
+                endpoints.append(parent)
+
+        urls = set()
+        for endpoint in endpoints:
+            try:
+                url = template.endpoint_url(endpoint, self.path_params)
+                urls.add(url.rstrip("/"))
+            except (KeyError, IndexError):
+                # Patterns with params this request does not have cannot be resolved.
+                continue
+        return urls
+
+    def _coalesces(self, method: str) -> bool:
+        """Whether this request may share a network call with identical requests."""
+        return (
+            self._settings.coalesce
+            and method in _COALESCE_METHODS
+            and self.media is None
+            and self._stream_frames_used() is None
+        )
+
+    def _memoizes(self, method: str) -> bool:
+        """Whether the result of this request may be memoized."""
+        return (
+            self._settings.memo is not None
+            and method == "get"
+            and self.media is None
+            and self._stream_frames_used() is None
+        )
+
+    def _caches(self, method: str) -> bool:
+        """Whether the response to this request may be cached."""
+        return (
+            self.client.cache is not None
+            and method == "get"
+            and self.media is None
+            and self._stream_frames_used() is None
+        )
+
+    async def _execute_shared(
+        self, method: str, url: URL, headers: MutableMapping[str, str],
+    ) -> ResponseData:
+        """
+        Executes a request whose result may be shared with other callers, through
+        memoization, coalescing or the response cache, and applies ``update_obj`` to
+        this caller only.
+        """
+        settings = self._settings
+        # Everything that shapes the result is part of the key, so endpoints that share
+        # a url only share results they would have handled the same way.
+        key = (
+            method,
+            str(url),
+            tuple(sorted((name, str(value)) for name, value in headers.items())),
+            settings.resp_codes,
+            id(settings.resp_schema),
+            settings.raw_body,
+            settings.update_key,
+            id(settings.decode_stats),
+        )
+
+        memo = settings.memo
+        if memo is not None and self._memoizes(method):
+            fetch = functools.partial(self._fetch_shared, key, method, url, headers)
+            result = await memo.get(key + (self.client._memo_scope,), fetch)
+        elif self._coalesces(method):
+            result = await self._join_inflight(key, method, url, headers)
+        else:
+            result = await self._fetch_shared(key, method, url, headers)
+
+        self.executed = True
+
+        # Raw bodies are never loaded, so there is nothing to update the object with.
+        if self.update_obj is None or settings.raw_body:
+            return result
+
+        # Each caller updates its own object from a private copy, so the shared loaded
+        # object is never tied to any one caller's object.
+        loaded = _update_data(
             current_data_object=self.update_obj,
-            data_object_updater=self.endpoint_settings.data_updater,
-            decoders=self.client._DECODERS,
+            new_data_object=copy.deepcopy(result.loaded),
+            object_updater=settings.data_updater,
+            current_data_key=settings.update_key,
         )
+        return ResponseData(resp=result.resp, loaded=loaded, decoded=result.decoded)
+
+    async def _join_inflight(
+        self, key: Hashable, method: str, url: URL, headers: MutableMapping[str, str],
+    ) -> ResponseData:
+        """Joins the identical request that is in-flight, or starts it."""
+        inflight = self.client._inflight
+        shared = inflight.get(key)
+        if shared is None:
+            shared = asyncio.ensure_future(
+                self._fetch_shared(key, method, url, headers)
+            )
+            inflight[key] = shared
+            shared.add_done_callback(functools.partial(_forget_inflight, inflight, key))
+
+        # Shielded so that a caller being cancelled does not cancel the call for the
+        # other callers.
+        return await asyncio.shield(shared)
+
+    async def _fetch_shared(
+        self, key: Hashable, method: str, url: URL, headers: MutableMapping[str, str],
+    ) -> ResponseData:
+        """
+        Fetches a response without applying ``update_obj``, going through the response
+        cache if the client has one.
+        """
+        cache = self.client.cache if self._caches(method) else None
+        if cache is None:
+            method_func = getattr(self.client.session, method)
+            response = await method_func(url=url, headers=headers, data=b"")
+            return await self._handle_response(response, None)
+
+        token = cache.track(key)
+        try:
+            return await self._fetch_cached(cache, token, key, method, url, headers)
+        finally:
+            cache.untrack(token)
+
+    async def _fetch_cached(
+        self,
+        cache: ResponseCache,
+        token: object,
+        key: Hashable,
+        method: str,
+        url: URL,
+        headers: MutableMapping[str, str],
+    ) -> ResponseData:
+        """
+        Fetches a response through ``cache``. Once the cache has discarded ``key`` as
+        stale, the response may predate the change that made it so: it is returned, but
+        not stored.
+        """
+        entry = cache.get(key)
+        disk = cache.disk
+        ttl = 0 if disk is None else disk.ttl
+
+        if disk is not None and entry is None:
+            entry = await self._restore_stored(cache, token, key, method, url, headers)
+
+        request_headers = headers
+        if entry is not None:
+            if entry.is_fresh():
+                return entry.data
+            headers = dict(headers, **entry.conditional_headers())
+
+        method_func = getattr(self.client.session, method)
+        response = await method_func(url=url, headers=headers, data=b"")
+
+        # Not Modified is handled before the status code is checked, since it is not a
+        # valid code for the endpoint itself.
+        if entry is not None and response.status == 304:
+            response.release()
+            entry.refresh(response, ttl)
+            if disk is not None and cache.current(token):
+                await disk.refresh(method, url, request_headers, response)
+            return ResponseData(
+                resp=response, loaded=entry.data.loaded, decoded=entry.data.decoded
+            )
+
+        try:
+            result = await self._handle_response(response, None)
+        except (Exception, SpanError):
+            # The server no longer answers with the cached response.
+            if entry is not None:
+                await _discard_response(cache, key, method, url, request_headers)
+            raise
+
+        if cache.current(token):
+            await _store_response(cache, key, method, url, request_headers, result)
+        return result
+
+    async def _restore_stored(
+        self,
+        cache: ResponseCache,
+        token: object,
+        key: Hashable,
+        method: str,
+        url: URL,
+        headers: MutableMapping[str, str],
+    ) -> Optional[CacheEntry]:
+        """
+        Handles a response read back from the disk cache like a received one, and
+        caches the result in memory.
+        """
+        disk: DiskCache = cache.disk  # type: ignore
+        stored = await disk.get(method, url, headers)
+        if stored is None:
+            return None
+
+        # The response passed the same checks when it was stored, so only a change of
+        # endpoint settings, like after a deploy, makes it fail them now. It is then
+        # dropped and fetched again.
+        try:
+            result = await self._handle_response(stored, None)  # type: ignore
+            # Runs a deferred load now, so that a schema change is caught here too.
+            result.loaded
+        except (Exception, SpanError):
+            await disk.discard(method, url, headers)
+            return None
+
+        entry = stored.entry(result)
+        if cache.current(token):
+            cache.store(key, entry)
+        return entry
+
+
+_COALESCE_METHODS = ("get", "head")
+
+_INVALIDATING_METHODS = ("put", "patch", "delete")
+"""Methods whose requests make the cached results for their path stale."""
+
+
+async def _store_response(
+    cache: ResponseCache,
+    key: Hashable,
+    method: str,
+    url: URL,
+    headers: MutableMapping[str, str],
+    result: ResponseData,
+) -> None:
+    """Stores a handled response in ``cache`` and its disk tier."""
+    response = result.resp
+    disk = cache.disk
+    ttl = 0 if disk is None else disk.ttl
+
+    content = await response.read()
+    entry = CacheEntry.from_response(response, result, len(content), ttl)
+    if entry is None:
+        cache.discard(key)
+    else:
+        cache.store(key, entry)
+    if disk is not None:
+        await disk.store(method, url, headers, response, content)
+
+
+async def _discard_response(
+    cache: ResponseCache,
+    key: Hashable,
+    method: str,
+    url: URL,
+    headers: MutableMapping[str, str],
+) -> None:
+    """Removes a response from ``cache`` and its disk tier."""
+    cache.discard(key)
+    if cache.disk is not None:
+        await cache.disk.discard(method, url, headers)
+
+
+def _forget_inflight(
+    inflight: Dict[Hashable, asyncio.Future], key: Hashable, future: asyncio.Future
+) -> None:
+    if inflight.get(key) is future:
+        del inflight[key]
+
+    # Mark the error as retrieved, in case every caller was cancelled before it came.
+    if not future.cancelled():
+        future.exception()
 
 
 typing_help = False
@@ -1,15 +1,78 @@
 from aiohttp import ClientResponse
-from dataclasses import dataclass
-from typing import Any
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from spantools import MimeTypeTolerant
 
 
 @dataclass
+class RawBody:
+    """
+    Undecoded response body, returned by endpoints with ``raw_body`` set. Errors
+    reported in the response headers and the status code have already been checked.
+    """
+
+    content: bytes
+    """Body as received. Wrap in a ``memoryview`` to slice it without copying."""
+    mimetype: MimeTypeTolerant
+    """Mimetype from the ``'Content-Type'`` header, if any."""
+
+
+@dataclass(repr=False)
 class ResponseData:
-    """Holds information about handled response."""
+    """
+    Holds information about handled response.
+
+    ``loaded`` can be computed lazily, see :func:`ResponseData.deferred`. Callers that
+    only look at ``resp`` or ``decoded`` never pay for loading the body with a schema.
+    """
 
     resp: ClientResponse
     """aiohttp response object."""
     loaded: Any
-    """loaded body data from schema."""
-    decoded: Any
+    """
+    loaded body data from schema.
+
+    If deferred, computed on first access. Raises ``marshmallow.ValidationError`` if the
+    body is not consistent with the schema, again on every access.
+    """
+    decoded: Any = None
     """raw unloaded mapping of body values (result of json/bson/yaml decode)"""
+    _load: Optional[Callable[[], Any]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    @classmethod
+    def deferred(
+        cls, resp: ClientResponse, decoded: Any, load: Callable[[], Any]
+    ) -> "ResponseData":
+        """
+        Response data whose ``loaded`` is computed by ``load`` the first time it is
+        read, then kept.
+        """
+        data = cls(resp=resp, loaded=None, decoded=decoded)
+        data._load = load
+        del data.loaded
+        return data
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called for attributes the instance does not have, which for ``loaded``
+        # means it is deferred and has not been computed yet.
+        if name != "loaded" or self._load is None:
+            raise AttributeError(name)
+
+        self.loaded = self._load()
+        self._load = None
+        return self.loaded
+
+    @property
+    def is_loaded(self) -> bool:
+        """Whether ``loaded`` has been computed."""
+        return "loaded" in self.__dict__
+
+    def __repr__(self) -> str:
+        loaded = repr(self.loaded) if self.is_loaded else "<not loaded>"
+        return (
+            f"{self.__class__.__name__}(resp={self.resp!r}, loaded={loaded}, "
+            f"decoded={self.decoded!r})"
+        )
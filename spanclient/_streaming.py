@@ -0,0 +1,365 @@
+import re
+import json
+from marshmallow import Schema
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncGenerator,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    MutableMapping,
+    Optional,
+    Union,
+)
+
+from spantools import (
+    MimeType,
+    MimeTypeTolerant,
+    DecoderIndexType,
+    DEFAULT_DECODERS,
+    EncoderIndexType,
+    DEFAULT_ENCODERS,
+    ContentEncodeError,
+    ContentTypeUnknownError,
+)
+
+
+STREAM_CHUNK_SIZE: int = 2 ** 16
+"""Number of bytes to read from a response body at a time when streaming."""
+
+STREAM_READ_TIMEOUT: Optional[float] = 300
+"""
+Default number of seconds a :func:`EndpointWrapper.stream` response may go without
+receiving data. Streams have no overall time limit.
+"""
+
+_BSON_RECORD_DELIM = "\u241E".encode()
+"""Record delimiter spantools uses for lists of BSON documents."""
+
+_ARRAY_TOKENS = re.compile(rb'[][{}",]')
+_STRING_TOKENS = re.compile(rb'["\\]')
+
+
+class JSONArraySplitter:
+    """
+    Splits an incrementally received JSON array into the raw bytes of its elements.
+    Only structural characters are inspected, so element bodies are not parsed.
+    """
+
+    def __init__(self) -> None:
+        self._buffer: bytearray = bytearray()
+        self._pos: int = 0
+        """Where to resume scanning in the buffer."""
+        self._element_start: int = 0
+        """Where the current element starts in the buffer."""
+        self._depth: int = 0
+        self._in_string: bool = False
+        self._after_comma: bool = False
+        """Whether the current element follows a comma, so it may not be empty."""
+        self.done: bool = False
+        """Whether the closing bracket of the array has been seen."""
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        """
+        Add ``chunk`` to the buffered array body.
+
+        :return: Raw bytes of every element completed by this chunk.
+
+        :raises ValueError: If the body is not a JSON array, has a trailing comma, or
+            has anything but whitespace after its closing bracket.
+        """
+        self._buffer.extend(chunk)
+        elements: List[bytes] = list()
+
+        while not self.done:
+            if self._in_string:
+                match = _STRING_TOKENS.search(self._buffer, self._pos)
+            else:
+                match = _ARRAY_TOKENS.search(self._buffer, self._pos)
+
+            if match is None:
+                break
+
+            self._pos = match.end()
+            token = match.group()
+
+            if self._in_string:
+                if token == b"\\":
+                    # Skip the escaped character, even if it is in the next chunk.
+                    self._pos += 1
+                else:
+                    self._in_string = False
+            elif token == b'"':
+                self._in_string = True
+            else:
+                self._structural(token, match.start(), elements)
+
+        # Drop everything that belongs to elements we have already handed out.
+        del self._buffer[: self._element_start]
+        self._pos -= self._element_start
+        self._element_start = 0
+
+        if self.done:
+            if self._buffer.strip():
+                raise ValueError("data after the end of the JSON array")
+            self._buffer.clear()
+            self._pos = 0
+
+        return elements
+
+    def _structural(self, token: bytes, index: int, elements: List[bytes]) -> None:
+        if self._depth == 0:
+            if token != b"[" or self._buffer[:index].strip():
+                raise ValueError("content is not a JSON array")
+            self._depth = 1
+            self._element_start = index + 1
+        elif token in b"[{":
+            self._depth += 1
+        elif token in b"]}" and self._depth > 1:
+            self._depth -= 1
+        elif self._depth == 1:
+            # A comma or the closing bracket ends the current element.
+            start = self._element_start
+            element = bytes(self._buffer[start:index].strip())
+            if element:
+                elements.append(element)
+            elif token == b"," or self._after_comma:
+                raise ValueError("empty element in JSON array")
+
+            self._element_start = index + 1
+            self._after_comma = token == b","
+            self.done = token == b"]"
+
+
+def _decode_json_element(raw: bytes, decoders: DecoderIndexType) -> Any:
+    # The registered JSON decoder only handles documents, so scalar elements fall back
+    # to the standard library.
+    if raw[:1] in (b"{", b"["):
+        return decoders.get(MimeType.JSON, DEFAULT_DECODERS[MimeType.JSON])(raw)
+    return json.loads(raw)
+
+
+def _load_json_element(
+    raw: bytes, data_schema: Optional[Schema], decoders: DecoderIndexType
+) -> Any:
+    decoded = _decode_json_element(raw, decoders)
+    if data_schema is not None:
+        return data_schema.load(decoded, many=False)
+    return decoded
+
+
+async def iter_json_array(
+    chunks: AsyncIterable[bytes],
+    data_schema: Optional[Schema] = None,
+    decoders: DecoderIndexType = DEFAULT_DECODERS,
+) -> AsyncGenerator[Any, None]:
+    """
+    Decodes the elements of a JSON array as its bytes come in, loading each one with
+    ``data_schema`` if passed. Only one element is held in memory at a time.
+
+    :raises ValueError: If the content is not a well-formed JSON array.
+    """
+    splitter = JSONArraySplitter()
+
+    async for chunk in chunks:
+        for raw in splitter.feed(chunk):
+            yield _load_json_element(raw, data_schema, decoders)
+
+    if not splitter.done:
+        raise ValueError("JSON array ended early")
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncGenerator[bytes, None]:
+    """
+    Splits incrementally received bytes into lines, including their line break. Unlike
+    ``StreamReader.readline``, lines may be of any length.
+    """
+    buffer = bytearray()
+
+    async for chunk in chunks:
+        # Only the new bytes can hold a line break.
+        scan = len(buffer)
+        buffer.extend(chunk)
+
+        start = 0
+        end = buffer.find(b"\n", scan)
+        while end != -1:
+            stop = end + 1
+            yield bytes(buffer[start:stop])
+            start = stop
+            end = buffer.find(b"\n", start)
+
+        del buffer[:start]
+
+    if buffer:
+        yield bytes(buffer)
+
+
+async def iter_ndjson(
+    chunks: AsyncIterable[bytes],
+    data_schema: Optional[Schema] = None,
+    decoders: DecoderIndexType = DEFAULT_DECODERS,
+) -> AsyncGenerator[Any, None]:
+    """
+    Decodes newline-delimited JSON records as their lines come in, loading each one
+    with ``data_schema`` if passed. Blank lines are skipped.
+
+    :raises ValueError: If a line is not valid JSON.
+    """
+    async for line in iter_lines(chunks):
+        line = line.strip()
+        if line:
+            yield _load_json_element(line, data_schema, decoders)
+
+
+async def iter_sse(
+    chunks: AsyncIterable[bytes],
+    data_schema: Optional[Schema] = None,
+    decoders: DecoderIndexType = DEFAULT_DECODERS,
+) -> AsyncGenerator[Any, None]:
+    """
+    Decodes the ``data:`` payload of server-sent events as JSON as each event comes in,
+    loading it with ``data_schema`` if passed. Comments, other fields and events
+    without data are skipped.
+
+    :raises ValueError: If an event's data is not valid JSON.
+    """
+    data: List[bytes] = list()
+
+    async for line in iter_lines(chunks):
+        line = line.rstrip(b"\r\n")
+
+        if not line:
+            # A blank line dispatches the event.
+            if data:
+                yield _load_json_element(b"\n".join(data), data_schema, decoders)
+                data = list()
+            continue
+
+        field, _, value = line.partition(b":")
+        if field == b"data":
+            data.append(value[1:] if value.startswith(b" ") else value)
+
+    # An event that is not followed by a blank line is incomplete and is dropped, as
+    # per the SSE spec.
+
+
+async def iter_raw(
+    chunks: AsyncIterable[bytes],
+    data_schema: Optional[Schema] = None,
+    decoders: DecoderIndexType = DEFAULT_DECODERS,
+) -> AsyncGenerator[bytes, None]:
+    """
+    Yields the body of a response as it comes in, without decoding it.
+    ``data_schema`` and ``decoders`` are ignored.
+    """
+    async for chunk in chunks:
+        yield chunk
+
+
+STREAM_FRAMES: Dict[str, Callable[..., AsyncGenerator[Any, None]]] = {
+    "ndjson": iter_ndjson,
+    "sse": iter_sse,
+    "raw": iter_raw,
+}
+"""
+Record formats :func:`EndpointWrapper.stream` can consume, by name. Each takes the
+response body in chunks of up to ``STREAM_CHUNK_SIZE`` bytes.
+"""
+
+
+def is_stream_media(media: Any) -> bool:
+    """Whether ``media`` is an async iterable that must be sent as a stream."""
+    return hasattr(media, "__aiter__")
+
+
+async def iter_items_aio(
+    items: Union[Iterable[Any], AsyncIterable[Any]]
+) -> AsyncGenerator[Any, None]:
+    """Iterates over a regular or an async iterable."""
+    if is_stream_media(items):
+        async for item in items:  # type: ignore
+            yield item
+    else:
+        for item in items:  # type: ignore
+            yield item
+
+
+def encode_stream(
+    media: Union[Iterable[Any], AsyncIterable[Any]],
+    mimetype: MimeTypeTolerant = None,
+    headers: Optional[MutableMapping[str, str]] = None,
+    data_schema: Optional[Schema] = None,
+    encoders: EncoderIndexType = DEFAULT_ENCODERS,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+) -> AsyncGenerator[bytes, None]:
+    """
+    Encodes the items of ``media`` one at a time as a JSON array or as delimited BSON
+    records. The returned async generator yields chunks of roughly ``chunk_size``
+    bytes, so only one chunk is held in memory at a time.
+
+    :param media: Items to encode. Dumped one at a time with ``data_schema`` if passed,
+        even if the schema is declared with ``many=True``.
+    :param mimetype: ``MimeType.JSON`` (default) or ``MimeType.BSON``.
+    :param headers: Request headers to add the Content-Type to.
+
+    :raises ContentTypeUnknownError: If the mimetype cannot be streamed.
+    :raises ContentEncodeError: While iterating, if an item cannot be encoded.
+    :raises marshmallow.ValidationError: While iterating, if raised while dumping an
+        item.
+    """
+    try:
+        mimetype = MimeType.JSON if mimetype is None else MimeType.from_name(mimetype)
+    except ValueError:
+        pass
+
+    if mimetype not in (MimeType.JSON, MimeType.BSON):
+        raise ContentTypeUnknownError(f"mimetype '{mimetype}' cannot be streamed")
+
+    if headers is not None:
+        MimeType.add_to_headers(headers, mimetype)
+
+    return _encode_stream_chunks(
+        media, mimetype, data_schema, encoders[mimetype], chunk_size
+    )
+
+
+async def _encode_stream_chunks(
+    media: Union[Iterable[Any], AsyncIterable[Any]],
+    mimetype: MimeType,
+    data_schema: Optional[Schema],
+    encoder: Callable[[Any], bytes],
+    chunk_size: int,
+) -> AsyncGenerator[bytes, None]:
+    if mimetype is MimeType.JSON:
+        buffer, separator, tail = bytearray(b"["), b",", b"]"
+    else:
+        buffer, separator, tail = bytearray(), _BSON_RECORD_DELIM, b""
+
+    first = True
+
+    async for item in iter_items_aio(media):
+        if data_schema is not None:
+            item = data_schema.dump(item, many=False)
+
+        try:
+            encoded = encoder(item)
+        except BaseException:
+            raise ContentEncodeError("Error while encoding content")
+
+        # JSON arrays have no separator before the first item, but every BSON record is
+        # preceded by the delimiter.
+        if not first or mimetype is MimeType.BSON:
+            buffer.extend(separator)
+        buffer.extend(encoded)
+        first = False
+
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+
+    buffer.extend(tail)
+    if buffer:
+        yield bytes(buffer)
@@ -0,0 +1,236 @@
+import re
+import string
+from dataclasses import dataclass
+from urllib.parse import SplitResult, quote, quote_plus, urlencode, urlsplit
+from yarl import URL
+from typing import Any, Dict, Mapping, Match, Optional, Tuple
+
+from spantools import MimeType, MimeTypeTolerant, convert_params_headers
+
+
+_PATH_SAFE = "/:@!$&'()*+,;="
+"""Characters left as-is in path params: the ones yarl leaves unquoted in a path."""
+_QUERY_SAFE = "/:@!$'()*,?"
+"""Characters left as-is in query param names and values."""
+_PERCENT = re.compile("%([0-9A-Fa-f]{2})?")
+
+
+def _percent(match: Match[str]) -> str:
+    escape = match.group(1)
+    return "%25" if escape is None else "%" + escape.upper()
+
+
+def _quote_path(value: str) -> str:
+    """
+    Percent-encodes part of a path the way yarl does: ``%XX`` escapes already in it are
+    kept, with their hex digits in uppercase, and any other ``%`` is encoded.
+    """
+    quoted = quote(value, safe=_PATH_SAFE + "%")
+    if "%" in value:
+        quoted = _PERCENT.sub(_percent, quoted)
+    return quoted
+
+
+def _quote_query(
+    value: str, safe: str, encoding: Optional[str] = None, errors: Optional[str] = None
+) -> str:
+    """
+    Percent-encodes a query param name or value like :func:`_quote_path`, with spaces
+    as ``+``. Passed to ``urlencode`` as ``quote_via``.
+    """
+    quoted = quote_plus(value, safe + "%", encoding, errors)
+    if "%" in value:
+        quoted = _PERCENT.sub(_percent, quoted)
+    return quoted
+
+
+def _encode_query(params: Mapping[str, Any]) -> str:
+    return urlencode(params, safe=_QUERY_SAFE, quote_via=_quote_query)
+
+
+_PathField = Tuple[str, Optional[str]]
+
+
+def _parse_endpoint(endpoint: str) -> Tuple[str, Tuple[Tuple[_PathField, str], ...]]:
+    """
+    Splits an endpoint pattern into its leading literal and ``(field, literal)`` pairs.
+    Fields are ``(name, format string)``, where the format string is ``None`` for plain
+    ``{name}`` fields, which are filled in with ``format`` without parsing a format
+    string.
+    """
+    parsed = list(string.Formatter().parse(endpoint))
+    if not parsed:
+        return "", ()
+
+    # Each parsed item is a literal followed by the field after it, if any.
+    following = [literal for literal, _, _, _ in parsed[1:]] + [""]
+    parts = list()
+
+    for (_, name, spec, conversion), literal in zip(parsed, following):
+        if name is None:
+            continue
+
+        fmt: Optional[str] = None
+        if spec or conversion or not name.isidentifier():
+            fmt = "{" + name + (f"!{conversion}" if conversion else "")
+            fmt += f":{spec}}}" if spec else "}"
+
+        parts.append(((name, fmt), _quote_path(literal)))
+
+    return parsed[0][0], tuple(parts)
+
+
+def _fill_path(
+    path: str,
+    path_parts: Tuple[Tuple[_PathField, str], ...],
+    path_params: Mapping[str, Any],
+) -> str:
+    """Fills the path params into an endpoint parsed by :func:`_parse_endpoint`."""
+    parts = [path]
+    for (name, fmt), literal in path_parts:
+        value = format(path_params[name]) if fmt is None else fmt.format(**path_params)
+        parts.append(_quote_path(value))
+        parts.append(literal)
+    return "".join(parts)
+
+
+@dataclass
+class RequestTemplate:
+    """
+    The parts of an endpoint's requests that are the same on every call through one
+    client, compiled once: the encoded base URL, the path param slots, the encoded
+    static query string and the static headers. Each call only fills in the dynamic
+    parts and hands aiohttp an already-encoded URL.
+
+    Compiled from :class:`_EndpointSettings` by :func:`RequestTemplate.compile`.
+    """
+
+    protocol: str
+    """Client protocol the template was compiled for."""
+    host_name: str
+    """Client host the template was compiled for."""
+    endpoint: str
+    """Endpoint pattern the template was compiled from."""
+    query_params: Dict[str, str]
+    """Copy of the static query params the template was compiled from."""
+    headers_static: Dict[str, str]
+    """Copy of the static headers the template was compiled from."""
+    mimetype_accept: MimeTypeTolerant
+    """Accept mimetype the template was compiled for."""
+    scheme: str
+    """URL scheme."""
+    netloc: str
+    """Encoded URL host and port."""
+    path: str
+    """Encoded endpoint path up to the first path param."""
+    path_parts: Tuple[Tuple[_PathField, str], ...]
+    """``((name, format string), encoded literal that follows)`` per path param."""
+    query: str
+    """Encoded static query string."""
+    headers: Dict[str, str]
+    """Static headers, with ``'Accept'`` already set."""
+
+    @classmethod
+    def compile(
+        cls,
+        client: "SpanClient",
+        settings: "_EndpointSettings",
+        mimetype_accept: MimeTypeTolerant,
+    ) -> "RequestTemplate":
+        """Compiles the template of ``settings`` for ``client``."""
+        origin = urlsplit(str(URL(f"{client.protocol}://{client.host_name}")))
+        leading, path_parts = _parse_endpoint(settings.endpoint)
+
+        headers = dict(settings.headers)
+        if mimetype_accept is not None:
+            headers["Accept"] = MimeType.to_string(mimetype_accept)
+
+        return cls(
+            protocol=client.protocol,
+            host_name=client.host_name,
+            endpoint=settings.endpoint,
+            query_params=dict(settings.query_params),
+            headers_static=dict(settings.headers),
+            mimetype_accept=mimetype_accept,
+            scheme=origin.scheme,
+            netloc=origin.netloc,
+            path=_quote_path(leading),
+            path_parts=path_parts,
+            query=_encode_query(settings.query_params),
+            headers=headers,
+        )
+
+    def matches(
+        self,
+        client: "SpanClient",
+        settings: "_EndpointSettings",
+        mimetype_accept: MimeTypeTolerant,
+    ) -> bool:
+        """
+        Whether the template is still valid for a request. Handlers may change the
+        endpoint settings or client address of a request before it is executed,
+        including the static query params and headers in place.
+        """
+        return (
+            self.endpoint == settings.endpoint
+            and self.query_params == settings.query_params
+            and self.headers_static == settings.headers
+            and self.mimetype_accept == mimetype_accept
+            and self.host_name == client.host_name
+            and self.protocol == client.protocol
+        )
+
+    def url(self, path_params: Mapping[str, Any], params: Mapping[str, str]) -> URL:
+        """
+        Builds the encoded request URL.
+
+        :param path_params: Values for the endpoint pattern.
+        :param params: Query params to add to, or override, the static ones.
+
+        :raises KeyError: If a path param is missing.
+        """
+        path = _fill_path(self.path, self.path_parts, path_params)
+
+        query = self.query
+        if params:
+            if self.query_params.keys() & params.keys():
+                query = _encode_query(dict(self.query_params, **params))
+            elif query:
+                query += "&" + _encode_query(params)
+            else:
+                query = _encode_query(params)
+
+        # Built from its parts so yarl neither splits nor re-quotes it.
+        split = SplitResult(self.scheme, self.netloc, path, query, "")
+        return URL(split, encoded=True)  # type: ignore
+
+    def endpoint_url(self, endpoint: str, path_params: Mapping[str, Any]) -> str:
+        """
+        Builds the encoded URL of another endpoint pattern on the same host, without a
+        query string, as it appears at the start of that endpoint's request URLs.
+
+        :raises KeyError: If a path param is missing.
+        """
+        leading, path_parts = _parse_endpoint(endpoint)
+        path = _quote_path(leading)
+        path = _fill_path(path, path_parts, path_params)
+        return SplitResult(self.scheme, self.netloc, path, "", "").geturl()
+
+    def request_headers(self, headers: Mapping[str, Any]) -> Dict[str, str]:
+        """
+        Merges per-request ``headers`` over the static ones. ``'Accept'`` is always
+        taken from the endpoint mimetype, when it has one.
+        """
+        merged = dict(self.headers)
+        if headers:
+            merged.update(headers)
+            convert_params_headers(merged)
+            if self.mimetype_accept is not None:
+                merged["Accept"] = self.headers["Accept"]
+        return merged
+
+
+typing_help = False
+if typing_help:
+    from ._endpoint_wrapper import _EndpointSettings
+    from ._client import SpanClient
@@ -0,0 +1,182 @@
+import gemma
+from collections.abc import Mapping, Sequence
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+
+# GEMMA CACHED OBJECTS
+DEFAULT_SURVEYOR = gemma.Surveyor()
+DEFAULT_CARTOGRAPHER = gemma.Cartographer()
+
+UpdaterType = Callable[[Any, Any], None]
+
+_PLAN_CACHE_SIZE: int = 1024
+"""Most ``(new type, current type)`` pairs an updater plan is remembered for."""
+
+_MISSING = object()
+
+_IMMUTABLE_TYPES = frozenset(
+    {str, bytes, int, float, complex, bool, Decimal, UUID, type(None)}
+)
+"""Types whose equal values are interchangeable, so assigning one over another is a
+no-op."""
+
+_plans: Dict[Tuple[type, type], Optional[UpdaterType]] = dict()
+
+
+def _unchanged(old: Any, value: Any) -> bool:
+    if old is value:
+        return True
+    value_type = type(value)
+    return type(old) is value_type and value_type in _IMMUTABLE_TYPES and old == value
+
+
+def _dict_fields(new: Any) -> Iterable[Tuple[Any, Any]]:
+    return new.items()
+
+
+def _attr_fields(new: Any) -> Iterable[Tuple[Any, Any]]:
+    return (
+        (name, value)
+        for name, value in new.__dict__.items()
+        if not name.startswith("_")
+    )
+
+
+def _place_fallback(current: Any, name: Any, value: Any) -> None:
+    # Tries setting an item, calling a setter method and setting an attribute, in that
+    # order, exactly like gemma does.
+    gemma.Fallback(name).place(current, value)
+
+
+def _update_dict(current: Any, fields: Iterable[Tuple[Any, Any]]) -> None:
+    for name, value in fields:
+        if not _unchanged(current.get(name, _MISSING), value):
+            current[name] = value
+
+
+def _update_attrs(current: Any, fields: Iterable[Tuple[Any, Any]]) -> None:
+    for name, value in fields:
+        old = getattr(current, name, _MISSING) if type(name) is str else _MISSING
+        # Missing attributes and methods are left to gemma: it calls setter methods,
+        # and raises gemma.NullNameError for names it cannot place.
+        if old is _MISSING or callable(old):
+            _place_fallback(current, name, value)
+        elif not _unchanged(old, value):
+            setattr(current, name, value)
+
+
+def _update_any(current: Any, fields: Iterable[Tuple[Any, Any]]) -> None:
+    for name, value in fields:
+        _place_fallback(current, name, value)
+
+
+def _build_plan(new_type: type, current_type: type) -> Optional[UpdaterType]:
+    """
+    Picks how fields are read from ``new_type`` objects and written to
+    ``current_type`` objects. ``None`` means the pair is left to gemma.
+    """
+    if new_type is dict:
+        read_fields: Callable[[Any], Iterable[Tuple[Any, Any]]] = _dict_fields
+    elif not issubclass(new_type, (Mapping, Sequence)) and "__dict__" in dir(new_type):
+        read_fields = _attr_fields
+    else:
+        return None
+
+    if current_type is dict:
+        write_fields: Callable[[Any, Iterable[Tuple[Any, Any]]], None] = _update_dict
+    elif hasattr(current_type, "__setitem__"):
+        write_fields = _update_any
+    else:
+        write_fields = _update_attrs
+
+    def update(current: Any, new: Any) -> None:
+        # Every field is read before any is written, like gemma, in case ``new`` and
+        # ``current`` share data.
+        write_fields(current, list(read_fields(new)))
+
+    return update
+
+
+def _gemma_updater(current: Any, new: Any) -> None:
+    DEFAULT_CARTOGRAPHER.map(new, current, surveyor=DEFAULT_SURVEYOR)
+
+
+def default_updater(current: Any, new: Any) -> None:
+    """
+    Updates ``current`` in place with the fields of ``new``: the keys of a dict or the
+    public attributes of an object like a dataclass. Each field is set as a key or an
+    attribute of ``current``, whichever it supports, so a dataclass can be updated from
+    a dict with the same field names and vice-versa. Fields whose value is unchanged
+    are not set again.
+
+    This is the updater endpoints use when no ``data_updater`` is given. How to read and
+    write fields is worked out once for each pair of types and reused afterwards. Pairs
+    it does not handle, like other mappings or sequences, are mapped with gemma.
+
+    :param current: Object to update.
+    :param new: Object with the new field values.
+
+    :raises gemma.NullNameError: If a field of ``new`` cannot be set on ``current``.
+    """
+    key = (type(new), type(current))
+    try:
+        plan = _plans[key]
+    except KeyError:
+        plan = _build_plan(*key)
+        if len(_plans) < _PLAN_CACHE_SIZE:
+            _plans[key] = plan
+
+    if plan is None:
+        _gemma_updater(current, new)
+    else:
+        plan(current, new)
+
+
+def _key_of(obj: Any, key: str) -> Any:
+    if type(obj) is dict or isinstance(obj, Mapping):
+        return obj.get(key, _MISSING)
+    return getattr(obj, key, _MISSING)
+
+
+def update_collection(
+    current: Any, new: Iterable[Any], key: str, updater: Optional[UpdaterType] = None,
+) -> List[Any]:
+    """
+    Updates existing objects in place with the records of a response page, matching
+    them by the value of their ``key`` field.
+
+    :param current: Existing objects. Either a mapping of key value to object, used as
+        is, or an iterable of objects, indexed once by their ``key`` field. Objects
+        without the field are left out.
+    :param new: Loaded records, dicts or objects with a ``key`` field. Records without
+        the field never match an existing object.
+    :param key: Name of the field that identifies a record.
+    :param updater: Called as ``updater(current_object, new_record)`` for each match.
+        :func:`default_updater` if not given.
+    :return: One object per record, in the order of ``new``: the existing object when
+        the record matched one, otherwise the new record itself.
+    """
+    if updater is None:
+        updater = default_updater
+
+    if isinstance(current, Mapping):
+        index = current
+    else:
+        index = {_key_of(obj, key): obj for obj in current}
+        index.pop(_MISSING, None)
+
+    updated: List[Any] = list()
+    for record in new:
+        record_key = _key_of(record, key)
+        existing = (
+            _MISSING if record_key is _MISSING else index.get(record_key, _MISSING)
+        )
+        if existing is _MISSING:
+            updated.append(record)
+        else:
+            updater(existing, record)
+            updated.append(existing)
+
+    return updated
@@ -1,5 +1,5 @@
 from dataclasses import dataclass, field
-from typing import Optional, Union, Any, List, Mapping, Type
+from typing import Optional, Union, Any, List, Mapping, Type, AsyncIterator
 from types import TracebackType
 
 from spantools import MimeType, MimeTypeTolerant, Error, encode_content
@@ -8,6 +8,59 @@ from spantools import MimeType, MimeTypeTolerant, Error, encode_content
 _DataType = Union[Mapping[str, Any], List[Mapping[str, Any]]]
 
 
+class MockStreamReader:
+    """
+    Mock of the ``aiohttp.StreamReader`` returned by :attr:`MockResponse.content`.
+    Serves the mocked content bytes, ``max_chunk`` bytes at most per read.
+    """
+
+    def __init__(self, content: bytes, max_chunk: Optional[int] = None) -> None:
+        self._content = content
+        self._max_chunk = max_chunk
+        self._pos = 0
+
+    async def read(self, n: int = -1) -> bytes:
+        """Read up to ``n`` bytes, or everything that is left if ``n`` is ``-1``."""
+        if n < 0:
+            n = len(self._content)
+        if self._max_chunk is not None:
+            n = min(n, self._max_chunk)
+
+        start = self._pos
+        end = start + n
+        self._pos = min(end, len(self._content))
+        return self._content[start:end]
+
+    async def readline(self) -> bytes:
+        """Read one line, including its line break."""
+        end = self._content.find(b"\n", self._pos)
+        end = len(self._content) if end == -1 else end + 1
+
+        start = self._pos
+        self._pos = end
+        return self._content[start:end]
+
+    async def iter_chunked(self, n: int) -> AsyncIterator[bytes]:
+        """Iterate over chunks of at most ``n`` bytes."""
+        while True:
+            chunk = await self.read(n)
+            if not chunk:
+                break
+            yield chunk
+
+    async def iter_any(self) -> AsyncIterator[bytes]:
+        """Iterate over chunks as they are "received"."""
+        async for chunk in self.iter_chunked(len(self._content) or 1):
+            yield chunk
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        while True:
+            line = await self.readline()
+            if not line:
+                break
+            yield line
+
+
 @dataclass
 class MockResponse:
     """
@@ -26,8 +79,11 @@ class MockResponse:
     _content: Optional[bytes] = None
     _exception: Optional[BaseException] = None
     _content_type: MimeTypeTolerant = None
+    _chunk_size: Optional[int] = None
+    """Largest chunk :attr:`content` hands out per read, to simulate network reads."""
     content_type: Optional[str] = field(init=False)
     """Content Type"""
+    _stream: Optional[MockStreamReader] = field(init=False, default=None)
 
     def __post_init__(self) -> None:
         self.content_type = None
@@ -65,6 +121,16 @@ class MockResponse:
         """Decoded bytes."""
         return self._text
 
+    @property
+    def content(self) -> MockStreamReader:
+        """Stream reader over the raw bytes."""
+        if self._stream is None:
+            self._stream = MockStreamReader(self._content or b"", self._chunk_size)
+        return self._stream
+
+    def release(self) -> None:
+        """Release the connection. Does nothing for mocks."""
+
     async def __aenter__(self) -> "MockResponse":
         return self
 
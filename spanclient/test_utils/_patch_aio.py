@@ -2,6 +2,7 @@ import aiohttp
 import functools
 from dataclasses import dataclass
 from asynctest import patch
+from yarl import URL
 from typing import (
     Generator,
     Optional,
@@ -13,6 +14,7 @@ from typing import (
     List,
     Any,
     Tuple,
+    AsyncIterable,
 )
 
 from ._mock_response import MockResponse
@@ -51,15 +53,28 @@ class MockConfig:
 async def _mock_aiohttp_method(
     self: aiohttp.ClientSession,
     mock_config: MockConfig,
-    url: str,
-    params: MutableMapping[str, str],
+    url: Union[str, URL],
     headers: MutableMapping[str, str],
-    data: Optional[bytes] = None,
+    params: Optional[MutableMapping[str, str]] = None,
+    data: Optional[Union[bytes, AsyncIterable[bytes]]] = None,
+    timeout: Optional[aiohttp.ClientTimeout] = None,
 ) -> MockResponse:
-    # NOTE ON ARGS: params and headers would normally have a default of None, but our
-    # client framework ALWAYS passes a dict, even if it is emtpy
+    # NOTE ON ARGS: headers would normally have a default of None, but our client
+    # framework ALWAYS passes a dict, even if it is emtpy
     mock_resp, req_validator = next(mock_config)  # type: ignore
 
+    # The client sends pre-encoded urls with the query string included. Validators
+    # check the url and its params separately.
+    if isinstance(url, URL):
+        params = dict(url.query, **(params or dict()))
+        url = url.with_query(None).human_repr()
+    elif params is None:
+        params = dict()
+
+    # Streamed request bodies are collected so they can be validated like any other.
+    if data is not None and not isinstance(data, bytes):
+        data = b"".join([chunk async for chunk in data])
+
     if req_validator is not None:
         req_validator.validate_request(
             req_url=url,
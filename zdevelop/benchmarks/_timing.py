@@ -0,0 +1,25 @@
+"""
+Timing helpers shared by the benchmark scripts. Like ``timeit``, they report the best
+of several runs: slower runs are noise from other processes.
+"""
+import time
+import timeit
+from typing import Any, Awaitable, Callable
+
+REPEAT: int = 7
+"""Number of runs to take the best of."""
+
+
+def best(func: Callable[[], Any], repeat: int = REPEAT) -> float:
+    """Seconds the fastest of ``repeat`` calls of ``func`` took."""
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+async def best_aio(func: Callable[[], Awaitable[Any]], repeat: int = REPEAT) -> float:
+    """Seconds the fastest of ``repeat`` awaited calls of ``func`` took."""
+    fastest = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await func()
+        fastest = min(fastest, time.perf_counter() - start)
+    return fastest
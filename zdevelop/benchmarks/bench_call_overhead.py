@@ -0,0 +1,77 @@
+"""
+Measures the per-call cost of the decorator / request pipeline of an endpoint method,
+with the network taken out of the picture.
+
+Run with: ``python zdevelop/benchmarks/bench_call_overhead.py [calls]``
+"""
+import sys
+import asyncio
+from multidict import MultiDict
+from yarl import URL
+from typing import Any, Mapping, Optional
+
+from spanclient import SpanClient, ClientRequest, handles
+from spanclient.test_utils import MockResponse
+
+from _timing import best_aio
+
+
+class _InstantSession:
+    """Stands in for ``aiohttp.ClientSession``, answering every request at once."""
+
+    def __init__(self) -> None:
+        self.response = MockResponse(status=200)
+
+    async def get(
+        self, url: Any, params: Optional[Mapping[str, str]] = None, **kwargs: Any
+    ) -> MockResponse:
+        # What aiohttp.ClientSession._request does with the url before sending.
+        url = URL(url)
+        if params:
+            query = MultiDict(url.query)
+            query.extend(url.with_query(params).query)
+            url = url.with_query(query)
+        return self.response
+
+    async def close(self) -> None:
+        pass
+
+
+class BenchClient(SpanClient):
+    @handles.get(
+        "/wizards/{wizard_id}",
+        query_params={"verbose": True},
+        headers={"Accept": "application/json"},
+    )
+    async def wizard_fetch(self, wizard_id: int, *, req: ClientRequest) -> None:
+        req.path_params["wizard_id"] = wizard_id
+
+    @handles.get("/wizards")
+    async def wizards_fetch(self, *, req: ClientRequest) -> None:
+        pass
+
+
+async def main(calls: int) -> None:
+    session: Any = _InstantSession()
+    client = BenchClient(host_name="api-host", session=session)
+
+    async def params_headers_path() -> None:
+        for i in range(calls):
+            await client.wizard_fetch(i)
+
+    async def bare() -> None:
+        for _ in range(calls):
+            await client.wizards_fetch()
+
+    for name, scenario in (
+        ("params, headers, path", params_headers_path),
+        ("bare", bare),
+    ):
+        elapsed = await best_aio(scenario)
+        print(f"{name:>24}: {elapsed / calls * 1e6:6.2f} us / call")
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
+    )
@@ -0,0 +1,43 @@
+"""
+Measures the per-response cost of :func:`handle_response_aio` on responses that need no
+decoding, where checking the error headers and status code is most of the work.
+
+Run with: ``python zdevelop/benchmarks/bench_handle_response.py [calls]``
+"""
+import sys
+import asyncio
+from spantools import errors_api
+from typing import Any
+
+from spanclient import handle_response_aio
+from spanclient.test_utils import MockResponse
+
+from _timing import best_aio
+
+
+async def main(calls: int) -> None:
+    success_response: Any = MockResponse(status=200)
+    error_response: Any = MockResponse(
+        _exception=errors_api.InvalidMethodError("bad method")
+    )
+
+    async def success() -> None:
+        for _ in range(calls):
+            await handle_response_aio(success_response)
+
+    async def error() -> None:
+        for _ in range(calls):
+            try:
+                await handle_response_aio(error_response)
+            except errors_api.InvalidMethodError:
+                pass
+
+    for name, scenario in (("success", success), ("error", error)):
+        elapsed = await best_aio(scenario)
+        print(f"{name:>24}: {elapsed / calls * 1e6:6.2f} us / call")
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
+    )
@@ -0,0 +1,64 @@
+"""
+Measures loading and dumping a page of records with a marshmallow schema, and with the
+same schema compiled by :func:`compile_schema`.
+
+Run with: ``python zdevelop/benchmarks/bench_schema_compile.py [records]``
+"""
+import sys
+import uuid
+from marshmallow import Schema, fields
+from typing import Any, Dict, List
+
+from spanclient import compile_schema
+
+from _timing import best
+
+
+class HouseSchema(Schema):
+    name = fields.String()
+    points = fields.Integer()
+
+
+class WizardSchema(Schema):
+    id = fields.UUID()
+    name = fields.String()
+    height = fields.Float()
+    prefect = fields.Boolean()
+    courses = fields.List(fields.String())
+    house = fields.Nested(HouseSchema)
+
+
+def _page(records: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "name": f"Wizard {i}",
+            "height": 1.75,
+            "prefect": i % 2 == 0,
+            "courses": ["Potions", "Charms", "Transfiguration"],
+            "house": {"name": "Gryffindor", "points": i},
+        }
+        for i in range(records)
+    ]
+
+
+def main(records: int) -> None:
+    page = _page(records)
+    schema = WizardSchema(many=True)
+    compiled = compile_schema(schema)
+
+    loaded = schema.load(page)
+    assert compiled.load(page) == loaded
+    assert compiled.dump(loaded) == schema.dump(loaded)
+
+    for name, this_schema in (("marshmallow", schema), ("compiled", compiled)):
+        load = best(lambda: this_schema.load(page))
+        dump = best(lambda: this_schema.dump(loaded))
+        print(
+            f"{name:>12}: load {load / records * 1e6:6.2f} us / record, "
+            f"dump {dump / records * 1e6:6.2f} us / record"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000)
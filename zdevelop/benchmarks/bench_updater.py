@@ -0,0 +1,66 @@
+"""
+Measures updating objects in place from loaded response data with
+:func:`default_updater`, and with a gemma mapping of every field.
+
+Run with: ``python zdevelop/benchmarks/bench_updater.py [updates]``
+"""
+import sys
+import uuid
+import gemma
+from dataclasses import dataclass
+from typing import Any, List, Tuple
+
+from spanclient import default_updater
+
+from _timing import best
+
+
+@dataclass
+class House:
+    name: str
+    points: int
+
+
+@dataclass
+class Wizard:
+    id: uuid.UUID
+    name: str
+    height: float
+    prefect: bool
+    courses: List[str]
+    house: House
+
+
+def _wizard(i: int) -> Wizard:
+    return Wizard(
+        id=uuid.UUID(int=i),
+        name=f"Wizard {i}",
+        height=1.75,
+        prefect=i % 2 == 0,
+        courses=["Potions", "Charms", "Transfiguration"],
+        house=House(name="Gryffindor", points=i),
+    )
+
+
+def main(updates: int) -> None:
+    current = [_wizard(i) for i in range(updates)]
+    new = [_wizard(i + 1) for i in range(updates)]
+    sources: List[Tuple[str, List[Any]]] = [
+        ("dataclass", new),
+        ("dict", [vars(x) for x in new]),
+    ]
+
+    surveyor = gemma.Surveyor()
+    cartographer = gemma.Cartographer()
+
+    def gemma_updater(current: Any, new: Any) -> None:
+        cartographer.map(new, current, surveyor=surveyor)
+
+    for name, updater in (("gemma", gemma_updater), ("default", default_updater)):
+        for source, records in sources:
+            elapsed = best(lambda: list(map(updater, current, records)))
+            print(f"{name:>8} from {source:>9}: {elapsed / updates * 1e6:6.2f} us")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000)
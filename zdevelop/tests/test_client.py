@@ -1,22 +1,36 @@
+import asyncio
 import pytest
 import rapidjson as json
 import uuid
+import weakref
 import aiohttp
 import yaml
 import io
 import csv
 import copy
+import dataclasses
+import enum
+import gc
+import threading
+import sqlite3
+import gemma
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from aiostream.stream import enumerate as aio_enumeerate
 from dataclasses import dataclass
+from marshmallow import Schema, ValidationError, fields
 from grahamcracker import DataSchema, schema_for
 from bson import BSON
 from bson.raw_bson import RawBSONDocument
+from yarl import URL
 from typing import AsyncGenerator, List, Optional, Callable, Dict, Any
 
-from spantools import errors_api
+from spantools import errors_api, DEFAULT_DECODERS
+from spantools import ContentDecodeError as SpanContentDecodeError
+from spantools import InvalidAPIErrorCodeError
 
 from spanclient import (
     handle_response_aio,
+    handle_response_stream_aio,
     iter_paged_aio,
     StatusMismatchError,
     SpanClient,
@@ -27,6 +41,17 @@ from spanclient import (
     test_utils,
     MimeType,
     register_mimetype,
+    encode_stream,
+    ResponseCache,
+    CacheEntry,
+    DiskCache,
+    RawBody,
+    ResponseData,
+    DecodeStats,
+    EndpointMemo,
+    compile_schema,
+    default_updater,
+    update_collection,
 )
 from spanclient.test_utils import MockResponse, MockConfig, RequestValidator
 
@@ -87,6 +112,23 @@ class NameIDSchema(DataSchema[NameID]):
     pass
 
 
+class HouseSchema(Schema):
+    name = fields.String(required=True)
+    points = fields.Integer(data_key="housePoints")
+    ratio = fields.Float()
+
+
+class StudentSchema(Schema):
+    id = fields.UUID(required=True)
+    name = fields.String()
+    prefect = fields.Boolean(missing=False)
+    wand = fields.String(allow_none=True)
+    courses = fields.List(fields.String())
+    house = fields.Nested(HouseSchema)
+    rivals = fields.Nested(HouseSchema, many=True)
+    enrolled = fields.DateTime()
+
+
 class TestMockResponse:
     def test_default_status(self):
         r = MockResponse()
@@ -264,6 +306,287 @@ class TestDataLoad:
                 assert error.response is r
                 raise error
 
+    @pytest.mark.asyncio
+    async def test_lazy_load(self):
+        loads = list()
+
+        class CountingSchema(NameSchema):
+            def load(self, data, **kwargs):
+                loads.append(data)
+                return super().load(data, **kwargs)
+
+        r = MockResponse(status=200, _json={"first": "Harry", "last": "Potter"})
+        r.headers["Content-Type"] = "application/json"
+
+        r_info = await handle_response_aio(r, data_schema=CountingSchema())
+
+        assert r_info.decoded == {"first": "Harry", "last": "Potter"}
+        assert not r_info.is_loaded
+        assert loads == []
+
+        assert r_info.loaded == Name("Harry", "Potter")
+        assert r_info.loaded is r_info.loaded
+        assert len(loads) == 1
+
+    @pytest.mark.asyncio
+    async def test_lazy_load_dataclass(self):
+        r = MockResponse(status=200, _json={"first": "Harry", "last": "Potter"})
+        r.headers["Content-Type"] = "application/json"
+
+        r_info = await handle_response_aio(r, data_schema=NameSchema())
+        assert "<not loaded>" in repr(r_info)
+
+        assert [f.name for f in dataclasses.fields(r_info)] == [
+            "resp",
+            "loaded",
+            "decoded",
+            "_load",
+        ]
+        assert r_info == ResponseData(
+            resp=r, loaded=Name("Harry", "Potter"), decoded=r_info.decoded
+        )
+        assert r_info.is_loaded
+
+        replaced = dataclasses.replace(r_info, loaded=None)
+        assert replaced.loaded is None
+        assert replaced.decoded is r_info.decoded
+
+    @pytest.mark.asyncio
+    async def test_lazy_load_validation_error(self):
+        r = MockResponse(status=200, _json={"first": ["Harry"], "last": "Potter"})
+        r.headers["Content-Type"] = "application/json"
+
+        r_info = await handle_response_aio(r, data_schema=NameSchema())
+
+        for _ in range(2):
+            with pytest.raises(ValidationError):
+                _ = r_info.loaded
+
+    @pytest.mark.parametrize(
+        "record",
+        [
+            {
+                "id": "0c4d3b1b-8c2e-4d4f-9a8e-3e1b9c6f2a10",
+                "name": "Harry",
+                "wand": None,
+                "courses": ["Potions", "Charms"],
+                "house": {"name": "Gryffindor", "housePoints": 10, "ratio": 1},
+                "rivals": [{"name": "Slytherin", "ratio": 0.5}],
+                "enrolled": "1991-09-01T11:00:00",
+            },
+            {"id": "0c4d3b1b-8c2e-4d4f-9a8e-3e1b9c6f2a10"},
+            {"id": "not-a-uuid", "name": "Harry"},
+            {"id": "0c4d3b1b-8c2e-4d4f-9a8e-3e1b9c6f2a10", "courses": ["Potions", 1]},
+            {"name": "Harry", "house": {"housePoints": "many"}},
+            {"id": "0c4d3b1b-8c2e-4d4f-9a8e-3e1b9c6f2a10", "broom": "Nimbus"},
+            {"id": "0c4d3b1b-8c2e-4d4f-9a8e-3e1b9c6f2a10", "rivals": {"name": "x"}},
+            ["not", "a", "record"],
+        ],
+    )
+    def test_compile_schema_same_output(self, record: Any):
+        schema = StudentSchema()
+        compiled = compile_schema(schema)
+
+        for many, data in [(False, record), (True, [record, record])]:
+            try:
+                expected = schema.load(data, many=many)
+            except ValidationError as error:
+                with pytest.raises(ValidationError) as compiled_error:
+                    compiled.load(data, many=many)
+                assert compiled_error.value.messages == error.messages
+                assert compiled_error.value.valid_data == error.valid_data
+            else:
+                loaded = compiled.load(data, many=many)
+                assert loaded == expected
+                assert compiled.dump(loaded, many=many) == schema.dump(
+                    expected, many=many
+                )
+
+    def test_compile_schema_hooks(self):
+        compiled = compile_schema(NameIDSchema(many=True))
+
+        loaded = compiled.load(
+            [{"id": "0c4d3b1b-8c2e-4d4f-9a8e-3e1b9c6f2a10", "first": "Harry"}],
+            partial=True,
+        )
+        assert loaded[0].first == "Harry"
+
+        names = [Name("Harry", "Potter"), Name("Ron", "Weasley")]
+        compiled = compile_schema(NameSchema(many=True))
+        assert compiled.load(compiled.dump(names)) == names
+        assert isinstance(compiled, NameSchema)
+
+    @pytest.mark.parametrize("partial", [False, None])
+    def test_compile_schema_generated_load(self, partial: Optional[bool]):
+        compiled = compile_schema(NameSchema(many=True, partial=partial))
+
+        def deserialize(*args: Any, **kwargs: Any) -> Any:
+            raise AssertionError("loaded by marshmallow")
+
+        # Marshmallow loads each field through its deserialize method, the generated
+        # code does not.
+        for field in compiled.fields.values():
+            field.deserialize = deserialize
+
+        loaded = compiled.load([{"first": "Harry", "last": "Potter"}] * 5)
+        assert loaded == [Name("Harry", "Potter")] * 5
+
+    def test_compile_schema_copy(self):
+        compiled = compile_schema(NameSchema())
+        assert type(copy.copy(compiled)) is NameSchema
+        assert type(compile_schema(compiled)).__bases__ == (NameSchema,)
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("offload_bytes, offloaded", [(0, True), (2 ** 20, False)])
+    async def test_decode_executor(self, offload_bytes: int, offloaded: bool):
+        threads = list()
+
+        def decode_json(content: bytes) -> Any:
+            threads.append(threading.current_thread())
+            return json.loads(content)
+
+        r = MockResponse(status=200, _json={"first": "Harry", "last": "Potter"})
+        r.headers["Content-Type"] = "application/json"
+
+        with ThreadPoolExecutor(1) as executor:
+            r_info = await handle_response_aio(
+                r,
+                data_schema=NameSchema(),
+                decoders={MimeType.JSON: decode_json},
+                decode_executor=executor,
+                decode_offload_bytes=offload_bytes,
+            )
+
+        assert r_info.loaded == Name("Harry", "Potter")
+        assert (threads[0] is not threading.main_thread()) is offloaded
+
+    @pytest.mark.asyncio
+    async def test_decode_process_pool(self):
+        r = MockResponse(status=200, _json={"first": "Harry", "last": "Potter"})
+        r.headers["Content-Type"] = "application/json"
+
+        with ProcessPoolExecutor(1) as executor:
+            r_info = await handle_response_aio(
+                r, decode_executor=executor, decode_offload_bytes=0
+            )
+
+        assert r_info.loaded == {"first": "Harry", "last": "Potter"}
+
+    @pytest.mark.asyncio
+    async def test_decode_process_pool_sniffed(self):
+        stats = DecodeStats()
+
+        with ProcessPoolExecutor(1) as executor:
+            for _ in range(2):
+                r = MockResponse(status=200, _json={"first": "Harry", "last": "Potter"})
+                r.headers.pop("Content-Type", None)
+
+                r_info = await handle_response_aio(
+                    r,
+                    decode_executor=executor,
+                    decode_offload_bytes=0,
+                    decode_stats=stats,
+                )
+                assert r_info.loaded == {"first": "Harry", "last": "Potter"}
+
+        assert stats.mimetype is MimeType.JSON
+        assert stats.sniffed == 1
+        assert stats.learned == 1
+
+    @pytest.mark.asyncio
+    async def test_decode_executor_error(self):
+        r = MockResponse(status=200, _content=b"{not json")
+        r.headers["Content-Type"] = "application/json"
+
+        with pytest.raises(ContentDecodeError):
+            with ThreadPoolExecutor(1) as executor:
+                try:
+                    await handle_response_aio(
+                        r, decode_executor=executor, decode_offload_bytes=0
+                    )
+                except ContentDecodeError as error:
+                    assert error.response is r
+                    raise error
+
+
+class RecordsSets:
+    def __init__(self, first: str, last: str):
+        self.set: List[str] = list()
+        self.first = first
+        self.last = last
+
+    def __setattr__(self, key: str, value: Any) -> None:
+        if key != "set":
+            self.set.append(key)
+        super().__setattr__(key, value)
+
+
+class TestDefaultUpdater:
+    @pytest.mark.parametrize(
+        "current, new",
+        [
+            (Name("Harry", "Potter"), Name("Hermione", "Granger")),
+            (Name("Harry", "Potter"), {"first": "Hermione", "last": "Granger"}),
+            ({"first": "Harry"}, Name("Hermione", "Granger")),
+            ({"first": "Harry", "house": {}}, {"house": {"name": "Slytherin"}}),
+            ({"first": "Harry"}, {1: "one", "_id": 2}),
+            ([1, 2, 3], [4, 5]),
+        ],
+    )
+    def test_same_as_gemma(self, current: Any, new: Any):
+        expected = copy.deepcopy(current)
+        gemma.Cartographer().map(
+            copy.deepcopy(new), expected, surveyor=gemma.Surveyor()
+        )
+
+        default_updater(current, new)
+        assert current == expected
+
+    def test_unchanged_skipped(self):
+        current = RecordsSets("Harry", "Potter")
+        current.set.clear()
+
+        default_updater(current, {"first": "Harry", "last": "Granger"})
+        assert current.set == ["last"]
+
+        default_updater(current, Name("Hermione", "Granger"))
+        assert current.set == ["last", "first"]
+        assert (current.first, current.last) == ("Hermione", "Granger")
+
+    def test_missing_field(self):
+        current = Name("Harry", "Potter")
+
+        with pytest.raises(gemma.NullNameError):
+            default_updater(current, {"first": "Hermione", "house": "Gryffindor"})
+
+        assert current.first == "Hermione"
+
+    def test_update_collection_dicts(self):
+        harry = {"id": 1, "first": "Harry"}
+        calls = list()
+
+        def updater(current: Any, new: Any) -> None:
+            calls.append(current["id"])
+            default_updater(current, new)
+
+        updated = update_collection(
+            [harry], [{"id": 2}, {"id": 1, "first": "Hermione"}], "id", updater
+        )
+
+        assert updated == [{"id": 2}, {"id": 1, "first": "Hermione"}]
+        assert updated[1] is harry
+        assert calls == [1]
+
+    def test_update_collection_missing_key(self):
+        harry = {"first": "Harry"}
+        ron = Name("Ron", "Weasley")
+
+        updated = update_collection([harry, ron], [{"first": "Hermione"}], "id")
+
+        assert updated == [{"first": "Hermione"}]
+        assert harry == {"first": "Harry"}
+        assert ron == Name("Ron", "Weasley")
+
 
 class TestErrorHandling:
     @pytest.mark.parametrize(
@@ -297,6 +620,164 @@ class TestErrorHandling:
         else:
             raise AssertionError("error not raised")
 
+    @pytest.mark.asyncio
+    async def test_api_error_additional(self):
+        class CustomError(errors_api.APIError):
+            http_code = 400
+            api_code = 2001
+
+        r = MockResponse(_exception=CustomError("custom"))
+        index = {CustomError.api_code: CustomError}
+
+        with pytest.raises(CustomError):
+            await handle_response_aio(r, api_errors_additional=index)
+
+        # The index passed is not added to.
+        assert index == {CustomError.api_code: CustomError}
+
+        with pytest.raises(InvalidAPIErrorCodeError):
+            await handle_response_aio(r)
+
+    @pytest.mark.asyncio
+    async def test_incomplete_error_headers(self):
+        r = MockResponse(status=200)
+        r.headers["error-code"] = "1"
+
+        r_info = await handle_response_aio(r)
+        assert r_info.resp is r
+
+
+class TestStreamItems:
+    @pytest.mark.parametrize("chunk_size", [None, 1, 3])
+    @pytest.mark.asyncio
+    async def test_json_array(self, chunk_size: Optional[int]):
+        names = [
+            {"first": "Harry", "last": 'Pot"ter]'},
+            {"first": "Hermione\\", "last": "Gra,nger"},
+            {"first": "{Ron", "last": "Weasley}"},
+        ]
+        r = MockResponse(status=200, _json=names, _chunk_size=chunk_size)
+
+        r_info = await handle_response_stream_aio(r, data_schema=NameSchema())
+        assert r_info.decoded is None
+
+        loaded = [name async for name in r_info.loaded]
+        assert loaded == [Name(**name) for name in names]
+
+    @pytest.mark.asyncio
+    async def test_json_array_nested_no_schema(self):
+        data = [{"key": [1, {"inner": "]"}]}, [2, 3], "text", 4, None]
+        r = MockResponse(status=200, _json=data, _chunk_size=2)
+
+        r_info = await handle_response_stream_aio(r)
+
+        assert [item async for item in r_info.loaded] == data
+
+    @pytest.mark.asyncio
+    async def test_not_json(self):
+        r = MockResponse(
+            status=200, _bson={"first": "Harry", "last": "Potter"}, _chunk_size=1
+        )
+
+        r_info = await handle_response_stream_aio(r, data_schema=NameSchema())
+
+        assert [name async for name in r_info.loaded] == [Name("Harry", "Potter")]
+
+    @pytest.mark.parametrize(
+        "content", [b'{"first": "Harry"}', b"[1, 2", b"[1,, 2]"],
+    )
+    @pytest.mark.asyncio
+    async def test_malformed(self, content: bytes):
+        r = MockResponse(status=200, _content=content, _content_type=MimeType.JSON)
+
+        r_info = await handle_response_stream_aio(r)
+
+        with pytest.raises(ContentDecodeError):
+            async for _ in r_info.loaded:
+                pass
+
+    @pytest.mark.asyncio
+    async def test_ndjson(self):
+        content = (
+            b'{"first": "Harry", "last": "Potter"}\n\n{"first": "Ron", '
+            b'"last": "Weasley"}\n'
+        )
+        r = MockResponse(status=200, _content=content, _content_type=MimeType.JSON)
+
+        r_info = await handle_response_stream_aio(
+            r, data_schema=NameSchema(), frames="ndjson"
+        )
+
+        loaded = [name async for name in r_info.loaded]
+        assert loaded == [Name("Harry", "Potter"), Name("Ron", "Weasley")]
+
+    @pytest.mark.asyncio
+    async def test_sse(self):
+        content = (
+            b": keep-alive\n\n"
+            b'event: name\nid: 1\ndata: {"first": "Harry",\n'
+            b'data: "last": "Potter"}\n\n'
+            b"retry: 1000\n\n"
+            b'data:{"first": "Ron", "last": "Weasley"}\r\n\r\n'
+            b'data: {"first": "Unfinished"'
+        )
+        r = MockResponse(status=200, _content=content)
+
+        r_info = await handle_response_stream_aio(
+            r, data_schema=NameSchema(), frames="sse"
+        )
+
+        loaded = [name async for name in r_info.loaded]
+        assert loaded == [Name("Harry", "Potter"), Name("Ron", "Weasley")]
+
+    @pytest.mark.asyncio
+    async def test_ndjson_malformed(self):
+        r = MockResponse(status=200, _content=b'{"first": "Harry"}\n{"first":\n')
+
+        r_info = await handle_response_stream_aio(r, frames="ndjson")
+
+        loaded = list()
+        with pytest.raises(ContentDecodeError):
+            async for item in r_info.loaded:
+                loaded.append(item)
+
+        assert loaded == [{"first": "Harry"}]
+
+    @pytest.mark.asyncio
+    async def test_status_checked_before_body(self):
+        r = MockResponse(status=400, _json=[1, 2])
+
+        with pytest.raises(StatusMismatchError):
+            await handle_response_stream_aio(r)
+
+
+class TestEncodeStream:
+    @pytest.mark.parametrize("mimetype", [MimeType.JSON, MimeType.BSON])
+    @pytest.mark.asyncio
+    async def test_chunks(self, mimetype: MimeType):
+        names = [{"first": "Harry", "last": str(i)} for i in range(50)]
+        headers = dict()
+
+        chunks = [
+            chunk
+            async for chunk in encode_stream(
+                names, mimetype=mimetype, headers=headers, chunk_size=256
+            )
+        ]
+
+        assert len(chunks) > 1
+        assert all(len(chunk) < 512 for chunk in chunks)
+        assert headers["Content-Type"] == mimetype.value
+
+        r = MockResponse(status=200, _content=b"".join(chunks), _content_type=mimetype)
+        r_info = await handle_response_aio(r)
+        assert [dict(name) for name in r_info.loaded] == names
+
+    @pytest.mark.asyncio
+    async def test_empty(self):
+        chunks = [chunk async for chunk in encode_stream([])]
+        assert b"".join(chunks) == b"[]"
+
 
 class TestPaging:
     @pytest.mark.asyncio
@@ -393,6 +874,92 @@ class TestPaging:
 
         assert i == 6
 
+    @pytest.mark.asyncio
+    async def test_handle_read_ahead(self):
+        methods = ["get", "get", "get"]
+        harry_json = {"first": "Harry", "last": "Potter"}
+
+        responses = [
+            MockResponse(
+                status=200,
+                headers={"paging-next": "/some/url"},
+                _json=[harry_json, harry_json],
+            )
+            for _ in range(2)
+        ]
+        responses.append(MockResponse(status=200, _json=[harry_json]))
+
+        mock_session = MockSession(method_list=methods, response_list=responses)
+
+        names = list()
+        async for name in iter_paged_aio(
+            session=mock_session,
+            url_base="/test/base",
+            limit=2,
+            data_schema=NameSchema(many=True),
+            return_info=False,
+        ):
+            if not names:
+                await asyncio.sleep(0)
+                # The second page was requested while the first is being consumed.
+                assert len(responses) < 2
+            names.append(name)
+
+        assert names == [Name("Harry", "Potter")] * 5
+
+    @pytest.mark.asyncio
+    async def test_handle_read_ahead_error(self):
+        methods = ["get", "get"]
+        harry_json = {"first": "Harry", "last": "Potter"}
+
+        responses = [
+            MockResponse(
+                status=200, headers={"paging-next": "/some/url"}, _json=[harry_json],
+            ),
+            MockResponse(status=400),
+        ]
+        mock_session = MockSession(method_list=methods, response_list=responses)
+
+        names = list()
+        with pytest.raises(StatusMismatchError):
+            async for name in iter_paged_aio(
+                session=mock_session,
+                url_base="/test/base",
+                limit=1,
+                data_schema=NameSchema(many=True),
+                return_info=False,
+            ):
+                names.append(name)
+
+        assert names == [Name("Harry", "Potter")]
+
+    @pytest.mark.parametrize("prefetch", [0, 1, 3])
+    @pytest.mark.asyncio
+    async def test_handle_break(self, prefetch: int):
+        harry_json = {"first": "Harry", "last": "Potter"}
+        responses = [
+            MockResponse(
+                status=200, headers={"paging-next": "/some/url"}, _json=[harry_json]
+            )
+            for _ in range(10)
+        ]
+
+        mock_session = MockSession(method_list=["get"] * 10, response_list=responses)
+
+        paged = iter_paged_aio(
+            session=mock_session, url_base="/test/base", prefetch=prefetch
+        )
+        async for _ in paged:
+            break
+
+        await paged.aclose()
+        fetched = 10 - len(responses)
+
+        await asyncio.sleep(0.01)
+        # Read-ahead stops once the consumer is done.
+        assert 10 - len(responses) == fetched
+        assert fetched <= 2 + prefetch
+
 
 def validate_name_post(validator: RequestValidator, response: MockResponse):
     TestSpanClient.VALIDATOR_TRIGGERED = True
@@ -426,6 +993,7 @@ class TestClientInit:
 
 class TestSpanClient:
     UUID1 = uuid.uuid4()
+    UUID2 = uuid.uuid4()
 
     @pytest.mark.asyncio
     async def test_context_spawn_session(self):
@@ -456,997 +1024,2930 @@ class TestSpanClient:
 
     @test_utils.mock_aiohttp(
         method="GET",
-        resp=test_utils.MockResponse(
-            status=201, _json={"id": str(UUID1), "first": "Harry", "last": "Potter"}
+        resp=test_utils.MockResponse(),
+        req_validator=test_utils.RequestValidator(
+            headers={"x-name-id": str(UUID1), "x-count": "10"},
+            params={"count": "10", "verbose": "True"},
         ),
-        req_validator=test_utils.RequestValidator(url=f"http://api-host/names/{UUID1}"),
     )
     @pytest.mark.asyncio
-    async def test_basic_client(self):
+    async def test_request_headers_converted(self, get_config: MockConfig = None):
         class APIClient(SpanClient):
-            @handles.get("/names/{name_id}", resp_codes=201, resp_schema=NameIDSchema())
-            async def name_fetch(
-                self, name_id: uuid.UUID, *, req: ClientRequest
-            ) -> NameID:
+            @handles.get("/names", headers={"x-count": 10}, query_params={"count": 10})
+            async def name_fetch(self, *, req: ClientRequest):
+                req.headers["x-name-id"] = TestSpanClient.UUID1
+                req.query_params["verbose"] = True
 
-                req.path_params["name_id"] = name_id
+        sent_headers = list()
+        get_config.req_validator[0].custom_hook = lambda v, r: sent_headers.append(
+            v.req_headers
+        )
 
         client = APIClient(host_name="api-host")
+        await client.name_fetch()
 
-        name = await client.name_fetch(TestSpanClient.UUID1)
-        assert name.id == TestSpanClient.UUID1
-        assert name.first == "Harry"
-        assert name.last == "Potter"
+        assert all(isinstance(value, str) for value in sent_headers[0].values())
+
+    def test_handles_method_cached(self):
+        assert handles.get is handles.get
+        assert handles.get is not handles.post
+        assert handles.get.args == ("get",)
 
-    @test_utils.mock_aiohttp(
-        method="GET",
-        resp=test_utils.MockResponse(),
-        req_validator=test_utils.RequestValidator(url=f"http://api-host/changed"),
-    )
     @pytest.mark.asyncio
-    async def test_basic_client_endpoint_setting_alter(self):
+    async def test_connector_settings(self):
         class APIClient(SpanClient):
-            @handles.get("/original")
-            async def name_fetch(self, *, req: ClientRequest):
-                print("test")
-                assert req.endpoint_settings.endpoint == "/original"
-                req.endpoint_settings.endpoint = "/changed"
-
-        client = APIClient(host_name="api-host")
-
-        await client.name_fetch()
-        await client.name_fetch()
+            CONNECTION_LIMIT = 5
+            CONNECTION_LIMIT_PER_HOST = 2
+            KEEPALIVE_TIMEOUT = 30
+            DNS_CACHE_TTL = 0
+            CONNECTOR_KWARGS = {"force_close": False, "limit": 7}
+
+        async with APIClient(host_name="api-host") as client:
+            connector = client.session.connector
+            assert isinstance(connector, aiohttp.TCPConnector)
+            assert connector.limit == 7
+            assert connector.limit_per_host == 2
+            assert connector._keepalive_timeout == 30
+            assert connector.use_dns_cache is False
 
-    @test_utils.mock_aiohttp(
-        method="GET",
-        resp=(
-            test_utils.MockResponse(status=200, _text="response 1"),
-            test_utils.MockResponse(status=201, _text="response 2"),
-        ),
-    )
     @pytest.mark.asyncio
-    async def test_basic_client_double_response(self):
+    async def test_connector_defaults(self):
         class APIClient(SpanClient):
-            @handles.get("/names", resp_codes=(200, 201))
-            async def name_fetch(self, *, req: ClientRequest) -> aiohttp.ClientResponse:
-                info = await req.execute()
-                return info.resp
+            pass
 
-        client = APIClient(host_name="api-host")
+        async with APIClient(host_name="api-host") as client:
+            connector = client.session.connector
+            assert connector.limit == 100
+            assert connector.limit_per_host == 0
+            assert connector.use_dns_cache is True
 
-        resp1 = await client.name_fetch()
-        assert resp1.status == 200
-        assert await resp1.text() == "response 1"
+    @pytest.mark.asyncio
+    async def test_shared_connector(self):
+        class TenantClient(SpanClient):
+            SHARE_CONNECTOR = True
 
-        resp2 = await client.name_fetch()
-        assert resp2.status == 201
-        assert await resp2.text() == "response 2"
+        class OtherClient(SpanClient):
+            SHARE_CONNECTOR = True
 
-    @test_utils.mock_aiohttp(
-        method="GET",
-        resp=(
-            test_utils.MockResponse(status=200, _text="response 1"),
-            test_utils.MockResponse(status=201, _text="response 2"),
-        ),
-        req_validator=(
-            test_utils.RequestValidator(url=f"http://api-host/names/1"),
-            test_utils.RequestValidator(url=f"http://api-host/names/2"),
-        ),
-    )
-    @pytest.mark.asyncio
-    async def test_basic_client_double_validate(self):
-        class APIClient(SpanClient):
-            @handles.get("/names/{num}", resp_codes=(200, 201))
-            async def name_fetch(
-                self, num: int, *, req: ClientRequest
-            ) -> aiohttp.ClientResponse:
-                req.path_params["num"] = num
-                info = await req.execute()
-                return info.resp
+        class LimitedClient(SpanClient):
+            SHARE_CONNECTOR = True
+            CONNECTION_LIMIT = 5
 
-        client = APIClient(host_name="api-host")
+        client1 = TenantClient(host_name="tenant-1")
+        client2 = OtherClient(host_name="tenant-2")
+        client3 = LimitedClient(host_name="tenant-1")
 
-        resp1 = await client.name_fetch(1)
-        assert resp1.status == 200
-        assert await resp1.text() == "response 1"
+        await client1.start()
+        await client2.start()
+        await client3.start()
 
-        resp2 = await client.name_fetch(2)
-        assert resp2.status == 201
-        assert await resp2.text() == "response 2"
+        connector = client1.session.connector
+        assert client1.session is not client2.session
+        assert client2.session.connector is connector
+        assert client3.session.connector is not connector
 
-    @test_utils.mock_aiohttp(
-        method="GET",
-        resp=(
-            test_utils.MockResponse(status=200, _text="response 1"),
-            test_utils.MockResponse(status=400, _text="response 2"),
-        ),
-    )
-    @pytest.mark.asyncio
-    async def test_basic_client_double_response_bad_status(self):
-        class APIClient(SpanClient):
-            @handles.get("/names", resp_codes=(200, 201))
-            async def name_fetch(self, *, req: ClientRequest) -> aiohttp.ClientResponse:
-                info = await req.execute()
-                return info.resp
+        await client1.close()
+        assert not connector.closed
 
-        client = APIClient(host_name="api-host")
+        await client2.close()
+        assert connector.closed
 
-        resp1 = await client.name_fetch()
-        assert resp1.status == 200
-        assert await resp1.text() == "response 1"
+        await client3.close()
 
-        with pytest.raises(test_utils.StatusMismatchError):
-            await client.name_fetch()
+        async with TenantClient(host_name="tenant-1") as client:
+            assert not client.session.connector.closed
+            assert client.session.connector is not connector
+
+    @pytest.mark.parametrize("close_client", [True, False])
+    def test_shared_connector_loop_released(self, close_client: bool):
+        class TenantClient(SpanClient):
+            SHARE_CONNECTOR = True
+
+        async def use_client():
+            client = TenantClient(host_name="tenant-1")
+            await client.start()
+            if close_client:
+                await client.close()
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(use_client())
+        loop.close()
+        loop_ref = weakref.ref(loop)
+        del loop
+
+        # Borrowing on another loop drops the connectors of closed loops that were
+        # never returned.
+        other_loop = asyncio.new_event_loop()
+        other_loop.run_until_complete(use_client())
+        other_loop.close()
+        gc.collect()
+
+        assert loop_ref() is None
 
-    @test_utils.mock_aiohttp(
-        method="GET",
-        resp=(
-            test_utils.MockResponse(status=200, _text="response 1"),
-            test_utils.MockResponse(status=201, _text="response 2"),
-        ),
-        req_validator=(
-            test_utils.RequestValidator(url=f"http://api-host/names/1"),
-            test_utils.RequestValidator(url=f"http://api-host/names/2"),
-        ),
-    )
     @pytest.mark.asyncio
-    async def test_basic_client_double_validate_fail_second(self):
+    async def test_unshared_connector(self):
         class APIClient(SpanClient):
-            @handles.get("/names/{num}", resp_codes=(200, 201))
-            async def name_fetch(
-                self, num: int, *, req: ClientRequest
-            ) -> aiohttp.ClientResponse:
-                req.path_params["num"] = num
-                info = await req.execute()
-                return info.resp
+            pass
 
-        client = APIClient(host_name="api-host")
+        async with APIClient(host_name="api-host") as client1:
+            async with APIClient(host_name="api-host") as client2:
+                assert client1.session.connector is not client2.session.connector
 
-        resp1 = await client.name_fetch(1)
-        assert resp1.status == 200
-        assert await resp1.text() == "response 1"
+    @test_utils.mock_aiohttp(
+        method="HEAD",
+        resp=test_utils.MockResponse(status=404),
+        req_validator=test_utils.RequestValidator(url="http://api-host/health"),
+    )
+    @pytest.mark.asyncio
+    async def test_warm_connections(self, head_config: MockConfig = None):
+        class APIClient(SpanClient):
+            WARM_CONNECTIONS = 3
+            WARM_PATH = "/health"
 
-        with pytest.raises(test_utils.URLMismatchError):
-            await client.name_fetch(3)
+        calls = list()
+        validator = head_config.req_validator[0]
+        validator.custom_hook = lambda v, r: calls.append(v.req_url)
 
-    VALIDATOR_TRIGGERED = False
+        async with APIClient(host_name="api-host"):
+            assert len(calls) == 3
 
     @test_utils.mock_aiohttp(
-        method="POST",
+        method="GET",
         resp=test_utils.MockResponse(
             status=201, _json={"id": str(UUID1), "first": "Harry", "last": "Potter"}
         ),
-        req_validator=test_utils.RequestValidator(
-            url=f"http://api-host/names/{UUID1}",
-            params={"limit": 10, "offset": 0},
-            headers={"Accept": "application/json", "Content-Type": "application/json"},
-            media={"first": "Harry", "last": "Potter"},
-            custom_hook=validate_name_post,
-        ),
+        req_validator=test_utils.RequestValidator(url=f"http://api-host/names/{UUID1}"),
     )
     @pytest.mark.asyncio
-    async def test_req_validation_client(self):
+    async def test_basic_client(self):
         class APIClient(SpanClient):
-            @handles.post(
-                "/names/{name_id}",
-                req_schema=NameIDSchema(exclude=("id",)),
-                query_params={"limit": 10, "offset": 0},
-                headers={"Accept": "application/json"},
-                resp_codes=201,
-                resp_schema=NameIDSchema(),
-            )
+            @handles.get("/names/{name_id}", resp_codes=201, resp_schema=NameIDSchema())
             async def name_fetch(
                 self, name_id: uuid.UUID, *, req: ClientRequest
             ) -> NameID:
-                req.media = Name("Harry", "Potter")
+
                 req.path_params["name_id"] = name_id
 
         client = APIClient(host_name="api-host")
 
-        assert TestSpanClient.VALIDATOR_TRIGGERED is False
-
         name = await client.name_fetch(TestSpanClient.UUID1)
         assert name.id == TestSpanClient.UUID1
         assert name.first == "Harry"
         assert name.last == "Potter"
 
-        assert TestSpanClient.VALIDATOR_TRIGGERED is True
-
     @test_utils.mock_aiohttp(
-        method="POST",
-        resp=test_utils.MockResponse(status=201),
-        req_validator=test_utils.RequestValidator(url=f"http://api-host/names/{UUID1}"),
+        method="GET",
+        resp=test_utils.MockResponse(
+            status=200, _json=[{"first": "Harry", "last": "Potter"}] * 3, _chunk_size=5,
+        ),
     )
     @pytest.mark.asyncio
-    async def test_result_no_data(self):
+    async def test_stream_items(self):
         class APIClient(SpanClient):
-            @handles.post("/names/{name_id}", resp_codes=201)
-            async def name_fetch(
-                self, name_id: uuid.UUID, *, req: ClientRequest
-            ) -> aiohttp.ClientResponse:
-                req.path_params["name_id"] = name_id
+            @handles.get("/names", resp_schema=NameSchema(), stream_items=True)
+            async def names_stream(self, *, req: ClientRequest) -> AsyncGenerator:
+                ...
 
         client = APIClient(host_name="api-host")
 
-        resp = await client.name_fetch(TestSpanClient.UUID1)
-        assert resp.status == 201
+        names = await client.names_stream()
+        assert [name async for name in names] == [Name("Harry", "Potter")] * 3
 
-    @test_utils.mock_aiohttp(
-        method="POST",
-        resp=test_utils.MockResponse(status=201),
-        req_validator=test_utils.RequestValidator(url=f"http://api-host/names"),
+    @pytest.mark.parametrize("started", [False, True])
+    @pytest.mark.asyncio
+    async def test_stream_items_dropped(self, started: bool):
+        class TrackedResponse(test_utils.MockResponse):
+            released = False
+
+            def release(self) -> None:
+                self.released = True
+
+        class APIClient(SpanClient):
+            @handles.get("/names", resp_schema=NameSchema(), stream_items=True)
+            async def names_stream(self, *, req: ClientRequest) -> AsyncGenerator:
+                ...
+
+        response = TrackedResponse(
+            status=200, _json=[{"first": "Harry", "last": "Potter"}] * 3, _chunk_size=5
+        )
+
+        @test_utils.mock_aiohttp(method="GET", resp=response)
+        async def drop_stream(get_config: MockConfig = None):
+            client = APIClient(host_name="api-host")
+            names = await client.names_stream()
+            if started:
+                assert await names.__anext__() == Name("Harry", "Potter")
+
+        await drop_stream()
+        gc.collect()
+        await asyncio.sleep(0)
+
+        assert response.released
+
+    @pytest.mark.parametrize(
+        "content", [b"[1,]", b"[1, 2 , ]", b"[1] 2", b"[1]]", b"[[1], 2],", b"[,]"]
     )
     @pytest.mark.asyncio
-    async def test_result_returned(self):
+    async def test_stream_items_malformed(self, content: bytes):
         class APIClient(SpanClient):
-            @handles.post("/names", resp_codes=201)
-            async def name_fetch(
-                self, name_id: uuid.UUID, *, req: ClientRequest
-            ) -> str:
-                await req.execute()
-                return "custom"
+            @handles.get("/numbers", stream_items=True)
+            async def numbers_stream(self, *, req: ClientRequest) -> AsyncGenerator:
+                ...
 
-        client = APIClient(host_name="api-host")
+        @test_utils.mock_aiohttp(
+            method="GET",
+            resp=test_utils.MockResponse(
+                status=200,
+                _content=content,
+                _content_type="application/json",
+                _chunk_size=2,
+            ),
+        )
+        async def stream_all(get_config: MockConfig = None):
+            client = APIClient(host_name="api-host")
+            return [number async for number in await client.numbers_stream()]
 
-        resp = await client.name_fetch(TestSpanClient.UUID1)
-        assert resp == "custom"
+        # Rejected like json.loads would, not partly accepted.
+        with pytest.raises(ContentDecodeError):
+            await stream_all()
 
     @test_utils.mock_aiohttp(
         method="GET",
         resp=test_utils.MockResponse(
-            status=200, _json={"id": str(UUID1), "first": "Hermione", "last": "Granger"}
+            status=200,
+            _content=b'{"first": "Harry", "last": "Potter"}\n' * 3,
+            _content_type="application/x-ndjson",
+        ),
+        req_validator=test_utils.RequestValidator(
+            url="http://api-host/names/feed",
+            headers={"Accept": "application/x-ndjson"},
+            params={"house": "gryffindor"},
         ),
-        req_validator=test_utils.RequestValidator(url=f"http://api-host/names/{UUID1}"),
     )
     @pytest.mark.asyncio
-    async def test_update_object(self):
+    async def test_stream_ndjson(self):
         class APIClient(SpanClient):
-            @handles.get(
-                "/names/{name_id}",
-                resp_codes=200,
-                resp_schema=NameIDSchema(load_dataclass=False),
-            )
-            async def name_fetch(self, name: NameID, *, req: ClientRequest) -> NameID:
-
-                req.path_params["name_id"] = name.id
-                req.update_obj = name
+            @handles.stream()
+            @handles.get("/names/feed", resp_schema=NameSchema())
+            async def names_feed(self, house: str, *, req: ClientRequest) -> None:
+                req.query_params["house"] = house
 
         client = APIClient(host_name="api-host")
-        name = NameID(TestSpanClient.UUID1, "Harry", "Potter")
-
-        name_returned = await client.name_fetch(name)
-
-        assert name is name_returned
 
-        assert name.id == TestSpanClient.UUID1
-        assert name.first == "Hermione"
-        assert name.last == "Granger"
+        names = [name async for name in client.names_feed("gryffindor")]
+        assert names == [Name("Harry", "Potter")] * 3
 
     @test_utils.mock_aiohttp(
         method="GET",
         resp=test_utils.MockResponse(
-            status=200, _json={"id": str(UUID1), "first": "Hermione", "last": "Granger"}
+            status=200,
+            # Longer than the lines aiohttp's StreamReader.readline allows.
+            _content=(b'{"first": "' + b"H" * 2 ** 18 + b'", "last": "Potter"}\n') * 2,
+            _content_type="application/x-ndjson",
+            _chunk_size=1000,
         ),
-        req_validator=test_utils.RequestValidator(url=f"http://api-host/names/{UUID1}"),
     )
     @pytest.mark.asyncio
-    async def test_update_object_custom(self):
-        def custom_updater(current: Name, new: dict):
-            current.id = new["id"]
-            current.first = new["first"] + "-custom"
-            current.last = new["last"] + "-custom"
-
+    async def test_stream_ndjson_long_record(self):
         class APIClient(SpanClient):
-            @handles.get(
-                "/names/{name_id}",
-                resp_codes=200,
-                resp_schema=NameIDSchema(load_dataclass=False),
-                data_updater=custom_updater,
-            )
-            async def name_fetch(self, name: NameID, *, req: ClientRequest) -> NameID:
-
-                req.path_params["name_id"] = name.id
-                req.update_obj = name
+            @handles.stream()
+            @handles.get("/names/feed", resp_schema=NameSchema())
+            async def names_feed(self, *, req: ClientRequest) -> None:
+                pass
 
         client = APIClient(host_name="api-host")
-        name = NameID(TestSpanClient.UUID1, "Harry", "Potter")
-
-        name_returned = await client.name_fetch(name)
-
-        assert name is name_returned
 
-        assert name.id == TestSpanClient.UUID1
-        assert name.first == "Hermione-custom"
-        assert name.last == "Granger-custom"
+        names = [name async for name in client.names_feed()]
+        assert names == [Name("H" * 2 ** 18, "Potter")] * 2
 
     @test_utils.mock_aiohttp(
-        method="POST",
-        resp=test_utils.MockResponse(status=200),
-        req_validator=test_utils.RequestValidator(
-            url=f"http://api-host/names", media="Harry Potter"
+        method="GET",
+        resp=test_utils.MockResponse(
+            status=200,
+            _content=b'{"first": "Harry", "last": "Potter"}\n',
+            _content_type="application/x-ndjson",
         ),
     )
     @pytest.mark.asyncio
-    async def test_send_implicit_text(self):
+    async def test_stream_timeout(self):
         class APIClient(SpanClient):
-            @handles.post("/names", resp_codes=200)
-            async def name_fetch(self, *, req: ClientRequest) -> aiohttp.ClientResponse:
-                req.media = "Harry Potter"
+            @handles.stream(read_timeout=30)
+            @handles.get("/names/feed", resp_schema=NameSchema())
+            async def names_feed(self, *, req: ClientRequest) -> None:
+                # Streams are not cut off by the session's total timeout.
+                assert req._stream_timeout.total is None
+                assert req._stream_timeout.sock_read == 30
 
         client = APIClient(host_name="api-host")
 
-        resp = await client.name_fetch()
-        assert resp.status == 200
+        names = [name async for name in client.names_feed()]
+        assert names == [Name("Harry", "Potter")]
 
     @test_utils.mock_aiohttp(
-        method="POST",
-        resp=test_utils.MockResponse(status=200),
+        method="GET",
+        resp=test_utils.MockResponse(
+            status=200,
+            _content=b'data: {"first": "Harry", "last": "Potter"}\n\n' * 3,
+            _content_type="text/event-stream",
+        ),
         req_validator=test_utils.RequestValidator(
-            url=f"http://api-host/names", media=b"Some Bin Data"
+            headers={"Accept": "text/event-stream"},
         ),
     )
     @pytest.mark.asyncio
-    async def test_send_unknown_mimetype(self):
+    async def test_stream_sse_break(self):
         class APIClient(SpanClient):
-            @handles.post("/names", resp_codes=200)
-            async def name_fetch(self, *, req: ClientRequest) -> aiohttp.ClientResponse:
-                req.media = b"Some Bin Data"
-                req.mimetype_send = "application/unknown"
+            @handles.stream(frames="sse")
+            @handles.get("/names/feed", resp_schema=NameSchema())
+            async def names_feed(self, *, req: ClientRequest) -> None:
+                pass
 
         client = APIClient(host_name="api-host")
 
-        resp = await client.name_fetch()
-        assert resp.status == 200
+        feed = client.names_feed()
+        async for name in feed:
+            assert name == Name("Harry", "Potter")
+            break
+
+        await feed.aclose()
 
     @test_utils.mock_aiohttp(
-        method="POST",
-        resp=test_utils.MockResponse(status=200),
-        req_validator=test_utils.RequestValidator(
-            url=f"http://api-host/names", media=b"Some Bin Data"
-        ),
+        method="GET",
+        resp=test_utils.MockResponse(status=200, _content=b"x" * 100, _chunk_size=30),
     )
     @pytest.mark.asyncio
-    async def test_send_unknown_mimetype_error(self):
+    async def test_stream_raw(self):
         class APIClient(SpanClient):
-            @handles.post("/names", resp_codes=200)
-            async def name_fetch(self, *, req: ClientRequest) -> aiohttp.ClientResponse:
-                req.media = {"key": "value"}
-                req.mimetype_send = "application/unknown"
+            @handles.stream(frames="raw")
+            @handles.get("/names/export", resp_schema=NameSchema())
+            async def names_export(self, *, req: ClientRequest) -> None:
+                pass
 
         client = APIClient(host_name="api-host")
 
-        with pytest.raises(ContentTypeUnknownError):
-            await client.name_fetch()
+        chunks = [chunk async for chunk in client.names_export()]
+        assert [len(chunk) for chunk in chunks] == [30, 30, 30, 10]
+        assert b"".join(chunks) == b"x" * 100
 
     @test_utils.mock_aiohttp(
-        method="POST",
-        req_validator=test_utils.RequestValidator(
-            url=f"http://api-host/names",
-            media={"first": "Harry", "last": "Potter"},
-            headers={"Content-Type": MimeType.YAML.value},
-        ),
+        method="GET",
         resp=test_utils.MockResponse(
-            status=200, _yaml={"first": "Ron", "last": "Weasley"}
+            status=200, _json={"first": "Harry", "last": "Potter"}
         ),
     )
     @pytest.mark.asyncio
-    async def test_yaml_round_trip_schema(self):
+    async def test_raw_body(self):
         class APIClient(SpanClient):
-            @handles.post(
-                "/names",
-                req_schema=NameSchema(),
-                resp_codes=200,
-                resp_schema=NameSchema(),
-            )
-            async def name_fetch(self, *, req: ClientRequest) -> aiohttp.ClientResponse:
-                req.media = Name("Harry", "Potter")
-                req.mimetype_send = MimeType.YAML
+            @handles.get("/names/1", resp_schema=NameSchema(), raw_body=True)
+            async def name_fetch(self, *, req: ClientRequest) -> None:
+                pass
 
         client = APIClient(host_name="api-host")
 
-        response = await client.name_fetch()
-        assert response == Name("Ron", "Weasley")
+        body = await client.name_fetch()
+        assert isinstance(body, RawBody)
+        assert body.mimetype is MimeType.JSON
+        assert json.loads(body.content) == {"first": "Harry", "last": "Potter"}
 
     @test_utils.mock_aiohttp(
-        method="POST",
-        req_validator=test_utils.RequestValidator(
-            url=f"http://api-host/names",
-            media={"first": "Harry", "last": "Potter"},
-            headers={"Content-Type": MimeType.BSON.value},
-        ),
+        method="GET",
         resp=test_utils.MockResponse(
-            status=200, _bson={"first": "Ron", "last": "Weasley"}
+            status=200, _json={"first": "Harry", "last": "Potter"}
         ),
     )
     @pytest.mark.asyncio
-    async def test_bson_round_trip_schema(self):
+    async def test_raw_body_coalesced_update_obj(self):
         class APIClient(SpanClient):
-            @handles.post(
-                "/names",
-                req_schema=NameSchema(),
-                resp_codes=200,
-                resp_schema=NameSchema(),
+            @handles.get(
+                "/names/1", resp_schema=NameSchema(), raw_body=True, coalesce=True
             )
-            async def name_fetch(self, *, req: ClientRequest) -> aiohttp.ClientResponse:
-                req.media = Name("Harry", "Potter")
-                req.mimetype_send = MimeType.BSON
+            async def name_fetch(self, name: Name, *, req: ClientRequest) -> None:
+                req.update_obj = name
 
         client = APIClient(host_name="api-host")
 
-        response = await client.name_fetch()
-        assert response == Name("Ron", "Weasley")
+        name = Name("Ron", "Weasley")
+        body = await client.name_fetch(name)
+
+        assert isinstance(body, RawBody)
+        assert name == Name("Ron", "Weasley")
 
     @test_utils.mock_aiohttp(
-        method="POST",
-        req_validator=test_utils.RequestValidator(
-            url=f"http://api-host/names",
-            media=[
-                {"first": "Harry", "last": "Potter"},
-                {"first": "Draco", "last": "Malfoy"},
-            ],
-            headers={"Content-Type": MimeType.BSON.value},
-        ),
+        method="GET",
         resp=test_utils.MockResponse(
             status=200,
-            _bson=[
-                {"first": "Ron", "last": "Weasley"},
-                {"first": "Hermione", "last": "Granger"},
-            ],
+            headers={"Cache-Control": "max-age=60"},
+            _json={"first": "Harry", "last": "Potter"},
         ),
     )
     @pytest.mark.asyncio
-    async def test_bson_list_round_trip_schema(self):
+    async def test_raw_body_shared_url(self):
+        schema = NameSchema()
+
         class APIClient(SpanClient):
-            @handles.post(
-                "/names",
-                req_schema=NameSchema(many=True),
-                resp_codes=200,
-                resp_schema=NameSchema(many=True),
-            )
-            async def name_fetch(self, *, req: ClientRequest) -> aiohttp.ClientResponse:
-                req.media = [Name("Harry", "Potter"), Name("Draco", "Malfoy")]
-                req.mimetype_send = MimeType.BSON
+            @handles.get("/names/1", resp_schema=schema, coalesce=True)
+            async def name_fetch(self, *, req: ClientRequest) -> Name:
+                pass
 
-        client = APIClient(host_name="api-host")
+            @handles.get("/names/1", resp_schema=schema, coalesce=True, raw_body=True)
+            async def name_fetch_raw(self, *, req: ClientRequest) -> None:
+                pass
 
-        response = await client.name_fetch()
-        assert response == [Name("Ron", "Weasley"), Name("Hermione", "Granger")]
+        async with APIClient(host_name="api-host", cache=ResponseCache()) as client:
+            name, body = await asyncio.gather(
+                client.name_fetch(), client.name_fetch_raw()
+            )
+            assert name == Name("Harry", "Potter")
+            assert isinstance(body, RawBody)
+
+            assert await client.name_fetch() is name
+            assert isinstance(await client.name_fetch_raw(), RawBody)
 
     @test_utils.mock_aiohttp(
-        method="POST",
+        method="GET",
         resp=test_utils.MockResponse(
-            status=200,
-            _content=yaml.safe_dump({"first": "Ron", "last": "Weasley"}).encode(),
+            _json={"first": "Harry", "last": "Potter"},
+            _exception=errors_api.InvalidMethodError("bad method"),
         ),
     )
     @pytest.mark.asyncio
-    async def test_sniff_return_content(self):
+    async def test_raw_body_error(self):
         class APIClient(SpanClient):
-            @handles.post("/names", resp_codes=200, resp_schema=NameSchema())
-            async def name_fetch(self, *, req: ClientRequest) -> aiohttp.ClientResponse:
+            @handles.get("/names/1", raw_body=True)
+            async def name_fetch(self, *, req: ClientRequest) -> None:
                 pass
 
         client = APIClient(host_name="api-host")
 
-        response = await client.name_fetch()
-        assert response == Name("Ron", "Weasley")
+        with pytest.raises(errors_api.InvalidMethodError):
+            await client.name_fetch()
 
-    @test_utils.mock_aiohttp(
-        method="POST",
-        resp=test_utils.MockResponse(status=200),
-        req_validator=test_utils.RequestValidator(
-            headers={"Accept": MimeType.YAML.value}
-        ),
-    )
     @pytest.mark.asyncio
-    async def test_accept_mimetype(self):
+    async def test_stream_async_iterable(self):
+        class Names:
+            def __aiter__(self) -> "Names":
+                self.remaining = 2
+                return self
+
+            async def __anext__(self) -> Name:
+                if not self.remaining:
+                    raise StopAsyncIteration
+                self.remaining -= 1
+                return Name("Harry", "Potter")
+
         class APIClient(SpanClient):
-            @handles.post("/names", mimetype_accept=MimeType.YAML, resp_codes=200)
-            async def name_fetch(self, *, req: ClientRequest) -> aiohttp.ClientResponse:
-                pass
+            @handles.stream()
+            async def names_feed(self, *, req: ClientRequest) -> Names:
+                return Names()
 
         client = APIClient(host_name="api-host")
 
-        await client.name_fetch()
+        names = [name async for name in client.names_feed()]
+        assert names == [Name("Harry", "Potter")] * 2
+
+    def test_stream_unknown_frames(self):
+        with pytest.raises(ValueError):
+            handles.stream(frames="xml")
 
     @test_utils.mock_aiohttp(
         method="GET",
-        req_validator=[
-            # Validator 1
-            test_utils.RequestValidator(
-                headers={"Accept": MimeType.JSON.value},
-                params={"paging-offset": 0, "paging-limit": 2},
-            ),
-            # Validator 2
-            test_utils.RequestValidator(
-                headers={"Accept": MimeType.JSON.value},
-                params={"paging-offset": 2, "paging-limit": 2},
-            ),
-        ],
-        resp=[
-            # Response 1
-            test_utils.MockResponse(
-                status=200,
-                headers={"paging-next": "some_page"},
-                _json=[
-                    {"first": "Harry", "last": "Potter"},
-                    {"first": "Ron", "last": "Weasley"},
-                ],
-            ),
-            # Response 2
-            test_utils.MockResponse(
-                status=200,
-                _json=[
-                    {"first": "Hermione", "last": "Granger"},
-                    {"first": "Draco", "last": "Malfoy"},
-                ],
-            ),
-        ],
+        resp=test_utils.MockResponse(),
+        req_validator=test_utils.RequestValidator(url=f"http://api-host/changed"),
     )
     @pytest.mark.asyncio
-    async def test_paged(self):
+    async def test_basic_client_endpoint_setting_alter(self):
         class APIClient(SpanClient):
-            @handles.paged(limit=2)
-            @handles.get(
-                "/names",
-                mimetype_accept=MimeType.JSON,
-                resp_codes=200,
-                resp_schema=NameSchema(many=True),
-            )
-            async def name_fetch(
-                self, *, req: ClientRequest
-            ) -> AsyncGenerator[Name, None]:
-                pass
+            @handles.get("/original")
+            async def name_fetch(self, *, req: ClientRequest):
+                print("test")
+                assert req.endpoint_settings.endpoint == "/original"
+                req.endpoint_settings.endpoint = "/changed"
 
         client = APIClient(host_name="api-host")
 
-        names = list()
-        async for name in client.name_fetch():
-            print(name)
-            names.append(name)
-
-        assert names == [
-            Name("Harry", "Potter"),
-            Name("Ron", "Weasley"),
-            Name("Hermione", "Granger"),
-            Name("Draco", "Malfoy"),
-        ]
+        await client.name_fetch()
+        await client.name_fetch()
 
     @test_utils.mock_aiohttp(
-        method="GET",
-        req_validator=[
-            # Validator 1
-            test_utils.RequestValidator(
-                headers={"Accept": MimeType.BSON.value},
-                params={"paging-offset": 0, "paging-limit": 2},
-            )
-        ],
-        resp=[
-            # Response 1
-            test_utils.MockResponse(
-                status=200, _bson=[{"first": "Harry", "last": "Potter"}]
-            )
-        ],
+        method="GET", resp=test_utils.MockResponse(),
     )
     @pytest.mark.asyncio
-    async def test_paged_single_bson(self):
+    async def test_endpoint_settings_shared_until_accessed(self):
+        requests = list()
+
         class APIClient(SpanClient):
-            @handles.paged(limit=2)
-            @handles.get(
-                "/names",
-                mimetype_accept=MimeType.BSON,
-                resp_codes=200,
-                resp_schema=NameSchema(many=True),
-            )
-            async def name_fetch(
-                self, *, req: ClientRequest
-            ) -> AsyncGenerator[Name, None]:
-                pass
+            @handles.get("/names")
+            async def name_fetch(self, *, req: ClientRequest):
+                requests.append(req)
 
         client = APIClient(host_name="api-host")
+        await client.name_fetch()
 
-        names = list()
-        async for name in client.name_fetch():
-            print(name)
-            names.append(name)
+        req = requests[0]
+        assert not hasattr(req, "__dict__")
+        assert req._settings is APIClient.name_fetch._endpoint_settings
 
-        assert names == [Name("Harry", "Potter")]
+        assert req.endpoint_settings is not APIClient.name_fetch._endpoint_settings
+        assert req.endpoint_settings is req.endpoint_settings
 
     @test_utils.mock_aiohttp(
         method="GET",
-        req_validator=[
-            # Validator 1
-            test_utils.RequestValidator(
-                headers={"Accept": MimeType.JSON.value},
-                params={"paging-offset": 0, "paging-limit": 2},
-            ),
-            # Validator 2
-            test_utils.RequestValidator(
-                headers={"Accept": MimeType.JSON.value},
-                params={"paging-offset": 2, "paging-limit": 2},
-            ),
-        ],
-        resp=[
-            # Response 1
-            test_utils.MockResponse(
-                status=200,
-                headers={"paging-next": "some_page"},
-                _json=[
-                    {"first": "Harry", "last": "Potter"},
-                    {"first": "Ron", "last": "Weasley"},
-                ],
-            ),
-            # Response 2
-            test_utils.MockResponse(
-                status=200,
-                _json=[
-                    {"first": "Hermione", "last": "Granger"},
-                    {"first": "Draco", "last": "Malfoy"},
-                ],
-            ),
-        ],
+        resp=(
+            test_utils.MockResponse(status=200, _text="response 1"),
+            test_utils.MockResponse(status=201, _text="response 2"),
+        ),
     )
     @pytest.mark.asyncio
-    async def test_paged_limit_override(self):
+    async def test_basic_client_double_response(self):
         class APIClient(SpanClient):
-            @handles.paged(limit=50)
-            @handles.get(
-                "/names",
-                mimetype_accept=MimeType.JSON,
-                resp_codes=200,
-                resp_schema=NameSchema(many=True),
-            )
-            async def name_fetch(
-                self, limit: int, *, req: ClientRequest
-            ) -> AsyncGenerator[Name, None]:
-                req.paging.limit = limit
+            @handles.get("/names", resp_codes=(200, 201))
+            async def name_fetch(self, *, req: ClientRequest) -> aiohttp.ClientResponse:
+                info = await req.execute()
+                return info.resp
 
         client = APIClient(host_name="api-host")
 
-        names = list()
-        async for name in client.name_fetch(2):
-            print(name)
-            names.append(name)
+        resp1 = await client.name_fetch()
+        assert resp1.status == 200
+        assert await resp1.text() == "response 1"
+
+        resp2 = await client.name_fetch()
+        assert resp2.status == 201
+        assert await resp2.text() == "response 2"
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        resp=(
+            test_utils.MockResponse(status=200, _text="response 1"),
+            test_utils.MockResponse(status=201, _text="response 2"),
+        ),
+        req_validator=(
+            test_utils.RequestValidator(url=f"http://api-host/names/1"),
+            test_utils.RequestValidator(url=f"http://api-host/names/2"),
+        ),
+    )
+    @pytest.mark.asyncio
+    async def test_basic_client_double_validate(self):
+        class APIClient(SpanClient):
+            @handles.get("/names/{num}", resp_codes=(200, 201))
+            async def name_fetch(
+                self, num: int, *, req: ClientRequest
+            ) -> aiohttp.ClientResponse:
+                req.path_params["num"] = num
+                info = await req.execute()
+                return info.resp
+
+        client = APIClient(host_name="api-host")
+
+        resp1 = await client.name_fetch(1)
+        assert resp1.status == 200
+        assert await resp1.text() == "response 1"
+
+        resp2 = await client.name_fetch(2)
+        assert resp2.status == 201
+        assert await resp2.text() == "response 2"
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        resp=(
+            test_utils.MockResponse(status=200, _text="response 1"),
+            test_utils.MockResponse(status=400, _text="response 2"),
+        ),
+    )
+    @pytest.mark.asyncio
+    async def test_basic_client_double_response_bad_status(self):
+        class APIClient(SpanClient):
+            @handles.get("/names", resp_codes=(200, 201))
+            async def name_fetch(self, *, req: ClientRequest) -> aiohttp.ClientResponse:
+                info = await req.execute()
+                return info.resp
+
+        client = APIClient(host_name="api-host")
+
+        resp1 = await client.name_fetch()
+        assert resp1.status == 200
+        assert await resp1.text() == "response 1"
+
+        with pytest.raises(test_utils.StatusMismatchError):
+            await client.name_fetch()
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        resp=(
+            test_utils.MockResponse(status=200, _text="response 1"),
+            test_utils.MockResponse(status=201, _text="response 2"),
+        ),
+        req_validator=(
+            test_utils.RequestValidator(url=f"http://api-host/names/1"),
+            test_utils.RequestValidator(url=f"http://api-host/names/2"),
+        ),
+    )
+    @pytest.mark.asyncio
+    async def test_basic_client_double_validate_fail_second(self):
+        class APIClient(SpanClient):
+            @handles.get("/names/{num}", resp_codes=(200, 201))
+            async def name_fetch(
+                self, num: int, *, req: ClientRequest
+            ) -> aiohttp.ClientResponse:
+                req.path_params["num"] = num
+                info = await req.execute()
+                return info.resp
+
+        client = APIClient(host_name="api-host")
+
+        resp1 = await client.name_fetch(1)
+        assert resp1.status == 200
+        assert await resp1.text() == "response 1"
+
+        with pytest.raises(test_utils.URLMismatchError):
+            await client.name_fetch(3)
+
+    VALIDATOR_TRIGGERED = False
+
+    @test_utils.mock_aiohttp(
+        method="POST",
+        resp=test_utils.MockResponse(
+            status=201, _json={"id": str(UUID1), "first": "Harry", "last": "Potter"}
+        ),
+        req_validator=test_utils.RequestValidator(
+            url=f"http://api-host/names/{UUID1}",
+            params={"limit": 10, "offset": 0},
+            headers={"Accept": "application/json", "Content-Type": "application/json"},
+            media={"first": "Harry", "last": "Potter"},
+            custom_hook=validate_name_post,
+        ),
+    )
+    @pytest.mark.asyncio
+    async def test_req_validation_client(self):
+        class APIClient(SpanClient):
+            @handles.post(
+                "/names/{name_id}",
+                req_schema=NameIDSchema(exclude=("id",)),
+                query_params={"limit": 10, "offset": 0},
+                headers={"Accept": "application/json"},
+                resp_codes=201,
+                resp_schema=NameIDSchema(),
+            )
+            async def name_fetch(
+                self, name_id: uuid.UUID, *, req: ClientRequest
+            ) -> NameID:
+                req.media = Name("Harry", "Potter")
+                req.path_params["name_id"] = name_id
+
+        client = APIClient(host_name="api-host")
+
+        assert TestSpanClient.VALIDATOR_TRIGGERED is False
+
+        name = await client.name_fetch(TestSpanClient.UUID1)
+        assert name.id == TestSpanClient.UUID1
+        assert name.first == "Harry"
+        assert name.last == "Potter"
+
+        assert TestSpanClient.VALIDATOR_TRIGGERED is True
+
+    @test_utils.mock_aiohttp(
+        method="POST",
+        resp=test_utils.MockResponse(status=201),
+        req_validator=test_utils.RequestValidator(url=f"http://api-host/names/{UUID1}"),
+    )
+    @pytest.mark.asyncio
+    async def test_result_no_data(self):
+        class APIClient(SpanClient):
+            @handles.post("/names/{name_id}", resp_codes=201)
+            async def name_fetch(
+                self, name_id: uuid.UUID, *, req: ClientRequest
+            ) -> aiohttp.ClientResponse:
+                req.path_params["name_id"] = name_id
+
+        client = APIClient(host_name="api-host")
+
+        resp = await client.name_fetch(TestSpanClient.UUID1)
+        assert resp.status == 201
+
+    @test_utils.mock_aiohttp(
+        method="POST",
+        resp=test_utils.MockResponse(status=201),
+        req_validator=test_utils.RequestValidator(url=f"http://api-host/names"),
+    )
+    @pytest.mark.asyncio
+    async def test_result_returned(self):
+        class APIClient(SpanClient):
+            @handles.post("/names", resp_codes=201)
+            async def name_fetch(
+                self, name_id: uuid.UUID, *, req: ClientRequest
+            ) -> str:
+                await req.execute()
+                return "custom"
+
+        client = APIClient(host_name="api-host")
+
+        resp = await client.name_fetch(TestSpanClient.UUID1)
+        assert resp == "custom"
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        resp=test_utils.MockResponse(
+            status=200, _json={"id": str(UUID1), "first": "Hermione", "last": "Granger"}
+        ),
+        req_validator=test_utils.RequestValidator(url=f"http://api-host/names/{UUID1}"),
+    )
+    @pytest.mark.asyncio
+    async def test_update_object(self):
+        class APIClient(SpanClient):
+            @handles.get(
+                "/names/{name_id}",
+                resp_codes=200,
+                resp_schema=NameIDSchema(load_dataclass=False),
+            )
+            async def name_fetch(self, name: NameID, *, req: ClientRequest) -> NameID:
+
+                req.path_params["name_id"] = name.id
+                req.update_obj = name
+
+        client = APIClient(host_name="api-host")
+        name = NameID(TestSpanClient.UUID1, "Harry", "Potter")
+
+        name_returned = await client.name_fetch(name)
+
+        assert name is name_returned
+
+        assert name.id == TestSpanClient.UUID1
+        assert name.first == "Hermione"
+        assert name.last == "Granger"
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        resp=test_utils.MockResponse(
+            status=200, _json={"id": str(UUID1), "first": "Hermione", "last": "Granger"}
+        ),
+        req_validator=test_utils.RequestValidator(url=f"http://api-host/names/{UUID1}"),
+    )
+    @pytest.mark.asyncio
+    async def test_update_object_custom(self):
+        def custom_updater(current: Name, new: dict):
+            current.id = new["id"]
+            current.first = new["first"] + "-custom"
+            current.last = new["last"] + "-custom"
+
+        class APIClient(SpanClient):
+            @handles.get(
+                "/names/{name_id}",
+                resp_codes=200,
+                resp_schema=NameIDSchema(load_dataclass=False),
+                data_updater=custom_updater,
+            )
+            async def name_fetch(self, name: NameID, *, req: ClientRequest) -> NameID:
+
+                req.path_params["name_id"] = name.id
+                req.update_obj = name
+
+        client = APIClient(host_name="api-host")
+        name = NameID(TestSpanClient.UUID1, "Harry", "Potter")
+
+        name_returned = await client.name_fetch(name)
+
+        assert name is name_returned
+
+        assert name.id == TestSpanClient.UUID1
+        assert name.first == "Hermione-custom"
+        assert name.last == "Granger-custom"
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        resp=test_utils.MockResponse(
+            status=200,
+            _json=[
+                {"id": str(UUID2), "first": "Ron", "last": "Weasley"},
+                {"id": str(UUID1), "first": "Hermione", "last": "Granger"},
+            ],
+        ),
+        req_validator=test_utils.RequestValidator(url=f"http://api-host/names"),
+    )
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("as_mapping", [False, True])
+    async def test_update_collection(self, as_mapping: bool, get_config=None):
+        class APIClient(SpanClient):
+            @handles.get("/names", resp_schema=NameIDSchema(many=True), update_key="id")
+            async def names_refresh(
+                self, names: Any, *, req: ClientRequest
+            ) -> List[NameID]:
+                req.update_obj = names
+
+        harry = NameID(TestSpanClient.UUID1, "Harry", "Potter")
+        draco = NameID(uuid.uuid4(), "Draco", "Malfoy")
+        names = [harry, draco]
+        if as_mapping:
+            names = {name.id: name for name in names}
+
+        async with APIClient(host_name="api-host") as client:
+            refreshed = await client.names_refresh(names)
+
+        assert refreshed[1] is harry
+        assert harry == NameID(TestSpanClient.UUID1, "Hermione", "Granger")
+        assert refreshed[0] == NameID(TestSpanClient.UUID2, "Ron", "Weasley")
+        assert draco.first == "Draco"
+
+    @test_utils.mock_aiohttp(
+        method="POST",
+        resp=test_utils.MockResponse(status=200),
+        req_validator=test_utils.RequestValidator(
+            url=f"http://api-host/names", media="Harry Potter"
+        ),
+    )
+    @pytest.mark.asyncio
+    async def test_send_implicit_text(self):
+        class APIClient(SpanClient):
+            @handles.post("/names", resp_codes=200)
+            async def name_fetch(self, *, req: ClientRequest) -> aiohttp.ClientResponse:
+                req.media = "Harry Potter"
+
+        client = APIClient(host_name="api-host")
+
+        resp = await client.name_fetch()
+        assert resp.status == 200
+
+    @test_utils.mock_aiohttp(
+        method="POST",
+        resp=test_utils.MockResponse(status=200),
+        req_validator=test_utils.RequestValidator(
+            url=f"http://api-host/names", media=b"Some Bin Data"
+        ),
+    )
+    @pytest.mark.asyncio
+    async def test_send_unknown_mimetype(self):
+        class APIClient(SpanClient):
+            @handles.post("/names", resp_codes=200)
+            async def name_fetch(self, *, req: ClientRequest) -> aiohttp.ClientResponse:
+                req.media = b"Some Bin Data"
+                req.mimetype_send = "application/unknown"
+
+        client = APIClient(host_name="api-host")
+
+        resp = await client.name_fetch()
+        assert resp.status == 200
+
+    @test_utils.mock_aiohttp(
+        method="POST",
+        resp=test_utils.MockResponse(status=200),
+        req_validator=test_utils.RequestValidator(
+            url=f"http://api-host/names", media=b"Some Bin Data"
+        ),
+    )
+    @pytest.mark.asyncio
+    async def test_send_unknown_mimetype_error(self):
+        class APIClient(SpanClient):
+            @handles.post("/names", resp_codes=200)
+            async def name_fetch(self, *, req: ClientRequest) -> aiohttp.ClientResponse:
+                req.media = {"key": "value"}
+                req.mimetype_send = "application/unknown"
+
+        client = APIClient(host_name="api-host")
+
+        with pytest.raises(ContentTypeUnknownError):
+            await client.name_fetch()
+
+    @test_utils.mock_aiohttp(
+        method="POST",
+        resp=test_utils.MockResponse(status=201),
+        req_validator=test_utils.RequestValidator(
+            url="http://api-host/names/import",
+            media=[{"first": "Harry", "last": "Potter"}] * 3,
+            headers={"Content-Type": MimeType.JSON.value},
+        ),
+    )
+    @pytest.mark.asyncio
+    async def test_send_stream_async_gen(self):
+        async def names() -> AsyncGenerator[Name, None]:
+            for _ in range(3):
+                yield Name("Harry", "Potter")
+
+        class APIClient(SpanClient):
+            @handles.post("/names/import", req_schema=NameSchema(), resp_codes=201)
+            async def names_import(self, *, req: ClientRequest) -> None:
+                req.media = names()
+
+        client = APIClient(host_name="api-host")
+
+        resp = await client.names_import()
+        assert resp.status == 201
+
+    @test_utils.mock_aiohttp(
+        method="POST",
+        resp=test_utils.MockResponse(status=201),
+        req_validator=test_utils.RequestValidator(
+            url="http://api-host/names/import",
+            media=[{"first": "Harry", "last": "Potter"}] * 3,
+            headers={"Content-Type": MimeType.BSON.value},
+        ),
+    )
+    @pytest.mark.asyncio
+    async def test_send_stream_list_bson(self):
+        class APIClient(SpanClient):
+            @handles.post(
+                "/names/import",
+                req_schema=NameSchema(),
+                resp_codes=201,
+                mimetype_send=MimeType.BSON,
+                stream_media=True,
+            )
+            async def names_import(self, *, req: ClientRequest) -> None:
+                req.media = [Name("Harry", "Potter")] * 3
+
+        client = APIClient(host_name="api-host")
+
+        resp = await client.names_import()
+        assert resp.status == 201
+
+    @test_utils.mock_aiohttp(
+        method="POST",
+        resp=test_utils.MockResponse(status=201),
+        req_validator=test_utils.RequestValidator(
+            url="http://api-host/names/import",
+            media=[{"first": "Harry", "last": "Potter"}] * 3,
+            headers={"Content-Type": MimeType.JSON.value},
+        ),
+    )
+    @pytest.mark.asyncio
+    async def test_send_stream_list_many_schema(self):
+        class APIClient(SpanClient):
+            @handles.post(
+                "/names/import",
+                req_schema=NameSchema(many=True),
+                resp_codes=201,
+                stream_media=True,
+            )
+            async def names_import(self, *, req: ClientRequest) -> None:
+                req.media = [Name("Harry", "Potter")] * 3
+
+        client = APIClient(host_name="api-host")
+
+        resp = await client.names_import()
+        assert resp.status == 201
+
+    @pytest.mark.asyncio
+    async def test_send_stream_unknown_mimetype(self):
+        async def names() -> AsyncGenerator[Name, None]:
+            yield Name("Harry", "Potter")
+
+        class APIClient(SpanClient):
+            @handles.post("/names/import", mimetype_send=MimeType.YAML)
+            async def names_import(self, *, req: ClientRequest) -> None:
+                req.media = names()
+
+        client = APIClient(host_name="api-host")
+
+        with pytest.raises(ContentTypeUnknownError):
+            await client.names_import()
+
+    @test_utils.mock_aiohttp(
+        method="POST",
+        req_validator=test_utils.RequestValidator(
+            url=f"http://api-host/names",
+            media={"first": "Harry", "last": "Potter"},
+            headers={"Content-Type": MimeType.YAML.value},
+        ),
+        resp=test_utils.MockResponse(
+            status=200, _yaml={"first": "Ron", "last": "Weasley"}
+        ),
+    )
+    @pytest.mark.asyncio
+    async def test_yaml_round_trip_schema(self):
+        class APIClient(SpanClient):
+            @handles.post(
+                "/names",
+                req_schema=NameSchema(),
+                resp_codes=200,
+                resp_schema=NameSchema(),
+            )
+            async def name_fetch(self, *, req: ClientRequest) -> aiohttp.ClientResponse:
+                req.media = Name("Harry", "Potter")
+                req.mimetype_send = MimeType.YAML
+
+        client = APIClient(host_name="api-host")
+
+        response = await client.name_fetch()
+        assert response == Name("Ron", "Weasley")
+
+    @test_utils.mock_aiohttp(
+        method="POST",
+        req_validator=test_utils.RequestValidator(
+            url=f"http://api-host/names",
+            media={"first": "Harry", "last": "Potter"},
+            headers={"Content-Type": MimeType.BSON.value},
+        ),
+        resp=test_utils.MockResponse(
+            status=200, _bson={"first": "Ron", "last": "Weasley"}
+        ),
+    )
+    @pytest.mark.asyncio
+    async def test_bson_round_trip_schema(self):
+        class APIClient(SpanClient):
+            @handles.post(
+                "/names",
+                req_schema=NameSchema(),
+                resp_codes=200,
+                resp_schema=NameSchema(),
+            )
+            async def name_fetch(self, *, req: ClientRequest) -> aiohttp.ClientResponse:
+                req.media = Name("Harry", "Potter")
+                req.mimetype_send = MimeType.BSON
+
+        client = APIClient(host_name="api-host")
+
+        response = await client.name_fetch()
+        assert response == Name("Ron", "Weasley")
+
+    @test_utils.mock_aiohttp(
+        method="POST",
+        req_validator=test_utils.RequestValidator(
+            url=f"http://api-host/names",
+            media=[
+                {"first": "Harry", "last": "Potter"},
+                {"first": "Draco", "last": "Malfoy"},
+            ],
+            headers={"Content-Type": MimeType.BSON.value},
+        ),
+        resp=test_utils.MockResponse(
+            status=200,
+            _bson=[
+                {"first": "Ron", "last": "Weasley"},
+                {"first": "Hermione", "last": "Granger"},
+            ],
+        ),
+    )
+    @pytest.mark.asyncio
+    async def test_bson_list_round_trip_schema(self):
+        class APIClient(SpanClient):
+            @handles.post(
+                "/names",
+                req_schema=NameSchema(many=True),
+                resp_codes=200,
+                resp_schema=NameSchema(many=True),
+            )
+            async def name_fetch(self, *, req: ClientRequest) -> aiohttp.ClientResponse:
+                req.media = [Name("Harry", "Potter"), Name("Draco", "Malfoy")]
+                req.mimetype_send = MimeType.BSON
+
+        client = APIClient(host_name="api-host")
+
+        response = await client.name_fetch()
+        assert response == [Name("Ron", "Weasley"), Name("Hermione", "Granger")]
+
+    @test_utils.mock_aiohttp(
+        method="POST",
+        req_validator=test_utils.RequestValidator(
+            url=f"http://api-host/names",
+            media=[
+                {"first": "Harry", "last": "Potter"},
+                {"first": "Draco", "last": "Malfoy"},
+            ],
+        ),
+        resp=test_utils.MockResponse(
+            status=200,
+            _json=[
+                {"first": "Ron", "last": "Weasley"},
+                {"first": "Hermione", "last": "Granger"},
+            ],
+        ),
+    )
+    @pytest.mark.asyncio
+    async def test_compile_schemas_round_trip(self):
+        class APIClient(SpanClient):
+            @handles.post(
+                "/names",
+                req_schema=NameSchema(many=True),
+                resp_codes=200,
+                resp_schema=NameSchema(many=True),
+                compile_schemas=True,
+            )
+            async def name_fetch(self, *, req: ClientRequest) -> aiohttp.ClientResponse:
+                req.media = [Name("Harry", "Potter"), Name("Draco", "Malfoy")]
+
+        client = APIClient(host_name="api-host")
+
+        response = await client.name_fetch()
+        assert response == [Name("Ron", "Weasley"), Name("Hermione", "Granger")]
+
+    @test_utils.mock_aiohttp(
+        method="POST",
+        resp=test_utils.MockResponse(
+            status=200,
+            _content=yaml.safe_dump({"first": "Ron", "last": "Weasley"}).encode(),
+        ),
+    )
+    @pytest.mark.asyncio
+    async def test_sniff_return_content(self):
+        class APIClient(SpanClient):
+            @handles.post("/names", resp_codes=200, resp_schema=NameSchema())
+            async def name_fetch(self, *, req: ClientRequest) -> aiohttp.ClientResponse:
+                pass
+
+        client = APIClient(host_name="api-host")
+
+        response = await client.name_fetch()
+        assert response == Name("Ron", "Weasley")
+
+    @test_utils.mock_aiohttp(
+        method="POST",
+        resp=test_utils.MockResponse(status=200),
+        req_validator=test_utils.RequestValidator(
+            headers={"Accept": MimeType.YAML.value}
+        ),
+    )
+    @pytest.mark.asyncio
+    async def test_accept_mimetype(self):
+        class APIClient(SpanClient):
+            @handles.post("/names", mimetype_accept=MimeType.YAML, resp_codes=200)
+            async def name_fetch(self, *, req: ClientRequest) -> aiohttp.ClientResponse:
+                pass
+
+        client = APIClient(host_name="api-host")
+
+        await client.name_fetch()
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        req_validator=[
+            # Validator 1
+            test_utils.RequestValidator(
+                headers={"Accept": MimeType.JSON.value},
+                params={"paging-offset": 0, "paging-limit": 2},
+            ),
+            # Validator 2
+            test_utils.RequestValidator(
+                headers={"Accept": MimeType.JSON.value},
+                params={"paging-offset": 2, "paging-limit": 2},
+            ),
+        ],
+        resp=[
+            # Response 1
+            test_utils.MockResponse(
+                status=200,
+                headers={"paging-next": "some_page"},
+                _json=[
+                    {"first": "Harry", "last": "Potter"},
+                    {"first": "Ron", "last": "Weasley"},
+                ],
+            ),
+            # Response 2
+            test_utils.MockResponse(
+                status=200,
+                _json=[
+                    {"first": "Hermione", "last": "Granger"},
+                    {"first": "Draco", "last": "Malfoy"},
+                ],
+            ),
+        ],
+    )
+    @pytest.mark.asyncio
+    async def test_paged(self):
+        class APIClient(SpanClient):
+            @handles.paged(limit=2)
+            @handles.get(
+                "/names",
+                mimetype_accept=MimeType.JSON,
+                resp_codes=200,
+                resp_schema=NameSchema(many=True),
+            )
+            async def name_fetch(
+                self, *, req: ClientRequest
+            ) -> AsyncGenerator[Name, None]:
+                pass
+
+        client = APIClient(host_name="api-host")
+
+        names = list()
+        async for name in client.name_fetch():
+            print(name)
+            names.append(name)
+
+        assert names == [
+            Name("Harry", "Potter"),
+            Name("Ron", "Weasley"),
+            Name("Hermione", "Granger"),
+            Name("Draco", "Malfoy"),
+        ]
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        req_validator=[
+            # Validator 1
+            test_utils.RequestValidator(
+                headers={"Accept": MimeType.BSON.value},
+                params={"paging-offset": 0, "paging-limit": 2},
+            )
+        ],
+        resp=[
+            # Response 1
+            test_utils.MockResponse(
+                status=200, _bson=[{"first": "Harry", "last": "Potter"}]
+            )
+        ],
+    )
+    @pytest.mark.asyncio
+    async def test_paged_single_bson(self):
+        class APIClient(SpanClient):
+            @handles.paged(limit=2)
+            @handles.get(
+                "/names",
+                mimetype_accept=MimeType.BSON,
+                resp_codes=200,
+                resp_schema=NameSchema(many=True),
+            )
+            async def name_fetch(
+                self, *, req: ClientRequest
+            ) -> AsyncGenerator[Name, None]:
+                pass
+
+        client = APIClient(host_name="api-host")
+
+        names = list()
+        async for name in client.name_fetch():
+            print(name)
+            names.append(name)
+
+        assert names == [Name("Harry", "Potter")]
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        req_validator=[
+            # Validator 1
+            test_utils.RequestValidator(
+                headers={"Accept": MimeType.JSON.value},
+                params={"paging-offset": 0, "paging-limit": 2},
+            ),
+            # Validator 2
+            test_utils.RequestValidator(
+                headers={"Accept": MimeType.JSON.value},
+                params={"paging-offset": 2, "paging-limit": 2},
+            ),
+        ],
+        resp=[
+            # Response 1
+            test_utils.MockResponse(
+                status=200,
+                headers={"paging-next": "some_page"},
+                _json=[
+                    {"first": "Harry", "last": "Potter"},
+                    {"first": "Ron", "last": "Weasley"},
+                ],
+            ),
+            # Response 2
+            test_utils.MockResponse(
+                status=200,
+                _json=[
+                    {"first": "Hermione", "last": "Granger"},
+                    {"first": "Draco", "last": "Malfoy"},
+                ],
+            ),
+        ],
+    )
+    @pytest.mark.asyncio
+    async def test_paged_limit_override(self):
+        class APIClient(SpanClient):
+            @handles.paged(limit=50)
+            @handles.get(
+                "/names",
+                mimetype_accept=MimeType.JSON,
+                resp_codes=200,
+                resp_schema=NameSchema(many=True),
+            )
+            async def name_fetch(
+                self, limit: int, *, req: ClientRequest
+            ) -> AsyncGenerator[Name, None]:
+                req.paging.limit = limit
+
+        client = APIClient(host_name="api-host")
+
+        names = list()
+        async for name in client.name_fetch(2):
+            print(name)
+            names.append(name)
+
+        assert names == [
+            Name("Harry", "Potter"),
+            Name("Ron", "Weasley"),
+            Name("Hermione", "Granger"),
+            Name("Draco", "Malfoy"),
+        ]
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        req_validator=[
+            # Validator 1
+            test_utils.RequestValidator(
+                headers={"Accept": MimeType.JSON.value},
+                params={"paging-offset": 2, "paging-limit": 2},
+            ),
+            # Validator 2
+            test_utils.RequestValidator(
+                headers={"Accept": MimeType.JSON.value},
+                params={"paging-offset": 4, "paging-limit": 2},
+            ),
+        ],
+        resp=[
+            # Response 1
+            test_utils.MockResponse(
+                status=200,
+                headers={"paging-next": "some_page"},
+                _json=[
+                    {"first": "Harry", "last": "Potter"},
+                    {"first": "Ron", "last": "Weasley"},
+                ],
+            ),
+            # Response 2
+            test_utils.MockResponse(
+                status=200,
+                _json=[
+                    {"first": "Hermione", "last": "Granger"},
+                    {"first": "Draco", "last": "Malfoy"},
+                ],
+            ),
+        ],
+    )
+    @pytest.mark.asyncio
+    async def test_paged_offset_override(self):
+        class APIClient(SpanClient):
+            @handles.paged(limit=50)
+            @handles.get(
+                "/names",
+                mimetype_accept=MimeType.JSON,
+                resp_codes=200,
+                resp_schema=NameSchema(many=True),
+            )
+            async def name_fetch(
+                self, skip: int, *, req: ClientRequest
+            ) -> AsyncGenerator[Name, None]:
+                req.paging.offset_start = skip
+                req.paging.limit = 2
+
+        client = APIClient(host_name="api-host")
+
+        names = list()
+        async for name in client.name_fetch(2):
+            print(name)
+            names.append(name)
+
+        assert names == [
+            Name("Harry", "Potter"),
+            Name("Ron", "Weasley"),
+            Name("Hermione", "Granger"),
+            Name("Draco", "Malfoy"),
+        ]
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        req_validator=[
+            # Validator 1
+            test_utils.RequestValidator(
+                headers={"Accept": MimeType.JSON.value},
+                params={"paging-offset": 0, "paging-limit": 2},
+            ),
+            # Validator 2
+            test_utils.RequestValidator(
+                headers={"Accept": MimeType.JSON.value},
+                params={"paging-offset": 2, "paging-limit": 2},
+            ),
+            # Validator 3
+            test_utils.RequestValidator(
+                headers={"Accept": MimeType.JSON.value},
+                params={"paging-offset": 4, "paging-limit": 2},
+            ),
+        ],
+        resp=[
+            # Response 1
+            test_utils.MockResponse(
+                status=200,
+                headers={"paging-next": "some_page"},
+                _json=[
+                    {"first": "Harry", "last": "Potter"},
+                    {"first": "Ron", "last": "Weasley"},
+                ],
+            ),
+            # Response 2
+            test_utils.MockResponse(
+                status=200,
+                _json=[
+                    {"first": "Hermione", "last": "Granger"},
+                    {"first": "Draco", "last": "Malfoy"},
+                ],
+            ),
+            # Response 3
+            test_utils.MockResponse(
+                status=200,
+                _exception=errors_api.NothingToReturnError(
+                    message="No Items to return", error_id=uuid.uuid4()
+                ),
+            ),
+        ],
+    )
+    @pytest.mark.asyncio
+    async def test_paged_manual(self):
+        class APIClient(SpanClient):
+            @handles.paged(limit=2)
+            @handles.get(
+                "/names",
+                mimetype_accept=MimeType.JSON,
+                resp_codes=200,
+                resp_schema=NameSchema(many=True),
+            )
+            async def name_fetch(
+                self, *, req: ClientRequest
+            ) -> AsyncGenerator[Name, None]:
+                result = await req.execute()
+                return result.loaded
+
+        client = APIClient(host_name="api-host")
+
+        names = list()
+        async for name in client.name_fetch():
+            names.append(name)
+
+        assert names == [
+            Name("Harry", "Potter"),
+            Name("Ron", "Weasley"),
+            Name("Hermione", "Granger"),
+            Name("Draco", "Malfoy"),
+        ]
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        req_validator=[
+            # Validator 1
+            test_utils.RequestValidator(
+                headers={"Accept": MimeType.JSON.value},
+                params={"paging-offset": 0, "paging-limit": 2},
+            ),
+            # Validator 2
+            test_utils.RequestValidator(
+                headers={"Accept": MimeType.JSON.value},
+                params={"paging-offset": 2, "paging-limit": 2},
+            ),
+        ],
+        resp=[
+            # Response 1
+            test_utils.MockResponse(status=200, headers={"paging-next": "some_page"}),
+            # Response 2
+            test_utils.MockResponse(status=200),
+        ],
+    )
+    @pytest.mark.asyncio
+    async def test_paged_empty_body(self):
+        class APIClient(SpanClient):
+            @handles.paged(limit=2)
+            @handles.get("/names", mimetype_accept=MimeType.JSON, resp_codes=200)
+            async def name_fetch(
+                self, *, req: ClientRequest
+            ) -> AsyncGenerator[Name, None]:
+                pass
+
+        client = APIClient(host_name="api-host")
+
+        responses = list()
+        async for resp in client.name_fetch():
+            assert isinstance(resp, test_utils.MockResponse)
+            responses.append(responses)
+
+        assert len(responses) == 2
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        req_validator=[
+            test_utils.RequestValidator(params={"paging-offset": 0}),
+            test_utils.RequestValidator(params={"paging-offset": 2}),
+            test_utils.RequestValidator(params={"paging-offset": 4}),
+            test_utils.RequestValidator(params={"paging-offset": 6}),
+        ],
+        resp=[
+            test_utils.MockResponse(
+                status=200,
+                headers={"paging-next": "some_page"},
+                _json=[
+                    {"first": "Harry", "last": "Potter"},
+                    {"first": "Ron", "last": "Weasley"},
+                ],
+            ),
+            test_utils.MockResponse(
+                status=200,
+                headers={"paging-next": "some_page"},
+                _json=[
+                    {"first": "Hermione", "last": "Granger"},
+                    {"first": "Draco", "last": "Malfoy"},
+                ],
+            ),
+            test_utils.MockResponse(
+                status=200, _json=[{"first": "Luna", "last": "Lovegood"}]
+            ),
+            test_utils.MockResponse(
+                status=200, _json=[{"first": "Not", "last": "Returned"}]
+            ),
+        ],
+    )
+    @pytest.mark.asyncio
+    async def test_paged_prefetch(self):
+        pages_requested = list()
+
+        class APIClient(SpanClient):
+            @handles.paged(limit=2, prefetch=2)
+            @handles.get("/names", resp_schema=NameSchema(many=True))
+            async def name_fetch(
+                self, *, req: ClientRequest
+            ) -> AsyncGenerator[Name, None]:
+                pages_requested.append(req.paging.page_to_fetch)
+
+        client = APIClient(host_name="api-host")
+
+        names = list()
+        async for name in client.name_fetch():
+            if not names:
+                # Let the prefetched pages run while we process the first item.
+                await asyncio.sleep(0)
+                assert pages_requested == [1, 2, 3]
+            names.append(name)
+
+        assert names == [
+            Name("Harry", "Potter"),
+            Name("Ron", "Weasley"),
+            Name("Hermione", "Granger"),
+            Name("Draco", "Malfoy"),
+            Name("Luna", "Lovegood"),
+        ]
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        resp=test_utils.MockResponse(
+            status=200,
+            headers={"paging-next": "some_page"},
+            _json=[{"first": "Harry", "last": "Potter"}],
+        ),
+    )
+    @pytest.mark.asyncio
+    async def test_paged_prefetch_max_pages(self):
+        pages_requested = list()
+
+        class APIClient(SpanClient):
+            @handles.paged(limit=1, max_pages=2, prefetch=5)
+            @handles.get("/names", resp_schema=NameSchema(many=True))
+            async def name_fetch(
+                self, *, req: ClientRequest
+            ) -> AsyncGenerator[Name, None]:
+                pages_requested.append(req.paging.page_to_fetch)
+
+        client = APIClient(host_name="api-host")
+
+        names = [name async for name in client.name_fetch()]
+
+        assert len(names) == 2
+        assert pages_requested == [1, 2]
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        resp=test_utils.MockResponse(
+            status=200,
+            headers={"paging-next": "some_page"},
+            _json=[{"first": "Harry", "last": "Potter"}],
+        ),
+    )
+    @pytest.mark.asyncio
+    async def test_paged_prefetch_break_cancels(self):
+        cancelled = list()
+
+        class APIClient(SpanClient):
+            @handles.paged(limit=1, prefetch=3)
+            @handles.get("/names", resp_schema=NameSchema(many=True))
+            async def name_fetch(
+                self, *, req: ClientRequest
+            ) -> AsyncGenerator[Name, None]:
+                if req.paging.page_to_fetch == 1:
+                    return
+
+                try:
+                    await asyncio.Event().wait()
+                except asyncio.CancelledError:
+                    cancelled.append(req.paging.page_to_fetch)
+                    raise
+
+        client = APIClient(host_name="api-host")
+
+        name_iter = client.name_fetch()
+        async for _ in name_iter:
+            await asyncio.sleep(0)
+            break
+
+        await name_iter.aclose()
+
+        assert cancelled == [2, 3, 4]
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        req_validator=[
+            test_utils.RequestValidator(params={"paging-offset": 0}),
+            test_utils.RequestValidator(params={"paging-offset": 2}),
+            test_utils.RequestValidator(params={"paging-offset": 4}),
+        ],
+        resp=[
+            test_utils.MockResponse(
+                status=200,
+                headers={"paging-next": "some_page", "paging-total-items": "5"},
+                _json=[
+                    {"first": "Harry", "last": "Potter"},
+                    {"first": "Ron", "last": "Weasley"},
+                ],
+            ),
+            test_utils.MockResponse(
+                status=200,
+                _json=[
+                    {"first": "Hermione", "last": "Granger"},
+                    {"first": "Draco", "last": "Malfoy"},
+                ],
+            ),
+            test_utils.MockResponse(
+                status=200, _json=[{"first": "Luna", "last": "Lovegood"}]
+            ),
+        ],
+    )
+    @pytest.mark.parametrize("ordered", [True, False])
+    @pytest.mark.asyncio
+    async def test_paged_fan_out(self, ordered: bool):
+        pages_requested = list()
+
+        class APIClient(SpanClient):
+            @handles.paged(limit=2, fan_out=2, ordered=ordered)
+            @handles.get("/names", resp_schema=NameSchema(many=True))
+            async def name_fetch(
+                self, *, req: ClientRequest
+            ) -> AsyncGenerator[Name, None]:
+                pages_requested.append(req.paging.page_to_fetch)
+                result = await req.execute()
+                # Hold up the second page so the third one arrives first.
+                if req.paging.page_to_fetch == 2:
+                    await asyncio.sleep(0.01)
+                return result
+
+        client = APIClient(host_name="api-host")
+
+        names = list()
+        async for name in client.name_fetch():
+            if not names:
+                # The other pages are fetched while the first one is consumed.
+                await asyncio.sleep(0)
+                assert pages_requested == [1, 2, 3]
+            names.append(name)
+
+        assert pages_requested == [1, 2, 3]
+
+        expected = [
+            Name("Harry", "Potter"),
+            Name("Ron", "Weasley"),
+            Name("Hermione", "Granger"),
+            Name("Draco", "Malfoy"),
+            Name("Luna", "Lovegood"),
+        ]
+        if not ordered:
+            expected = expected[:2] + expected[4:] + expected[2:4]
+
+        assert names == expected
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        resp=[
+            test_utils.MockResponse(
+                status=200,
+                headers={"paging-next": "some_page", "paging-total-items": "3"},
+                _json=[{"first": "Harry", "last": "Potter"}],
+            ),
+            test_utils.MockResponse(
+                status=200,
+                _exception=errors_api.NothingToReturnError(
+                    message="No Items to return", error_id=uuid.uuid4()
+                ),
+            ),
+            test_utils.MockResponse(
+                status=200, _json=[{"first": "Luna", "last": "Lovegood"}]
+            ),
+        ],
+    )
+    @pytest.mark.asyncio
+    async def test_paged_fan_out_nothing_to_return(self):
+        class APIClient(SpanClient):
+            @handles.paged(limit=1, fan_out=5)
+            @handles.get("/names", resp_schema=NameSchema(many=True))
+            async def name_fetch(
+                self, *, req: ClientRequest
+            ) -> AsyncGenerator[Name, None]:
+                pass
+
+        client = APIClient(host_name="api-host")
+
+        names = [name async for name in client.name_fetch()]
+
+        assert names == [Name("Harry", "Potter"), Name("Luna", "Lovegood")]
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        resp=test_utils.MockResponse(status=201),
+        req_validator=test_utils.RequestValidator(url="http://api-host/names"),
+    )
+    @pytest.mark.asyncio
+    async def test_custom_hook_manipulate_resp(self, get_config: MockConfig = None):
+        class APIClient(SpanClient):
+            @handles.get("/names", resp_codes=201, resp_schema=NameSchema())
+            async def name_fetch(self, *, req: ClientRequest) -> NameID:
+                pass
+
+        def custom_hook(validator: RequestValidator, response: MockResponse):
+            response.mock_json({"first": "Harry", "last": "Potter"})
+
+        get_config.req_validator[0].custom_hook = custom_hook
+
+        client = APIClient(host_name="api-host")
+
+        name = await client.name_fetch()
+        assert name.first == "Harry"
+        assert name.last == "Potter"
+
+    @pytest.mark.asyncio
+    @test_utils.mock_aiohttp(
+        method="POST",
+        resp=MockResponse(201),
+        req_validator=RequestValidator(
+            content_type=MimeType.JSON, headers={"Content-Type": "application/json"}
+        ),
+    )
+    async def test_mock_req_validate_data_type_w_schema(
+        self, post_config: MockConfig = None
+    ):
+        test_name = Name("Harry", "Potter")
+
+        def post_hook(validator: RequestValidator, resp: MockResponse):
+            data = NameSchema().load(validator.req_data_decoded)
+            assert data == test_name
+
+            mock_data = NameSchema().dump(test_name)
+            resp.mock_json(mock_data)
+
+        post_config.req_validator[0].custom_hook = post_hook
+
+        class APIClient(SpanClient):
+            @handles.post(
+                "/names",
+                req_schema=NameSchema(),
+                resp_codes=201,
+                resp_schema=NameSchema(),
+            )
+            async def name_fetch(self, *, req: ClientRequest) -> NameID:
+                req.media = Name("Harry", "Potter")
+
+        client = APIClient(host_name="api-host")
+
+        name = await client.name_fetch()
+        print(name)
+
+    @pytest.mark.asyncio
+    @test_utils.mock_aiohttp(
+        method="GET",
+        resp=MockResponse(),
+        req_validator=RequestValidator(url="http://api-host:8080/name"),
+    )
+    async def test_custom_port_url(self):
+        class APIClient(SpanClient):
+            @handles.get("/name")
+            async def name_fetch(self, *, req: ClientRequest) -> None:
+                pass
+
+        client = APIClient(host_name="api-host", port=8080)
+        _ = await client.name_fetch()
+
+    @pytest.mark.asyncio
+    @test_utils.mock_aiohttp(
+        method="GET",
+        resp=MockResponse(),
+        req_validator=RequestValidator(url="http://api-host:8080/name"),
+    )
+    async def test_custom_default_port_url(self):
+        class APIClient(SpanClient):
+            DEFAULT_PORT = 8080
+
+            @handles.get("/name")
+            async def name_fetch(self, *, req: ClientRequest) -> None:
+                pass
+
+        client = APIClient(host_name="api-host")
+        _ = await client.name_fetch()
+
+    @pytest.mark.asyncio
+    async def test_url_template(self):
+        class Session:
+            def __init__(self):
+                self.urls = list()
+
+            async def get(self, url, headers, data):
+                self.urls.append(url)
+                return MockResponse()
+
+        class APIClient(SpanClient):
+            @handles.get(
+                "/names/{name_id}/tags/{tag:03d}",
+                query_params={"verbose": True, "page": 1},
+                mimetype_accept=MimeType.JSON,
+            )
+            async def tag_fetch(self, name_id: str, *, req: ClientRequest) -> None:
+                req.path_params["name_id"] = name_id
+                req.path_params["tag"] = 7
+                req.query_params["page"] = 2
+
+            @handles.get("/names", query_params={"verbose": True})
+            async def names_fetch(self, *, req: ClientRequest) -> None:
+                req.query_params["name"] = "a&b c"
+
+        session = Session()
+        client = APIClient(host_name="api-host", session=session)
+
+        await client.tag_fetch("a b?c")
+        template = next(iter(client._templates.values()))
+        await client.tag_fetch("a b?c")
+        assert next(iter(client._templates.values())) is template
+        assert template.headers == {"Accept": "application/json"}
+
+        await client.names_fetch()
+
+        client.host_name = "other-host"
+        await client.tag_fetch("a/b")
+
+        assert [str(url) for url in session.urls] == [
+            "http://api-host/names/a%20b%3Fc/tags/007?verbose=True&page=2",
+            "http://api-host/names/a%20b%3Fc/tags/007?verbose=True&page=2",
+            "http://api-host/names?verbose=True&name=a%26b+c",
+            "http://other-host/names/a/b/tags/007?verbose=True&page=2",
+        ]
+        assert dict(session.urls[2].query) == {"verbose": "True", "name": "a&b c"}
+
+    @pytest.mark.parametrize(
+        "name_id", ["a%20b", "a%2fb", "a%e9b", "a b%20", "100%", "a%zz"]
+    )
+    @pytest.mark.asyncio
+    async def test_url_template_percent(self, name_id: str):
+        class Session:
+            async def get(self, url, headers, data):
+                self.url = url
+                return MockResponse()
+
+        class APIClient(SpanClient):
+            @handles.get("/names/{name_id}/100%")
+            async def name_fetch(self, name_id: str, *, req: ClientRequest) -> None:
+                req.path_params["name_id"] = name_id
+
+        session = Session()
+        client = APIClient(host_name="api-host", session=session)
+        await client.name_fetch(name_id)
+
+        # Encoded as yarl encodes a url passed as a string.
+        assert str(session.url) == str(URL(f"http://api-host/names/{name_id}/100%"))
+
+    @pytest.mark.parametrize(
+        "value, encoded",
+        [
+            ("a%20b", "a%20b"),
+            ("a%2fb", "a%2Fb"),
+            ("a b%20", "a+b%20"),
+            ("100%", "100%25"),
+            ("a%zz", "a%25zz"),
+        ],
+    )
+    @pytest.mark.asyncio
+    async def test_url_template_query_percent(self, value: str, encoded: str):
+        class Session:
+            async def get(self, url, headers, data):
+                self.url = url
+                return MockResponse()
+
+        class APIClient(SpanClient):
+            @handles.get("/names", query_params={"static": value})
+            async def names_fetch(self, *, req: ClientRequest) -> None:
+                req.query_params["name"] = value
+
+        session = Session()
+        client = APIClient(host_name="api-host", session=session)
+        await client.names_fetch()
+
+        # Escapes already in the value are kept, as they are in path params.
+        assert session.url.raw_query_string == f"static={encoded}&name={encoded}"
+
+    @pytest.mark.asyncio
+    async def test_url_template_str_enum(self):
+        class House(str, enum.Enum):
+            GRYFFINDOR = "gryffindor"
+
+        class Session:
+            async def get(self, url, headers, data):
+                self.url = url
+                return MockResponse()
+
+        class APIClient(SpanClient):
+            @handles.get("/houses/{house}/names")
+            async def names_fetch(self, house: House, *, req: ClientRequest) -> None:
+                req.path_params["house"] = house
+
+        session = Session()
+        client = APIClient(host_name="api-host", session=session)
+        await client.names_fetch(House.GRYFFINDOR)
+
+        # Filled in like str.format fills it in, through the value's __format__.
+        assert str(session.url) == f"http://api-host/houses/{House.GRYFFINDOR}/names"
+
+    @pytest.mark.asyncio
+    async def test_url_template_settings_mutated(self):
+        class Session:
+            def __init__(self):
+                self.requests = list()
+
+            async def get(self, url, headers, data):
+                self.requests.append((str(url), headers))
+                return MockResponse()
+
+        class APIClient(SpanClient):
+            @handles.get("/names", query_params={"verbose": True})
+            async def names_fetch(self, page: int, *, req: ClientRequest) -> None:
+                req.endpoint_settings.query_params["page"] = page
+                req.endpoint_settings.headers["x-page"] = str(page)
+
+        session = Session()
+        client = APIClient(host_name="api-host", session=session)
+
+        await client.names_fetch(1)
+        await client.names_fetch(2)
+
+        assert session.requests == [
+            ("http://api-host/names?verbose=True&page=1", {"x-page": "1"}),
+            ("http://api-host/names?verbose=True&page=2", {"x-page": "2"}),
+        ]
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        resp=test_utils.MockResponse(),
+        req_validator=test_utils.RequestValidator(
+            url=f"http://api-host/endpoint",
+            params={"project.field1": "1", "project.field2": "0"},
+        ),
+    )
+    @pytest.mark.asyncio
+    async def test_projection(self):
+        class APIClient(SpanClient):
+            @handles.get("/endpoint")
+            async def name_fetch(self, *, req: ClientRequest):
+                req.projection["field1"] = 1
+                req.projection["field2"] = 0
+
+        client = APIClient(host_name="api-host")
+
+        await client.name_fetch()
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        resp=test_utils.MockResponse(),
+        req_validator=test_utils.RequestValidator(
+            url=f"http://api-host/endpoint",
+            params={"project.field1": "0", "project.field2": "1"},
+        ),
+    )
+    @pytest.mark.asyncio
+    async def test_projection_from_user(self):
+        class APIClient(SpanClient):
+            @handles.get("/endpoint")
+            async def name_fetch(
+                self, projection: Dict[str, int], *, req: ClientRequest
+            ):
+                req.projection = projection
+
+        client = APIClient(host_name="api-host")
+
+        user_projection = {"field1": 0, "field2": 1}
+        await client.name_fetch(user_projection)
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        resp=test_utils.MockResponse(),
+        req_validator=test_utils.RequestValidator(
+            url=f"http://api-host/endpoint",
+            params={"project.field1": "1", "project.field2": "0",},
+        ),
+    )
+    @pytest.mark.asyncio
+    async def test_projection_validation_error(self):
+        class APIClient(SpanClient):
+            @handles.get("/endpoint")
+            async def name_fetch(self, *, req: ClientRequest):
+                req.projection["field1"] = 1
+
+        client = APIClient(host_name="api-host")
+
+        with pytest.raises(test_utils.ParamsMismatchError):
+            await client.name_fetch()
+
+
+class TestCoalesce:
+    UUID1 = uuid.UUID(int=1)
+    CALLS: List[str] = list()
+
+    @staticmethod
+    def count_call(validator: RequestValidator, response: MockResponse):
+        TestCoalesce.CALLS.append(validator.req_url)
+
+    @staticmethod
+    def client_class(coalesce: bool = True, update: bool = False) -> type:
+        class APIClient(SpanClient):
+            @handles.get(
+                "/names/{name_id}",
+                resp_schema=NameIDSchema(load_dataclass=not update),
+                coalesce=coalesce,
+            )
+            async def name_fetch(
+                self, name_id: uuid.UUID, *, req: ClientRequest
+            ) -> NameID:
+                req.path_params["name_id"] = name_id
+                if update:
+                    req.update_obj = NameID(name_id, "Harry", "Potter")
+
+        return APIClient
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        resp=test_utils.MockResponse(
+            status=200, _json={"id": str(UUID1), "first": "Ron", "last": "Weasley"}
+        ),
+        req_validator=test_utils.RequestValidator(custom_hook=count_call.__func__),
+    )
+    @pytest.mark.parametrize("coalesce", [True, False])
+    @pytest.mark.asyncio
+    async def test_concurrent(self, coalesce: bool):
+        self.CALLS.clear()
 
-        assert names == [
-            Name("Harry", "Potter"),
-            Name("Ron", "Weasley"),
-            Name("Hermione", "Granger"),
-            Name("Draco", "Malfoy"),
-        ]
+        async with self.client_class(coalesce)(host_name="api-host") as client:
+            names = await asyncio.gather(
+                *(client.name_fetch(self.UUID1) for _ in range(5)),
+                client.name_fetch(uuid.UUID(int=2)),
+            )
+            assert not client._inflight
+
+        assert all(name == NameID(self.UUID1, "Ron", "Weasley") for name in names)
+        if coalesce:
+            assert len(self.CALLS) == 2
+            assert names[0] is names[1]
+        else:
+            assert len(self.CALLS) == 6
+
+        # Requests that are not in-flight at the same time are not coalesced.
+        self.CALLS.clear()
+        await client.name_fetch(self.UUID1)
+        await client.name_fetch(self.UUID1)
+        assert len(self.CALLS) == 2
 
     @test_utils.mock_aiohttp(
         method="GET",
-        req_validator=[
-            # Validator 1
-            test_utils.RequestValidator(
-                headers={"Accept": MimeType.JSON.value},
-                params={"paging-offset": 2, "paging-limit": 2},
-            ),
-            # Validator 2
-            test_utils.RequestValidator(
-                headers={"Accept": MimeType.JSON.value},
-                params={"paging-offset": 4, "paging-limit": 2},
-            ),
-        ],
-        resp=[
-            # Response 1
-            test_utils.MockResponse(
-                status=200,
-                headers={"paging-next": "some_page"},
-                _json=[
-                    {"first": "Harry", "last": "Potter"},
-                    {"first": "Ron", "last": "Weasley"},
-                ],
-            ),
-            # Response 2
-            test_utils.MockResponse(
-                status=200,
-                _json=[
-                    {"first": "Hermione", "last": "Granger"},
-                    {"first": "Draco", "last": "Malfoy"},
-                ],
-            ),
-        ],
+        resp=test_utils.MockResponse(
+            status=200, _json={"id": str(UUID1), "first": "Ron", "last": "Weasley"}
+        ),
+        req_validator=test_utils.RequestValidator(custom_hook=count_call.__func__),
     )
     @pytest.mark.asyncio
-    async def test_paged_offset_override(self):
+    async def test_update_obj(self):
+        self.CALLS.clear()
+
+        async with self.client_class(update=True)(host_name="api-host") as client:
+            names = await asyncio.gather(
+                *(client.name_fetch(self.UUID1) for _ in range(3))
+            )
+
+        assert len(self.CALLS) == 1
+        assert len({id(name) for name in names}) == 3
+        assert all(name == NameID(self.UUID1, "Ron", "Weasley") for name in names)
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        resp=test_utils.MockResponse(status=400),
+        req_validator=test_utils.RequestValidator(custom_hook=count_call.__func__),
+    )
+    @pytest.mark.asyncio
+    async def test_error(self):
+        self.CALLS.clear()
+
+        async with self.client_class()(host_name="api-host") as client:
+            results = await asyncio.gather(
+                *(client.name_fetch(self.UUID1) for _ in range(3)),
+                return_exceptions=True,
+            )
+            assert not client._inflight
+
+        assert len(self.CALLS) == 1
+        assert all(isinstance(result, StatusMismatchError) for result in results)
+
+
+class TestResponseCache:
+    UUID1 = uuid.UUID(int=1)
+    HEADERS: List[Dict[str, str]] = list()
+
+    @staticmethod
+    def record_headers(validator: RequestValidator, response: MockResponse):
+        TestResponseCache.HEADERS.append(dict(validator.req_headers))
+
+    @staticmethod
+    def client_class(update: bool = False) -> type:
         class APIClient(SpanClient):
-            @handles.paged(limit=50)
             @handles.get(
-                "/names",
-                mimetype_accept=MimeType.JSON,
-                resp_codes=200,
-                resp_schema=NameSchema(many=True),
+                "/names/{name_id}", resp_schema=NameIDSchema(load_dataclass=not update),
             )
             async def name_fetch(
-                self, skip: int, *, req: ClientRequest
-            ) -> AsyncGenerator[Name, None]:
-                req.paging.offset_start = skip
-                req.paging.limit = 2
-
-        client = APIClient(host_name="api-host")
+                self, name_id: uuid.UUID, *, req: ClientRequest
+            ) -> NameID:
+                req.path_params["name_id"] = name_id
+                if update:
+                    req.update_obj = NameID(name_id, "Harry", "Potter")
 
-        names = list()
-        async for name in client.name_fetch(2):
-            print(name)
-            names.append(name)
+        return APIClient
 
-        assert names == [
-            Name("Harry", "Potter"),
-            Name("Ron", "Weasley"),
-            Name("Hermione", "Granger"),
-            Name("Draco", "Malfoy"),
-        ]
+    @staticmethod
+    def entry(size: int) -> CacheEntry:
+        return CacheEntry(
+            data=None, size=size, etag='"1"', last_modified=None, expires=None
+        )
 
     @test_utils.mock_aiohttp(
         method="GET",
-        req_validator=[
-            # Validator 1
-            test_utils.RequestValidator(
-                headers={"Accept": MimeType.JSON.value},
-                params={"paging-offset": 0, "paging-limit": 2},
+        resp=(
+            test_utils.MockResponse(
+                status=200,
+                headers={"ETag": '"v1"', "Last-Modified": "Wed, 21 Oct 2015 07:28:00"},
+                _json={"id": str(UUID1), "first": "Ron", "last": "Weasley"},
             ),
-            # Validator 2
-            test_utils.RequestValidator(
-                headers={"Accept": MimeType.JSON.value},
-                params={"paging-offset": 2, "paging-limit": 2},
+            test_utils.MockResponse(status=304),
+        ),
+        req_validator=test_utils.RequestValidator(custom_hook=record_headers.__func__),
+    )
+    @pytest.mark.asyncio
+    async def test_revalidate(self):
+        self.HEADERS.clear()
+        cache = ResponseCache()
+
+        async with self.client_class()(host_name="api-host", cache=cache) as client:
+            first = await client.name_fetch(self.UUID1)
+            second = await client.name_fetch(self.UUID1)
+
+        assert first == NameID(self.UUID1, "Ron", "Weasley")
+        assert second is first
+        assert len(cache) == 1
+
+        assert "If-None-Match" not in self.HEADERS[0]
+        assert self.HEADERS[1]["If-None-Match"] == '"v1"'
+        assert self.HEADERS[1]["If-Modified-Since"] == "Wed, 21 Oct 2015 07:28:00"
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        resp=(
+            test_utils.MockResponse(
+                status=200,
+                headers={"ETag": '"v1"'},
+                _json={"id": str(UUID1), "first": "Ron", "last": "Weasley"},
             ),
-            # Validator 3
-            test_utils.RequestValidator(
-                headers={"Accept": MimeType.JSON.value},
-                params={"paging-offset": 4, "paging-limit": 2},
+            test_utils.MockResponse(status=304),
+        ),
+    )
+    @pytest.mark.asyncio
+    async def test_revalidate_update_obj(self):
+        async with self.client_class(update=True)(
+            host_name="api-host", cache=ResponseCache()
+        ) as client:
+            first = await client.name_fetch(self.UUID1)
+            second = await client.name_fetch(self.UUID1)
+
+        assert first is not second
+        assert first == second == NameID(self.UUID1, "Ron", "Weasley")
+
+    @pytest.mark.parametrize(
+        "cache_control,calls",
+        [("max-age=60", 1), ("no-cache, max-age=60", 2), ("max-age=0", 2)],
+    )
+    @pytest.mark.asyncio
+    async def test_max_age(self, cache_control: str, calls: int):
+        self.HEADERS.clear()
+
+        @test_utils.mock_aiohttp(
+            method="GET",
+            resp=test_utils.MockResponse(
+                status=200,
+                headers={"Cache-Control": cache_control},
+                _json={"id": str(self.UUID1), "first": "Ron", "last": "Weasley"},
             ),
-        ],
-        resp=[
-            # Response 1
+            req_validator=test_utils.RequestValidator(custom_hook=self.record_headers),
+        )
+        async def fetch_twice():
+            async with self.client_class()(
+                host_name="api-host", cache=ResponseCache()
+            ) as client:
+                await client.name_fetch(self.UUID1)
+                await client.name_fetch(self.UUID1)
+
+        await fetch_twice()
+        assert len(self.HEADERS) == calls
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        resp=test_utils.MockResponse(
+            status=200,
+            headers={"ETag": '"v1"', "Cache-Control": "no-store"},
+            _json={"id": str(UUID1), "first": "Ron", "last": "Weasley"},
+        ),
+    )
+    @pytest.mark.asyncio
+    async def test_no_store(self):
+        cache = ResponseCache()
+
+        async with self.client_class()(host_name="api-host", cache=cache) as client:
+            await client.name_fetch(self.UUID1)
+
+        assert len(cache) == 0
+
+    def test_evict_entries(self):
+        cache = ResponseCache(max_entries=2)
+        cache.store("a", self.entry(1))
+        cache.store("b", self.entry(1))
+
+        assert cache.get("a") is not None
+        cache.store("c", self.entry(1))
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.get("c") is not None
+        assert len(cache) == 2
+
+    def test_evict_bytes(self):
+        cache = ResponseCache(max_bytes=10)
+        cache.store("a", self.entry(4))
+        cache.store("b", self.entry(4))
+        cache.store("a", self.entry(5))
+
+        assert cache.nbytes == 9
+
+        cache.store("c", self.entry(2))
+        assert cache.get("b") is None
+        assert cache.nbytes == 7
+
+        cache.store("d", self.entry(11))
+        assert cache.get("d") is None
+        assert cache.nbytes == 7
+
+        cache.clear()
+        assert cache.nbytes == 0
+        assert len(cache) == 0
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        resp=(
             test_utils.MockResponse(
                 status=200,
-                headers={"paging-next": "some_page"},
-                _json=[
-                    {"first": "Harry", "last": "Potter"},
-                    {"first": "Ron", "last": "Weasley"},
-                ],
+                headers={"ETag": '"v1"'},
+                _json={"id": str(UUID1), "first": "Ron", "last": "Weasley"},
             ),
-            # Response 2
+            test_utils.MockResponse(status=404),
             test_utils.MockResponse(
                 status=200,
-                _json=[
-                    {"first": "Hermione", "last": "Granger"},
-                    {"first": "Draco", "last": "Malfoy"},
-                ],
+                headers={"ETag": '"v2"'},
+                _json={"id": str(UUID1), "first": "Ron", "last": "Weasley"},
             ),
-            # Response 3
+        ),
+        req_validator=test_utils.RequestValidator(custom_hook=record_headers.__func__),
+    )
+    @pytest.mark.asyncio
+    async def test_revalidate_error(self, tmp_path):
+        self.HEADERS.clear()
+        disk = DiskCache(str(tmp_path / "cache.sqlite"))
+        cache = ResponseCache(disk=disk)
+
+        async with self.client_class()(host_name="api-host", cache=cache) as client:
+            await client.name_fetch(self.UUID1)
+
+            with pytest.raises(StatusMismatchError):
+                await client.name_fetch(self.UUID1)
+            assert len(cache) == len(disk) == 0
+
+            await client.name_fetch(self.UUID1)
+        disk.close()
+
+        assert self.HEADERS[1]["If-None-Match"] == '"v1"'
+        assert "If-None-Match" not in self.HEADERS[2]
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        resp=(
             test_utils.MockResponse(
                 status=200,
-                _exception=errors_api.NothingToReturnError(
-                    message="No Items to return", error_id=uuid.uuid4()
-                ),
+                headers={"ETag": '"v1"'},
+                _json={"id": str(UUID1), "first": "Ron", "last": "Weasley"},
             ),
-        ],
+            test_utils.MockResponse(status=304),
+        ),
+        req_validator=test_utils.RequestValidator(custom_hook=record_headers.__func__),
     )
     @pytest.mark.asyncio
-    async def test_paged_manual(self):
-        class APIClient(SpanClient):
-            @handles.paged(limit=2)
-            @handles.get(
-                "/names",
-                mimetype_accept=MimeType.JSON,
-                resp_codes=200,
-                resp_schema=NameSchema(many=True),
+    async def test_disk_revalidate(self, tmp_path):
+        self.HEADERS.clear()
+        path = str(tmp_path / "cache.sqlite")
+
+        for _ in range(2):
+            disk = DiskCache(path)
+            cache = ResponseCache(disk=disk)
+            async with self.client_class()(host_name="api-host", cache=cache) as client:
+                result = await client.name_fetch(self.UUID1)
+            disk.close()
+
+            assert result == NameID(self.UUID1, "Ron", "Weasley")
+
+        assert "If-None-Match" not in self.HEADERS[0]
+        assert self.HEADERS[1]["If-None-Match"] == '"v1"'
+
+    @pytest.mark.parametrize("ttl, calls", [(0, 4), (60, 1)])
+    @pytest.mark.asyncio
+    async def test_disk_ttl(self, tmp_path, ttl: float, calls: int):
+        self.HEADERS.clear()
+        path = str(tmp_path / "cache.sqlite")
+
+        @test_utils.mock_aiohttp(
+            method="GET",
+            resp=test_utils.MockResponse(
+                status=200,
+                _json={"id": str(self.UUID1), "first": "Ron", "last": "Weasley"},
+            ),
+            req_validator=test_utils.RequestValidator(custom_hook=self.record_headers),
+        )
+        async def fetch_twice():
+            disk = DiskCache(path, ttl=ttl)
+            cache = ResponseCache(disk=disk)
+            async with self.client_class()(host_name="api-host", cache=cache) as client:
+                await client.name_fetch(self.UUID1)
+                result = await client.name_fetch(self.UUID1)
+            disk.close()
+            return result
+
+        await fetch_twice()
+        result = await fetch_twice()
+
+        assert len(self.HEADERS) == calls
+        assert result == NameID(self.UUID1, "Ron", "Weasley")
+
+    @pytest.mark.parametrize("path, stored", [("/names", 0), ("/houses", 1)])
+    @pytest.mark.asyncio
+    async def test_invalidated_in_flight(self, tmp_path, path: str, stored: int):
+        self.HEADERS.clear()
+        cache = ResponseCache(disk=DiskCache(str(tmp_path / "cache.sqlite")))
+
+        def invalidate(validator: RequestValidator, response: MockResponse):
+            # Like a PUT on ``path`` finishing while the GET is in-flight.
+            self.record_headers(validator, response)
+            cache.discard_matching(
+                lambda key: key[1].startswith(f"http://api-host{path}")
             )
+
+        @test_utils.mock_aiohttp(
+            method="GET",
+            resp=test_utils.MockResponse(
+                status=200,
+                headers={"ETag": '"v1"'},
+                _json={"id": str(self.UUID1), "first": "Ron", "last": "Weasley"},
+            ),
+            req_validator=test_utils.RequestValidator(custom_hook=invalidate),
+        )
+        async def fetch_twice():
+            async with self.client_class()(host_name="api-host", cache=cache) as client:
+                result = await client.name_fetch(self.UUID1)
+                assert len(cache) == len(cache.disk) == stored
+
+                await client.name_fetch(self.UUID1)
+            return result
+
+        assert await fetch_twice() == NameID(self.UUID1, "Ron", "Weasley")
+        cache.disk.close()
+
+        assert len(self.HEADERS) == 2
+        assert ("If-None-Match" in self.HEADERS[1]) is bool(stored)
+
+    @test_utils.mock_aiohttp(
+        method="GET",
+        resp=test_utils.MockResponse(
+            status=200,
+            headers={"ETag": '"v1"'},
+            _json={"id": str(UUID1), "first": "Ron", "last": "Weasley"},
+        ),
+    )
+    @test_utils.mock_aiohttp(method="DELETE", resp=test_utils.MockResponse(status=204))
+    @pytest.mark.asyncio
+    async def test_invalidate_trailing_slash(
+        self, tmp_path, get_config=None, delete_config=None
+    ):
+        class APIClient(SpanClient):
+            @handles.get("/names/{name_id}/")
+            async def name_fetch(self, name_id: uuid.UUID, *, req: ClientRequest):
+                req.path_params["name_id"] = name_id
+
+            @handles.get("/names/")
+            async def names_fetch(self, *, req: ClientRequest):
+                pass
+
+            @handles.delete("/names/{name_id}/", resp_codes=204)
+            async def name_delete(self, name_id: uuid.UUID, *, req: ClientRequest):
+                req.path_params["name_id"] = name_id
+
+        disk = DiskCache(str(tmp_path / "cache.sqlite"))
+        cache = ResponseCache(disk=disk)
+
+        async with APIClient(host_name="api-host", cache=cache) as client:
+            await client.name_fetch(self.UUID1)
+            await client.names_fetch()
+            assert len(cache) == len(disk) == 2
+
+            await client.name_delete(self.UUID1)
+            assert len(cache) == len(disk) == 0
+
+        disk.close()
+
+    @pytest.mark.asyncio
+    async def test_disk_restore_failed(self, tmp_path):
+        self.HEADERS.clear()
+        path = str(tmp_path / "cache.sqlite")
+
+        class HouseClient(SpanClient):
+            @handles.get("/names/{name_id}", resp_schema=HouseSchema())
             async def name_fetch(
-                self, *, req: ClientRequest
-            ) -> AsyncGenerator[Name, None]:
-                result = await req.execute()
-                return result.loaded
+                self, name_id: uuid.UUID, *, req: ClientRequest
+            ) -> Dict[str, Any]:
+                req.path_params["name_id"] = name_id
 
-        client = APIClient(host_name="api-host")
+        async def fetch(client_class: type, body: Dict[str, Any]) -> Any:
+            @test_utils.mock_aiohttp(
+                method="GET",
+                resp=test_utils.MockResponse(
+                    status=200, headers={"Cache-Control": "max-age=60"}, _json=body
+                ),
+                req_validator=test_utils.RequestValidator(
+                    custom_hook=self.record_headers
+                ),
+            )
+            async def fetch_once():
+                disk = DiskCache(path)
+                cache = ResponseCache(disk=disk)
+                async with client_class(host_name="api-host", cache=cache) as client:
+                    result = await client.name_fetch(self.UUID1)
+                disk.close()
+                return result
+
+            return await fetch_once()
+
+        await fetch(
+            self.client_class(),
+            {"id": str(self.UUID1), "first": "Ron", "last": "Weasley"},
+        )
+        # The stored body no longer loads with the endpoint's schema, so it is dropped
+        # and fetched again.
+        house = {"name": "Gryffindor", "housePoints": 10}
+        assert await fetch(HouseClient, house) == {"name": "Gryffindor", "points": 10}
+        assert await fetch(HouseClient, house) == {"name": "Gryffindor", "points": 10}
 
-        names = list()
-        async for name in client.name_fetch():
-            names.append(name)
+        assert len(self.HEADERS) == 2
+
+    @pytest.mark.asyncio
+    async def test_disk_evict(self, tmp_path):
+        disk = DiskCache(str(tmp_path / "cache.sqlite"), max_bytes=10)
+        response = MockResponse(status=200, headers={"ETag": '"1"'})
+
+        await disk.store("get", "http://api-host/a", {}, response, b"a" * 4)
+        await disk.store("get", "http://api-host/b", {}, response, b"b" * 4)
+        assert await disk.get("get", "http://api-host/a", {}) is not None
+
+        await disk.store("get", "http://api-host/c", {}, response, b"c" * 4)
+        assert await disk.get("get", "http://api-host/b", {}) is None
+        assert (await disk.get("get", "http://api-host/a", {})).content == b"a" * 4
+        assert len(disk) == 2
+        assert disk.nbytes == 8
+
+        await disk.store("get", "http://api-host/c", {}, response, b"c" * 2)
+        assert len(disk) == 2
+        assert disk.nbytes == 6
+
+        no_store = MockResponse(status=200, headers={"Cache-Control": "no-store"})
+        await disk.store("get", "http://api-host/a", {}, no_store, b"a")
+        assert await disk.get("get", "http://api-host/a", {}) is None
+
+        await disk.clear()
+        assert len(disk) == 0
+        assert disk.nbytes == 0
+        disk.close()
+
+    @pytest.mark.asyncio
+    async def test_disk_off_loop(self, tmp_path):
+        disk = DiskCache(str(tmp_path / "cache.sqlite"))
+        threads = set()
+        disk._db.set_trace_callback(
+            lambda statement: threads.add(threading.current_thread())
+        )
+
+        response = MockResponse(status=200, headers={"ETag": '"1"'})
+        await disk.store("get", "http://api-host/a", {}, response, b"a")
+        await disk.get("get", "http://api-host/a", {})
+        assert len(disk) == 1
+        assert disk.nbytes == 1
+        disk.close()
+
+        assert threads and threading.main_thread() not in threads
+
+    @pytest.mark.asyncio
+    async def test_disk_private(self, tmp_path):
+        path = tmp_path / "cache.sqlite"
+        disk = DiskCache(str(path))
+        headers = {"Authorization": "Bearer wingardium-leviosa"}
+        response = MockResponse(
+            status=200, headers={"ETag": '"1"', "Set-Cookie": "session=alohomora"}
+        )
+
+        await disk.store("get", "http://api-host/a", headers, response, b"a")
+        stored = await disk.get("get", "http://api-host/a", headers)
+        assert stored.headers.get("ETag") == '"1"'
+        assert "Set-Cookie" not in stored.headers
+        assert await disk.get("get", "http://api-host/a", {}) is None
+        disk.close()
+
+        written = b"".join(file.read_bytes() for file in tmp_path.iterdir())
+        assert b"wingardium-leviosa" not in written
+        assert b"alohomora" not in written
+
+    @pytest.mark.asyncio
+    async def test_disk_old_version(self, tmp_path):
+        path = str(tmp_path / "cache.sqlite")
+        disk = DiskCache(path)
+        response = MockResponse(status=200, headers={"ETag": '"1"'})
+        await disk.store("get", "http://api-host/a", {}, response, b"a")
+        disk.close()
+
+        db = sqlite3.connect(path)
+        db.execute("PRAGMA user_version = 0")
+        db.close()
+
+        disk = DiskCache(path)
+        assert len(disk) == 0
+        assert await disk.get("get", "http://api-host/a", {}) is None
+        disk.close()
+
+
+class TestMemo:
+    UUID1 = uuid.UUID(int=1)
+    UUID2 = uuid.UUID(int=2)
+    HEADERS: List[Dict[str, str]] = list()
+
+    @staticmethod
+    def record_headers(validator: RequestValidator, response: MockResponse):
+        TestMemo.HEADERS.append(dict(validator.req_headers))
+
+    @staticmethod
+    def client_class(**cached: Any) -> type:
+        class APIClient(SpanClient):
+            @handles.cached(**cached)
+            @handles.get("/names/{name_id}", resp_schema=NameIDSchema())
+            async def name_fetch(
+                self, name_id: uuid.UUID, *, req: ClientRequest
+            ) -> NameID:
+                req.path_params["name_id"] = name_id
 
-        assert names == [
-            Name("Harry", "Potter"),
-            Name("Ron", "Weasley"),
-            Name("Hermione", "Granger"),
-            Name("Draco", "Malfoy"),
-        ]
+        return APIClient
 
     @test_utils.mock_aiohttp(
         method="GET",
-        req_validator=[
-            # Validator 1
-            test_utils.RequestValidator(
-                headers={"Accept": MimeType.JSON.value},
-                params={"paging-offset": 0, "paging-limit": 2},
-            ),
-            # Validator 2
-            test_utils.RequestValidator(
-                headers={"Accept": MimeType.JSON.value},
-                params={"paging-offset": 2, "paging-limit": 2},
-            ),
-        ],
-        resp=[
-            # Response 1
-            test_utils.MockResponse(status=200, headers={"paging-next": "some_page"}),
-            # Response 2
-            test_utils.MockResponse(status=200),
-        ],
+        resp=test_utils.MockResponse(
+            status=200, _json={"id": str(UUID1), "first": "Ron", "last": "Weasley"},
+        ),
+        req_validator=test_utils.RequestValidator(custom_hook=record_headers.__func__),
     )
     @pytest.mark.asyncio
-    async def test_paged_empty_body(self):
-        class APIClient(SpanClient):
-            @handles.paged(limit=2)
-            @handles.get("/names", mimetype_accept=MimeType.JSON, resp_codes=200)
-            async def name_fetch(
-                self, *, req: ClientRequest
-            ) -> AsyncGenerator[Name, None]:
-                pass
+    async def test_cached(self):
+        self.HEADERS.clear()
+        client_class = self.client_class(ttl=60)
 
-        client = APIClient(host_name="api-host")
-
-        responses = list()
-        async for resp in client.name_fetch():
-            assert isinstance(resp, test_utils.MockResponse)
-            responses.append(responses)
+        async with client_class(host_name="api-host") as client:
+            first = await client.name_fetch(self.UUID1)
+            second = await client.name_fetch(self.UUID1)
+            await client.name_fetch(self.UUID2)
 
-        assert len(responses) == 2
+        assert first is second
+        assert len(self.HEADERS) == 2
+        assert client_class.name_fetch.memo.hits == 1
+        assert client_class.name_fetch.memo.misses == 2
 
     @test_utils.mock_aiohttp(
         method="GET",
-        resp=test_utils.MockResponse(status=201),
-        req_validator=test_utils.RequestValidator(url="http://api-host/names"),
+        resp=test_utils.MockResponse(
+            status=200, _json={"id": str(UUID1), "first": "Ron", "last": "Weasley"},
+        ),
+        req_validator=test_utils.RequestValidator(custom_hook=record_headers.__func__),
     )
     @pytest.mark.asyncio
-    async def test_custom_hook_manipulate_resp(self, get_config: MockConfig = None):
-        class APIClient(SpanClient):
-            @handles.get("/names", resp_codes=201, resp_schema=NameSchema())
-            async def name_fetch(self, *, req: ClientRequest) -> NameID:
-                pass
+    async def test_cached_per_client(self):
+        self.HEADERS.clear()
+        client_class = self.client_class(ttl=60)
+        memo = client_class.name_fetch.memo
 
-        def custom_hook(validator: RequestValidator, response: MockResponse):
-            response.mock_json({"first": "Harry", "last": "Potter"})
+        async with client_class(host_name="api-host") as client:
+            async with client_class(host_name="api-host") as other:
+                first = await client.name_fetch(self.UUID1)
+                second = await other.name_fetch(self.UUID1)
+                assert await client.name_fetch(self.UUID1) is first
 
-        get_config.req_validator[0].custom_hook = custom_hook
+                assert first is not second
+                assert len(memo) == 2
 
-        client = APIClient(host_name="api-host")
+            assert len(memo) == 1
 
-        name = await client.name_fetch()
-        assert name.first == "Harry"
-        assert name.last == "Potter"
+        assert len(memo) == 0
+        assert len(self.HEADERS) == 2
 
+    @pytest.mark.parametrize(
+        "resp, error_type",
+        [
+            (MockResponse(status=404), StatusMismatchError),
+            (
+                MockResponse(_exception=errors_api.NothingToReturnError("nope")),
+                errors_api.NothingToReturnError,
+            ),
+        ],
+    )
+    @pytest.mark.parametrize("negative_ttl, calls", [(0, 2), (60, 1)])
     @pytest.mark.asyncio
+    async def test_negative(
+        self, resp: MockResponse, error_type: type, negative_ttl: float, calls: int
+    ):
+        self.HEADERS.clear()
+
+        @test_utils.mock_aiohttp(
+            method="GET",
+            resp=resp,
+            req_validator=test_utils.RequestValidator(custom_hook=self.record_headers),
+        )
+        async def fetch_twice():
+            client_class = self.client_class(ttl=60, negative_ttl=negative_ttl)
+            async with client_class(host_name="api-host") as client:
+                for _ in range(2):
+                    with pytest.raises(error_type):
+                        await client.name_fetch(self.UUID1)
+
+        await fetch_twice()
+        assert len(self.HEADERS) == calls
+
     @test_utils.mock_aiohttp(
-        method="POST",
-        resp=MockResponse(201),
-        req_validator=RequestValidator(
-            content_type=MimeType.JSON, headers={"Content-Type": "application/json"}
+        method="GET",
+        resp=(
+            test_utils.MockResponse(
+                status=200, _json={"id": str(UUID1), "first": "Ron", "last": "Weasley"}
+            ),
+            test_utils.MockResponse(
+                status=200,
+                _json={"id": str(UUID1), "first": "Hermione", "last": "Granger"},
+            ),
         ),
     )
-    async def test_mock_req_validate_data_type_w_schema(
-        self, post_config: MockConfig = None
-    ):
-        test_name = Name("Harry", "Potter")
+    @pytest.mark.asyncio
+    async def test_stale_while_revalidate(self):
+        client_class = self.client_class(ttl=0, stale_while_revalidate=60)
+        memo: EndpointMemo = client_class.name_fetch.memo
 
-        def post_hook(validator: RequestValidator, resp: MockResponse):
-            data = NameSchema().load(validator.req_data_decoded)
-            assert data == test_name
+        async with client_class(host_name="api-host") as client:
+            first = await client.name_fetch(self.UUID1)
+            stale = await client.name_fetch(self.UUID1)
+            assert stale is first
+            assert memo.stale_hits == 1
 
-            mock_data = NameSchema().dump(test_name)
-            resp.mock_json(mock_data)
+            # Let the background refresh finish.
+            while memo._refreshing:
+                await asyncio.sleep(0)
 
-        post_config.req_validator[0].custom_hook = post_hook
+            refreshed = await client.name_fetch(self.UUID1)
+            while memo._refreshing:
+                await asyncio.sleep(0)
 
-        class APIClient(SpanClient):
-            @handles.post(
-                "/names",
-                req_schema=NameSchema(),
-                resp_codes=201,
-                resp_schema=NameSchema(),
-            )
-            async def name_fetch(self, *, req: ClientRequest) -> NameID:
-                req.media = Name("Harry", "Potter")
+        assert first.first == "Ron"
+        assert refreshed.first == "Hermione"
+        assert memo.misses == 1
 
-        client = APIClient(host_name="api-host")
+    @pytest.mark.asyncio
+    async def test_lru(self):
+        memo = EndpointMemo(ttl=60, maxsize=2)
+        fetched = list()
 
-        name = await client.name_fetch()
-        print(name)
+        def fetch(key: str):
+            async def fetch_key() -> ResponseData:
+                fetched.append(key)
+                return ResponseData(resp=None, loaded=key)
+
+            return fetch_key
+
+        for key in ("a", "b", "a", "c", "b"):
+            await memo.get(key, fetch(key))
+
+        assert fetched == ["a", "b", "c", "b"]
+        assert len(memo) == 2
 
     @pytest.mark.asyncio
+    async def test_clear_in_flight(self):
+        memo = EndpointMemo(ttl=60)
+        release = asyncio.Event()
+
+        async def fetch() -> ResponseData:
+            await release.wait()
+            return ResponseData(resp=None, loaded="stale")
+
+        in_flight = asyncio.ensure_future(memo.get("a", fetch))
+        await asyncio.sleep(0)
+
+        memo.clear()
+        release.set()
+
+        # The fetch still answers its caller, but is not stored after the clear.
+        assert (await in_flight).loaded == "stale"
+        assert len(memo) == 0
+
     @test_utils.mock_aiohttp(
         method="GET",
-        resp=MockResponse(),
-        req_validator=RequestValidator(url="http://api-host:8080/name"),
+        resp=test_utils.MockResponse(
+            status=200,
+            headers={"ETag": '"v1"'},
+            _json={"id": str(UUID1), "first": "Ron", "last": "Weasley"},
+        ),
+        req_validator=test_utils.RequestValidator(custom_hook=record_headers.__func__),
     )
-    async def test_custom_port_url(self):
+    @test_utils.mock_aiohttp(method="DELETE", resp=test_utils.MockResponse(status=204))
+    @test_utils.mock_aiohttp(method="POST", resp=test_utils.MockResponse(status=204))
+    @pytest.mark.asyncio
+    async def test_invalidate(
+        self, tmp_path, get_config=None, delete_config=None, post_config=None
+    ):
+        self.HEADERS.clear()
+
         class APIClient(SpanClient):
-            @handles.get("/name")
-            async def name_fetch(self, *, req: ClientRequest) -> None:
+            @handles.cached(ttl=60)
+            @handles.get("/names/{name_id}")
+            async def name_fetch(self, name_id: uuid.UUID, *, req: ClientRequest):
+                req.path_params["name_id"] = name_id
+
+            @handles.cached(ttl=60)
+            @handles.get("/names")
+            async def names_fetch(self, *, req: ClientRequest):
                 pass
 
-        client = APIClient(host_name="api-host", port=8080)
-        _ = await client.name_fetch()
+            @handles.delete("/names/{name_id}", resp_codes=204)
+            async def name_delete(self, name_id: uuid.UUID, *, req: ClientRequest):
+                req.path_params["name_id"] = name_id
 
-    @pytest.mark.asyncio
-    @test_utils.mock_aiohttp(
-        method="GET",
-        resp=MockResponse(),
-        req_validator=RequestValidator(url="http://api-host:8080/name"),
-    )
-    async def test_custom_default_port_url(self):
-        class APIClient(SpanClient):
-            DEFAULT_PORT = 8080
+            @handles.post("/enrol", resp_codes=204, invalidates=["/names"])
+            async def enrol(self, *, req: ClientRequest):
+                pass
 
-            @handles.get("/name")
-            async def name_fetch(self, *, req: ClientRequest) -> None:
+            @handles.get("/roll-call", coalesce=True, invalidates=["/names"])
+            async def roll_call(self, *, req: ClientRequest):
                 pass
 
-        client = APIClient(host_name="api-host")
-        _ = await client.name_fetch()
+        disk = DiskCache(str(tmp_path / "cache.sqlite"))
+        cache = ResponseCache(disk=disk)
 
-    @test_utils.mock_aiohttp(
-        method="GET",
-        resp=test_utils.MockResponse(),
-        req_validator=test_utils.RequestValidator(
-            url=f"http://api-host/endpoint",
-            params={"project.field1": "1", "project.field2": "0"},
-        ),
-    )
+        async def fetch_all():
+            await client.name_fetch(self.UUID1)
+            await client.name_fetch(self.UUID2)
+            await client.names_fetch()
+
+        async with APIClient(host_name="api-host", cache=cache) as client:
+            await fetch_all()
+            await fetch_all()
+            assert len(self.HEADERS) == 3
+            assert len(cache) == len(disk) == 3
+
+            await client.name_delete(self.UUID1)
+            assert len(cache) == len(disk) == 1
+
+            await fetch_all()
+            assert len(self.HEADERS) == 5
+
+            await client.enrol()
+            await fetch_all()
+            assert len(self.HEADERS) == 6
+
+            # Requests that go through the cache invalidate too.
+            await client.roll_call()
+            await fetch_all()
+            assert len(self.HEADERS) == 8
+
+        disk.close()
+
+    def test_cached_not_get(self):
+        with pytest.raises(TypeError):
+
+            class APIClient(SpanClient):
+                @handles.cached(ttl=60)
+                @handles.post("/names")
+                async def name_add(self, *, req: ClientRequest) -> None:
+                    pass
+
+
+class TestClientMap:
+    class APIClient(SpanClient):
+        def __init__(self):
+            super().__init__(host_name="api-host")
+            self.in_flight = 0
+            self.max_in_flight = 0
+
+        async def name_fetch(self, number: int) -> int:
+            self.in_flight += 1
+            self.max_in_flight = max(self.in_flight, self.max_in_flight)
+            try:
+                # Later calls finish first.
+                await asyncio.sleep(0.001 * (10 - number))
+                if number == 5:
+                    raise errors_api.NothingToReturnError("no name")
+                return number
+            finally:
+                self.in_flight -= 1
+
+    @pytest.mark.parametrize("ordered", [True, False])
     @pytest.mark.asyncio
-    async def test_projection(self):
-        class APIClient(SpanClient):
-            @handles.get("/endpoint")
-            async def name_fetch(self, *, req: ClientRequest):
-                req.projection["field1"] = 1
-                req.projection["field2"] = 0
+    async def test_map(self, ordered: bool):
+        async with self.APIClient() as client:
+            results = [
+                result
+                async for result in client.map(
+                    client.name_fetch,
+                    ({"number": i} for i in range(10)),
+                    concurrency=3,
+                    ordered=ordered,
+                )
+            ]
+
+        assert client.max_in_flight == 3
+        assert len(results) == 10
+
+        errors = [r for r in results if isinstance(r, BaseException)]
+        assert len(errors) == 1
+        assert isinstance(errors[0], errors_api.NothingToReturnError)
+
+        numbers = [r for r in results if not isinstance(r, BaseException)]
+        assert sorted(numbers) == [0, 1, 2, 3, 4, 6, 7, 8, 9]
+        if ordered:
+            assert results.index(errors[0]) == 5
+            assert numbers == sorted(numbers)
+        else:
+            assert numbers != sorted(numbers)
 
-        client = APIClient(host_name="api-host")
+    @pytest.mark.asyncio
+    async def test_map_backpressure(self):
+        pulled = list()
 
-        await client.name_fetch()
+        async def kwargs_iter() -> AsyncGenerator[Dict[str, int], None]:
+            for i in range(10):
+                pulled.append(i)
+                yield {"number": i}
+
+        async with self.APIClient() as client:
+            results = client.map(client.name_fetch, kwargs_iter(), concurrency=2)
+            async for _ in results:
+                assert len(pulled) <= 3
+                break
+
+            await results.aclose()
+
+        assert client.in_flight == 0
+        assert len(pulled) <= 3
 
-    @test_utils.mock_aiohttp(
-        method="GET",
-        resp=test_utils.MockResponse(),
-        req_validator=test_utils.RequestValidator(
-            url=f"http://api-host/endpoint",
-            params={"project.field1": "0", "project.field2": "1"},
-        ),
-    )
     @pytest.mark.asyncio
-    async def test_projection_from_user(self):
-        class APIClient(SpanClient):
-            @handles.get("/endpoint")
-            async def name_fetch(
-                self, projection: Dict[str, int], *, req: ClientRequest
-            ):
-                req.projection = projection
+    async def test_map_bad_concurrency(self):
+        client = self.APIClient()
 
-        client = APIClient(host_name="api-host")
+        with pytest.raises(ValueError):
+            async for _ in client.map(client.name_fetch, [], concurrency=0):
+                pass
 
-        user_projection = {"field1": 0, "field2": 1}
-        await client.name_fetch(user_projection)
+        assert client._session is None
 
     @test_utils.mock_aiohttp(
         method="GET",
-        resp=test_utils.MockResponse(),
-        req_validator=test_utils.RequestValidator(
-            url=f"http://api-host/endpoint",
-            params={"project.field1": "1", "project.field2": "0",},
+        resp=test_utils.MockResponse(
+            status=200, _json={"id": str(uuid.UUID(int=1)), "first": "H", "last": "P"}
         ),
     )
     @pytest.mark.asyncio
-    async def test_projection_validation_error(self):
+    async def test_map_endpoint(self):
         class APIClient(SpanClient):
-            @handles.get("/endpoint")
-            async def name_fetch(self, *, req: ClientRequest):
-                req.projection["field1"] = 1
+            @handles.get("/names/{name_id}", resp_schema=NameIDSchema())
+            async def name_fetch(
+                self, name_id: uuid.UUID, *, req: ClientRequest
+            ) -> NameID:
+                req.path_params["name_id"] = name_id
 
-        client = APIClient(host_name="api-host")
+        async with APIClient(host_name="api-host") as client:
+            ids = [{"name_id": uuid.UUID(int=i)} for i in range(20)]
+            names = [name async for name in client.map(client.name_fetch, ids)]
 
-        with pytest.raises(test_utils.ParamsMismatchError):
-            await client.name_fetch()
+        assert names == [NameID(uuid.UUID(int=1), "H", "P")] * 20
 
 
 class TestClientReqValidationErrors:
@@ -1756,3 +4257,102 @@ class TestClientReqValidationErrors:
 
         assert invoked_decode["set"] is True
         assert invoked_encode["set"] is True
+
+    @pytest.mark.asyncio
+    @test_utils.mock_aiohttp(
+        method="GET", resp=MockResponse(200, _json={"first": "Harry", "last": "Potter"})
+    )
+    async def test_codecs_scoped(self):
+        decoded_by = list()
+
+        def json_decoder(name: str) -> Callable[[bytes], Any]:
+            def decode(content: bytes) -> Any:
+                decoded_by.append(name)
+                return json.loads(content)
+
+            return decode
+
+        class APIClient(SpanClient):
+            @handles.get("/names/1")
+            async def name_fetch(self, *, req: ClientRequest) -> None:
+                pass
+
+        class SubClient(APIClient):
+            pass
+
+        class OtherClient(APIClient):
+            pass
+
+        register_mimetype(
+            MimeType.JSON, json.dumps, json_decoder("class"), client=SubClient
+        )
+
+        instance = SubClient(host_name="api-host")
+        register_mimetype(
+            "application/json", json.dumps, json_decoder("instance"), client=instance
+        )
+
+        for client in (
+            APIClient(host_name="api-host"),
+            OtherClient(host_name="api-host"),
+            SubClient(host_name="api-host"),
+            instance,
+        ):
+            async with client:
+                name = await client.name_fetch()
+            assert name == {"first": "Harry", "last": "Potter"}
+
+        assert decoded_by == ["class", "instance"]
+        json_default = DEFAULT_DECODERS[MimeType.JSON]
+        assert SpanClient.codecs.decoders[MimeType.JSON] is json_default
+        assert APIClient.codecs.decoders[MimeType.JSON] is json_default
+
+    @pytest.mark.asyncio
+    @test_utils.mock_aiohttp(
+        method="GET", resp=MockResponse(200, _content=b'{"first": "Harry"}')
+    )
+    async def test_decode_stats_learned(self):
+        class APIClient(SpanClient):
+            @handles.get("/names/1")
+            async def name_fetch(self, *, req: ClientRequest) -> None:
+                pass
+
+        async with APIClient(host_name="api-host") as client:
+            for _ in range(3):
+                assert await client.name_fetch() == {"first": "Harry"}
+
+        stats = APIClient.name_fetch.decode_stats
+        assert stats.mimetype is MimeType.JSON
+        assert stats.sniffed == 1
+        assert stats.learned == 2
+
+    def test_decode_stats_relearned(self):
+        stats = DecodeStats(mimetype=MimeType.BSON)
+
+        assert stats.decode(b'{"first": "Harry"}', DEFAULT_DECODERS) == {
+            "first": "Harry"
+        }
+        assert stats.mimetype is MimeType.JSON
+        assert stats.sniffed == 1
+        assert stats.learned == 0
+
+        with pytest.raises(SpanContentDecodeError):
+            stats.decode(b"\xff\x00", DEFAULT_DECODERS)
+
+    def test_decoder_content_type_cache(self):
+        class APIClient(SpanClient):
+            pass
+
+        decoders = APIClient.codecs.decoders
+        mimetype, decoder = decoders.for_content_type("application/json; charset=utf-8")
+
+        assert mimetype is MimeType.JSON
+        assert decoder is decoders[MimeType.JSON]
+        assert decoders.for_content_type("application/json; charset=utf-8") == (
+            mimetype,
+            decoder,
+        )
+        assert decoders.for_content_type("application/unknown") == (
+            "application/unknown",
+            None,
+        )